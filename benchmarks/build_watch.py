@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+"""
+moduleauthor: The Container Pipeline Service Team
+
+This module runs concurrent builds on the fake Openshift API
+(benchmarks/fake_openshift.py) and reports how long after a build is done
+Openshift.wait_for_build_status returns, and the requests it sends per
+build, when polling the build status and when watching the build. Polling
+is done every --poll-interval seconds, the service polls every 30 seconds.
+
+    PYTHONPATH=. python benchmarks/build_watch.py
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import logging
+import math
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from container_pipeline.lib import settings
+from container_pipeline.lib.openshift_api import OpenshiftAPI
+from fake_openshift import FakeOpenshift, FakeOpenshiftServer
+from openshift_api import TEMPLATE
+
+
+def wait_for_build(endpoint, project, poll_interval, latencies, cluster):
+    """Run a build and record how late its completion was noticed"""
+    openshift = OpenshiftAPI(endpoint=endpoint, user='test-admin',
+                             password='admin')
+    openshift.login()
+    openshift.create(project)
+    openshift.upload_template(project, TEMPLATE, {})
+    build_id = openshift.build(project, 'build')
+    assert openshift.wait_for_build_status(
+        project, build_id, 'Complete', retry_delay=poll_interval)
+    noticed = time.time()
+    with cluster.lock:
+        done = cluster.projects[project]['builds'][build_id]['done']
+    latencies.append(noticed - done)
+
+
+def run(args, watch):
+    settings.OPENSHIFT_WATCH_BUILDS = watch
+    settings.OPENSHIFT_SHARED_POLL = False
+    rand = random.Random(args.seed)
+    cluster = FakeOpenshift(build_duration=lambda: rand.uniform(
+        args.min_build, args.max_build))
+    server = FakeOpenshiftServer(('localhost', 0), cluster)
+    endpoint = server.start()
+    latencies = []
+    threads = [threading.Thread(target=wait_for_build, args=(
+        endpoint, 'project-{}'.format(index), args.poll_interval, latencies,
+        cluster)) for index in range(args.builds)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    server.shutdown()
+    requests = collections.Counter()
+    for (method, name), count in cluster.requests.items():
+        if name in ('get_build', 'watch_builds'):
+            requests[name] += count
+    return latencies, requests
+
+
+def p95(values):
+    values = sorted(values)
+    return values[int(math.ceil(0.95 * len(values))) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--builds', type=int, default=20)
+    parser.add_argument('--poll-interval', type=float, default=2)
+    parser.add_argument('--min-build', type=float, default=1)
+    parser.add_argument('--max-build', type=float, default=6)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    tmp_dir = tempfile.mkdtemp()
+    settings.METRICS_DIR = tmp_dir
+    settings.OPENSHIFT_TOKEN_CACHE = os.path.join(tmp_dir, 'tokens.json')
+    try:
+        print('{:<8} {:>12} {:>12} {:>14} {:>14}'.format(
+            'mode', 'mean (ms)', 'p95 (ms)', 'GETs/build', 'watches/build'))
+        for mode, watch in (('poll', False), ('watch', True)):
+            latencies, requests = run(args, watch)
+            print('{:<8} {:>12.1f} {:>12.1f} {:>14.1f} {:>14.1f}'.format(
+                mode, 1000 * sum(latencies) / len(latencies),
+                1000 * p95(latencies),
+                float(requests['get_build']) / args.builds,
+                float(requests['watch_builds']) / args.builds))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
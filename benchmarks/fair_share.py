@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+"""
+moduleauthor: The Container Pipeline Service Team
+
+This module simulates build workers going through a wave of rebuilds of one
+namespace, while other namespaces keep pushing a few builds, and reports the
+p95 time builds waited for a worker, per namespace, when start_build is
+consumed first in first out and when it goes through the fair share
+scheduler (container_pipeline.lib.scheduler).
+
+    PYTHONPATH=. python benchmarks/fair_share.py
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import heapq
+import math
+import random
+
+from container_pipeline.lib.scheduler import FairShareScheduler
+
+
+class FifoQueue(object):
+    """start_build as consumed by build workers"""
+
+    def __init__(self):
+        self.items = collections.deque()
+
+    def __len__(self):
+        return len(self.items)
+
+    def push(self, key, item, priority=0):
+        self.items.append((key, item))
+
+    def pop(self):
+        return self.items.popleft()
+
+
+def workload(args):
+    """Builds as (arrival, namespace, duration), in arrival order"""
+    rand = random.Random(args.seed)
+    builds = []
+    # e.g. the base image of the namespace changed
+    for _ in range(args.wave):
+        builds.append((rand.uniform(0, 60), 'wave',
+                       rand.uniform(args.min_build, args.max_build)))
+    for i in range(args.namespaces):
+        for _ in range(rand.randint(1, 3)):
+            builds.append((rand.uniform(0, args.duration),
+                           'ns{:02d}'.format(i),
+                           rand.uniform(args.min_build, args.max_build)))
+    return sorted(builds)
+
+
+def simulate(builds, queue, workers):
+    """Run builds on workers, return seconds waited per namespace"""
+    waits = collections.defaultdict(list)
+    # times at which the workers are free
+    free = [0.0] * workers
+    arrivals = collections.deque(builds)
+    while arrivals or queue:
+        now = free[0]
+        if not queue and arrivals[0][0] > now:
+            now = arrivals[0][0]
+        while arrivals and arrivals[0][0] <= now:
+            arrival, namespace, duration = arrivals.popleft()
+            queue.push(namespace, (arrival, duration))
+        namespace, (arrival, duration) = queue.pop()
+        waits[namespace].append(now - arrival)
+        heapq.heapreplace(free, now + duration)
+    return waits
+
+
+def p95(values):
+    values = sorted(values)
+    return values[int(math.ceil(0.95 * len(values))) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--wave', type=int, default=200,
+                        help='builds of the namespace rebuilt at once')
+    parser.add_argument('--namespaces', type=int, default=20,
+                        help='other namespaces, with 1 to 3 builds each')
+    parser.add_argument('--duration', type=int, default=3600,
+                        help='seconds over which the other builds come')
+    parser.add_argument('--min-build', type=int, default=60)
+    parser.add_argument('--max-build', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    builds = workload(args)
+    fifo = simulate(builds, FifoQueue(), args.workers)
+    fair = simulate(builds, FairShareScheduler(), args.workers)
+
+    print('p95 wait for a build worker, in seconds')
+    print('{:<10} {:>7} {:>10} {:>10}'.format(
+        'namespace', 'builds', 'fifo', 'fair'))
+    for namespace in sorted(fifo):
+        print('{:<10} {:>7} {:>10.0f} {:>10.0f}'.format(
+            namespace, len(fifo[namespace]), p95(fifo[namespace]),
+            p95(fair[namespace])))
+    others = [namespace for namespace in fifo if namespace != 'wave']
+    print('{:<10} {:>7} {:>10.0f} {:>10.0f}'.format(
+        'others', sum(len(fifo[n]) for n in others),
+        p95([w for n in others for w in fifo[n]]),
+        p95([w for n in others for w in fair[n]])))
+
+
+if __name__ == '__main__':
+    main()
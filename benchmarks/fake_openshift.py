@@ -0,0 +1,468 @@
+#!/usr/bin/env python
+
+"""
+moduleauthor: The Container Pipeline Service Team
+
+This module runs a fake of the Openshift REST API, with the endpoints the
+container pipeline service uses, to try and benchmark the Openshift API
+client (container_pipeline.lib.openshift_api) without an Openshift
+cluster. State is kept in memory, builds complete after --build-duration
+seconds, projects are gone --project-deletion seconds after they were
+deleted, and both can be watched.
+
+    PYTHONPATH=. python benchmarks/fake_openshift.py --port 8443
+"""
+
+from __future__ import print_function
+
+import argparse
+import base64
+import collections
+import hashlib
+import json
+import re
+import socket
+import ssl
+import sys
+import threading
+import time
+import urlparse
+import uuid
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+
+class FakeOpenshift(object):
+    """
+    State of the fake cluster: projects, with their objects and builds, and
+    the tokens given to users.
+    """
+
+    def __init__(self, build_duration=0.0, token_ttl=86400,
+                 failing_builds=(), project_deletion=0.0):
+        self.lock = threading.RLock()
+        # seconds, or a callable returning the seconds a new build takes
+        self.build_duration = build_duration
+        # seconds deleted projects are terminating for
+        self.project_deletion = project_deletion
+        self.token_ttl = token_ttl
+        # build configs whose builds fail
+        self.failing_builds = set(failing_builds)
+        # name -> {'buildconfigs': {}, 'imagestreams': {}, 'builds': {}},
+        # and 'deleted': the time it is gone, once deleted
+        self.projects = {}
+        # token -> expiry
+        self.tokens = {}
+        # (method, route) -> number of requests
+        self.requests = collections.Counter()
+
+    def login(self, user, password):
+        token = uuid.uuid4().hex
+        with self.lock:
+            self.tokens[token] = time.time() + self.token_ttl
+        return token
+
+    def authorized(self, token):
+        with self.lock:
+            return self.tokens.get(token, 0) > time.time()
+
+    def purge(self):
+        """Remove the projects done terminating"""
+        now = time.time()
+        with self.lock:
+            for name, objects in self.projects.items():
+                if objects.get('deleted', now) < now:
+                    del self.projects[name]
+
+    def namespace_object(self, name):
+        terminating = 'deleted' in self.projects[name]
+        return {
+            'kind': 'Namespace',
+            'apiVersion': 'v1',
+            'metadata': {'name': name,
+                         'resourceVersion': '2' if terminating else '1'},
+            'status': {'phase': 'Terminating' if terminating else 'Active'},
+        }
+
+    def new_build(self, name, config):
+        duration = self.build_duration
+        if callable(duration):
+            duration = duration()
+        return {'name': name, 'config': config, 'created': time.time(),
+                'done': time.time() + duration}
+
+    def build_status(self, build):
+        """Phase of a build, given the time it was started"""
+        if time.time() < build['done']:
+            return 'Running'
+        if build['config'] in self.failing_builds:
+            return 'Failed'
+        return 'Complete'
+
+    def build_object(self, project, build):
+        phase = self.build_status(build)
+        status = {'phase': phase}
+        if phase == 'Complete':
+            status['output'] = {'to': {'imageDigest': 'sha256:' +
+                                       hashlib.sha256(project + build[
+                                           'name']).hexdigest()}}
+        return {
+            'kind': 'Build',
+            'apiVersion': 'v1',
+            'metadata': {
+                'name': build['name'],
+                'namespace': project,
+                # the build changes once, when it is done
+                'resourceVersion': '1' if phase == 'Running' else '2',
+            },
+            'status': status,
+        }
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # write responses in one go rather than a header line at a time
+    wbufsize = -1
+
+    # (method, pattern, name of the method handling it)
+    ROUTES = (
+        ('GET', r'/oauth/authorize', 'authorize'),
+        ('GET', r'/oapi/v1/projects', 'list_projects'),
+        ('GET', r'/oapi/v1/builds', 'list_all_builds'),
+        ('GET', r'/api/v1/namespaces', 'list_namespaces'),
+        ('GET', r'/api/v1/namespaces/(?P<project>[^/]+)', 'get_namespace'),
+        ('GET', r'/oapi/v1/projects/(?P<project>[^/]+)', 'get_project'),
+        ('POST', r'/oapi/v1/projectrequests', 'create_project'),
+        ('DELETE', r'/oapi/v1/projects/(?P<project>[^/]+)', 'delete_project'),
+        ('POST', r'/oapi/v1/namespaces/(?P<project>[^/]+)/processedtemplates',
+         'process_template'),
+        ('POST', r'/oapi/v1/namespaces/(?P<project>[^/]+)/buildconfigs/'
+         r'(?P<name>[^/]+)/instantiate', 'instantiate'),
+        ('GET', r'/oapi/v1/namespaces/(?P<project>[^/]+)/builds/'
+         r'(?P<name>[^/]+)/log', 'build_log'),
+        ('GET', r'/oapi/v1/namespaces/(?P<project>[^/]+)/builds/'
+         r'(?P<name>[^/]+)', 'get_build'),
+        ('GET', r'/oapi/v1/namespaces/(?P<project>[^/]+)/builds',
+         'list_builds'),
+        ('GET', r'/oapi/v1/namespaces/(?P<project>[^/]+)/'
+         r'(?P<resource>[a-z]+)', 'list_objects'),
+        ('POST', r'/oapi/v1/namespaces/(?P<project>[^/]+)/'
+         r'(?P<resource>[a-z]+)', 'create_object'),
+        ('DELETE', r'/oapi/v1/namespaces/(?P<project>[^/]+)/'
+         r'(?P<resource>[a-z]+)/(?P<name>[^/]+)', 'delete_object'),
+        ('DELETE', r'/api/v1/namespaces/(?P<project>[^/]+)/pods/'
+         r'(?P<name>[^/]+)', 'delete_pod'),
+    )
+
+    def setup(self):
+        # as the Openshift API server, Go sets it on all its connections
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        BaseHTTPRequestHandler.setup(self)
+
+    @property
+    def cluster(self):
+        return self.server.cluster
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        url = urlparse.urlsplit(self.path)
+        length = int(self.headers.getheader('content-length') or 0)
+        body = self.rfile.read(length) if length else ''
+        self.data = json.loads(body) if body else None
+        self.query = urlparse.parse_qs(url.query)
+        for route_method, pattern, name in self.ROUTES:
+            match = re.match(pattern + '$', url.path)
+            if route_method == method and match:
+                break
+        else:
+            return self.respond(404, {'message': 'not found'})
+        if self.query.get('watch') == ['true']:
+            name = name.replace('list_', 'watch_', 1)
+        with self.cluster.lock:
+            self.cluster.requests[(method, name)] += 1
+        self.cluster.purge()
+        if name != 'authorize':
+            token = (self.headers.getheader('authorization') or '').replace(
+                'Bearer ', '', 1)
+            if not self.cluster.authorized(token):
+                return self.respond(401, {'message': 'Unauthorized'})
+        if name.startswith('watch_'):
+            # takes the lock only while it reads the cluster
+            return getattr(self, name)(**match.groupdict())
+        with self.cluster.lock:
+            getattr(self, name)(**match.groupdict())
+
+    def respond(self, status, data=None, raw=None, headers=()):
+        body = raw if raw is not None else json.dumps(data)
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain' if raw is not None
+                         else 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def project(self, project):
+        if project not in self.cluster.projects:
+            self.respond(404, {'message': 'project not found'})
+            return None
+        return self.cluster.projects[project]
+
+    def authorize(self):
+        user, _, password = base64.b64decode(
+            (self.headers.getheader('authorization') or '').replace(
+                'Basic ', '', 1)).partition(':')
+        if not user or not password:
+            return self.respond(401, {'message': 'Unauthorized'})
+        token = self.cluster.login(user, password)
+        self.respond(302, headers=[('Location', (
+            '/oauth/token/implicit#access_token={}&expires_in={}'
+            '&token_type=Bearer').format(token, self.cluster.token_ttl))])
+
+    def list_projects(self):
+        self.respond(200, {'kind': 'ProjectList', 'items': [
+            self.cluster.namespace_object(name)
+            for name in sorted(self.cluster.projects)]})
+
+    def get_project(self, project):
+        if self.project(project) is not None:
+            self.respond(200, self.cluster.namespace_object(project))
+
+    def get_namespace(self, project):
+        self.get_project(project)
+
+    def list_namespaces(self):
+        self.respond(200, {'items': [
+            self.cluster.namespace_object(name)
+            for name in sorted(self.cluster.projects)]})
+
+    def watch_namespaces(self):
+        """
+        Stream the changes of a namespace, selected by name, newer than the
+        resourceVersion asked for, until it is gone or timeoutSeconds passed
+        """
+        name = self.query.get('fieldSelector', [''])[0].replace(
+            'metadata.name=', '', 1)
+        version = self.query.get('resourceVersion', [''])[0]
+        deadline = time.time() + float(
+            self.query.get('timeoutSeconds', ['300'])[0])
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        while time.time() < deadline:
+            self.cluster.purge()
+            with self.cluster.lock:
+                objects = self.cluster.projects.get(name)
+                obj = objects and self.cluster.namespace_object(name)
+            if not obj:
+                self.send_chunk(json.dumps({
+                    'type': 'DELETED',
+                    'object': {'kind': 'Namespace',
+                               'metadata': {'name': name}}}) + '\n')
+                break
+            if obj['metadata']['resourceVersion'] > version:
+                self.send_chunk(json.dumps({
+                    'type': 'MODIFIED' if version else 'ADDED',
+                    'object': obj}) + '\n')
+                version = obj['metadata']['resourceVersion']
+            if 'deleted' in objects:
+                wake = objects['deleted']
+            else:
+                # deleting the project does not wake us up, look again
+                wake = time.time() + 0.05
+            time.sleep(max(0, min(wake, deadline) - time.time()))
+        self.send_chunk('')
+
+    def create_project(self):
+        name = self.data['metadata']['name']
+        if name in self.cluster.projects:
+            return self.respond(409, {'message': 'already exists'})
+        self.cluster.projects[name] = {
+            'buildconfigs': {}, 'imagestreams': {}, 'builds': {}}
+        self.respond(201, {'metadata': {'name': name}})
+
+    def delete_project(self, project):
+        objects = self.project(project)
+        if objects is not None:
+            objects.setdefault(
+                'deleted', time.time() + self.cluster.project_deletion)
+            self.respond(200, {'status': 'Success'})
+
+    def process_template(self, project):
+        if self.project(project) is None:
+            return
+        objects = json.dumps(self.data.get('objects') or [])
+        for parameter in self.data.get('parameters') or []:
+            objects = objects.replace('${{{}}}'.format(parameter['name']),
+                                      parameter.get('value') or '')
+        self.data['objects'] = json.loads(objects)
+        self.respond(201, self.data)
+
+    def list_all_builds(self):
+        self.respond(200, {'items': [
+            self.cluster.build_object(project, build)
+            for project, objects in self.cluster.projects.items()
+            for build in objects['builds'].values()]})
+
+    def list_builds(self, project):
+        self.list_objects(project, 'builds')
+
+    def watch_builds(self, project):
+        """
+        Stream the changes of a build, selected by name, newer than the
+        resourceVersion asked for, until it is done or timeoutSeconds passed
+        """
+        name = self.query.get('fieldSelector', [''])[0].replace(
+            'metadata.name=', '', 1)
+        version = self.query.get('resourceVersion', [''])[0]
+        deadline = time.time() + float(
+            self.query.get('timeoutSeconds', ['300'])[0])
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        while time.time() < deadline:
+            with self.cluster.lock:
+                build = self.cluster.projects.get(project, {}).get(
+                    'builds', {}).get(name)
+                obj = build and self.cluster.build_object(project, build)
+            if not obj:
+                break
+            if obj['metadata']['resourceVersion'] > version:
+                self.send_chunk(json.dumps({
+                    'type': 'MODIFIED' if version else 'ADDED',
+                    'object': obj}) + '\n')
+                version = obj['metadata']['resourceVersion']
+            if obj['status']['phase'] != 'Running':
+                break
+            time.sleep(max(0, min(build['done'], deadline) - time.time()))
+        self.send_chunk('')
+
+    def send_chunk(self, data):
+        self.wfile.write('{:x}\r\n{}\r\n'.format(len(data), data))
+        self.wfile.flush()
+
+    def list_objects(self, project, resource):
+        objects = self.project(project)
+        if objects is None:
+            return
+        if resource == 'builds':
+            items = [self.cluster.build_object(project, build)
+                     for build in objects['builds'].values()]
+        else:
+            items = objects.get(resource, {}).values()
+        self.respond(200, {'items': items})
+
+    def create_object(self, project, resource):
+        objects = self.project(project)
+        if objects is None:
+            return
+        objects.setdefault(resource, {})[
+            self.data['metadata']['name']] = self.data
+        self.respond(201, self.data)
+
+    def delete_object(self, project, resource, name):
+        objects = self.project(project)
+        if objects is None:
+            return
+        if objects.get(resource, {}).pop(name, None) is None:
+            return self.respond(404, {'message': 'not found'})
+        self.respond(200, {'status': 'Success'})
+
+    def instantiate(self, project, name):
+        objects = self.project(project)
+        if objects is None:
+            return
+        if name not in objects['buildconfigs']:
+            return self.respond(404, {'message': 'build config not found'})
+        number = 1 + sum(1 for build in objects['builds'].values()
+                         if build['config'] == name)
+        build = self.cluster.new_build('{}-{}'.format(name, number), name)
+        objects['builds'][build['name']] = build
+        self.respond(201, self.cluster.build_object(project, build))
+
+    def get_build(self, project, name):
+        objects = self.project(project)
+        if objects is None:
+            return
+        if name not in objects['builds']:
+            return self.respond(404, {'message': 'build not found'})
+        self.respond(200, self.cluster.build_object(
+            project, objects['builds'][name]))
+
+    def build_log(self, project, name):
+        objects = self.project(project)
+        if objects is None:
+            return
+        if name not in objects['builds']:
+            return self.respond(404, {'message': 'build not found'})
+        self.respond(200, raw='Logs of build {}/{}\n'.format(project, name))
+
+    def delete_pod(self, project, name):
+        if self.project(project) is not None:
+            self.respond(200, {'status': 'Success'})
+
+
+class FakeOpenshiftServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, cluster=None, certfile=None, keyfile=None):
+        HTTPServer.__init__(self, address, Handler)
+        self.cluster = cluster or FakeOpenshift()
+        self.scheme = 'http'
+        if certfile:
+            self.socket = ssl.wrap_socket(
+                self.socket, certfile=certfile, keyfile=keyfile,
+                server_side=True)
+            self.scheme = 'https'
+
+    def handle_error(self, request, client_address):
+        # clients closing kept alive connections are not errors
+        if not isinstance(sys.exc_info()[1], socket.error):
+            HTTPServer.handle_error(self, request, client_address)
+
+    @property
+    def endpoint(self):
+        return '{}://localhost:{}'.format(self.scheme, self.server_address[1])
+
+    def start(self):
+        """Serve in a thread, return the endpoint to reach the server at"""
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self.endpoint
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--certfile', help='serve over TLS with this cert')
+    parser.add_argument('--keyfile')
+    parser.add_argument('--build-duration', type=float, default=5)
+    parser.add_argument('--project-deletion', type=float, default=5)
+    args = parser.parse_args()
+
+    server = FakeOpenshiftServer(
+        ('', args.port), FakeOpenshift(
+            build_duration=args.build_duration,
+            project_deletion=args.project_deletion),
+        certfile=args.certfile, keyfile=args.keyfile)
+    print('Serving fake Openshift API on {}'.format(server.endpoint))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+"""
+moduleauthor: The Container Pipeline Service Team
+
+This module benchmarks encoding and decoding a job at every hop of a full
+pipeline run, and the size of what is put on the queue, for the dictionary
+jobs used to be and for container_pipeline.lib.job.Job. Large fields of Job
+go to a blob store in a temporary directory.
+
+    PYTHONPATH=. python benchmarks/job_codec.py
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import shutil
+import tempfile
+import timeit
+
+from container_pipeline.lib import job as job_lib
+from container_pipeline.lib import settings
+
+# keys of the dictionary jobs used to be created with
+LEGACY_KEYS = (
+    "uuid", "action", "appid", "beanstalk_server", "build_status",
+    "cause_of_build", "delivery_status", "depends_on", "desired_tag",
+    "dockerfile", "image_name", "image_under_test",
+    "jenkins_build_numberjob_name", "jobid", "last_run_timestamp",
+    "lint_status", "logs_URL", "logs_dir", "logs_file_path", "namespace",
+    "notify_email", "output_image", "project_hash_key", "project_name",
+    "repo_branch", "repo_build_path", "repo_url", "retry", "retry_delay",
+    "scan_status", "target_file", "test_tag", "msg", "delivery_log_file",
+    "build_context", "lint_retry", "priority")
+
+SCANNERS = ('pipeline-scanner', 'scanner-rpm-verify',
+            'misc-package-updates', 'container-capabilities-scanner')
+
+
+def new_job():
+    """Job as put on the queue by pipeline.py"""
+    return {
+        "uuid": "0a3f1c52-8a47-4bc5-9a0a-4e5a3f1d1c2b",
+        "action": "start_linter",
+        "appid": "centos",
+        "jobid": "httpd",
+        "desired_tag": "latest",
+        "test_tag": "ZDkxNjBlOTQ4Nj",
+        "project_name": "centos-httpd-latest",
+        "namespace": "centos-httpd-latest",
+        "job_name": "centos-httpd-latest",
+        "project_hash_key":
+            "4f8c0e4b6f7b1b8e2a0d1c5e6f7a8b9c0d1e2f3a4b5c6d7e8f9a0b1c",
+        "image_name": "centos/httpd:latest",
+        "output_image": "registry.centos.org/centos/httpd:latest",
+        "image_under_test": "registry.centos.org/centos/httpd:ZDkxNjBlOTQ4Nj",
+        "repo_url": "https://github.com/CentOS/CentOS-Dockerfiles",
+        "repo_branch": "master",
+        "repo_build_path": "httpd/centos7",
+        "target_file": "Dockerfile",
+        "build_context": "./",
+        "depends_on": "centos/centos:latest",
+        "notify_email": "someone@example.com",
+        "jenkins_build_number": "42",
+        "logs_dir": "/srv/pipeline-logs/ZDkxNjBlOTQ4Nj",
+        "priority": "interactive",
+        "dockerfile":
+            "FROM centos:centos7\n" + "RUN yum -y install httpd\n" * 40,
+    }
+
+
+def pipeline_run(job):
+    """Yield the job as it is put on the queue at every hop of a run"""
+    yield job
+    job['dockerfile'] = None
+    job['action'] = 'start_build'
+    yield job
+    job['cause_of_build'] = 'Git commit 0123456789abcdef'
+    job['build_status'] = True
+    job['action'] = 'start_test'
+    yield job
+    job['action'] = 'start_scan'
+    yield job
+    job['msg'] = dict((s, '{} results'.format(s)) for s in SCANNERS)
+    job['logs_URL'] = dict(
+        (s, 'https://registry.centos.org/pipeline-logs/ZDkxNjBlOTQ4Nj/'
+            '{}.json'.format(s)) for s in SCANNERS)
+    job['logs_file_path'] = dict(
+        (s, '/srv/pipeline-logs/ZDkxNjBlOTQ4Nj/{}.json'.format(s))
+        for s in SCANNERS)
+    job['action'] = 'start_delivery'
+    yield job
+    job['action'] = 'notify_user'
+    yield job
+    job['action'] = 'tracking'
+    yield job
+
+
+def legacy_hops():
+    job = dict.fromkeys(LEGACY_KEYS)
+    job.update(new_job())
+    for hop in pipeline_run(job):
+        yield json.dumps(hop)
+
+
+def job_hops(codec):
+    job = job_lib.Job.from_dict(new_job())
+    for hop in pipeline_run(job):
+        yield job_lib.encode(hop, codec=codec)
+
+
+def run_legacy():
+    for body in legacy_hops():
+        json.loads(body)
+
+
+def run_job(codec):
+    for body in job_hops(codec):
+        job_lib.decode(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--runs', type=int, default=2000)
+    parser.add_argument('--blob-min-size', type=int,
+                        default=settings.JOB_BLOB_MIN_SIZE,
+                        help='size from which fields go to the blob store')
+    args = parser.parse_args()
+    settings.JOB_BLOB_DIR = tempfile.mkdtemp()
+    settings.JOB_BLOB_MIN_SIZE = args.blob_min_size
+
+    cases = [('dict + json', legacy_hops, run_legacy),
+             ('Job + json', lambda: job_hops('json'),
+              lambda: run_job('json'))]
+    if job_lib.msgpack:
+        cases.append(('Job + msgpack', lambda: job_hops('msgpack'),
+                      lambda: run_job('msgpack')))
+    else:
+        print('msgpack is not installed, skipping it')
+
+    print('{:<15} {:>12} {:>14}'.format(
+        'codec', 'bytes/run', 'us/run'))
+    try:
+        for name, hops, run in cases:
+            size = sum(len(body) for body in hops())
+            seconds = min(timeit.repeat(run, number=args.runs, repeat=3))
+            print('{:<15} {:>12} {:>14.1f}'.format(
+                name, size, seconds / args.runs * 1e6))
+    finally:
+        shutil.rmtree(settings.JOB_BLOB_DIR)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+"""
+moduleauthor: The Container Pipeline Service Team
+
+This module runs the Openshift operations of a pipeline job with the REST
+API client (container_pipeline.lib.openshift_api) against the fake
+Openshift API (benchmarks/fake_openshift.py), checking their results, then
+reports the time a build status poll takes over the kept alive connection,
+over a new TLS connection every time, and the time spawning a process takes,
+which is the least an `oc` call takes before oc even loads its config.
+
+    PYTHONPATH=. python benchmarks/openshift_api.py
+"""
+
+from __future__ import print_function
+
+import argparse
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from container_pipeline.lib import settings
+from container_pipeline.lib.openshift_api import OpenshiftAPI
+from fake_openshift import FakeOpenshift, FakeOpenshiftServer
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'client', 'template.json')
+
+
+def make_cert(tmp_dir):
+    """Self signed certificate for localhost, as (certfile, keyfile)"""
+    certfile = os.path.join(tmp_dir, 'cert.pem')
+    keyfile = os.path.join(tmp_dir, 'key.pem')
+    with open(os.devnull, 'w') as devnull:
+        subprocess.check_call([
+            'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+            '-days', '1', '-subj', '/CN=localhost',
+            '-addext', 'subjectAltName=DNS:localhost',
+            '-keyout', keyfile, '-out', certfile],
+            stdout=devnull, stderr=devnull)
+    return certfile, keyfile
+
+
+def run_job(openshift, project):
+    """Openshift operations of a job, as the workers run them"""
+    openshift.login()
+    assert not openshift.get_project(project)
+    openshift.create(project)
+    assert openshift.get_project(project)
+    openshift.upload_template(project, TEMPLATE, {
+        'SOURCE_REPOSITORY_URL': 'https://github.com/example/example',
+        'TAG': 'example'})
+    for build in ('build', 'test', 'delivery'):
+        build_id = openshift.build(project, build)
+        assert build_id == build + '-1', build_id
+        assert openshift.wait_for_build_status(
+            project, build_id, 'Complete', retry_delay=0.05)
+        assert openshift.get_build_image_digest(
+            project, build_id).startswith('sha256:')
+        assert build_id in openshift.get_build_logs(project, build_id)
+        openshift.delete_pods(project, build_id)
+    openshift.clean_project(project)
+    openshift.delete(project)
+    assert not openshift.get_project(project)
+
+
+def timed(function, count):
+    """Milliseconds function takes per call"""
+    start = time.time()
+    for _ in range(count):
+        function()
+    return (time.time() - start) * 1000.0 / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--polls', type=int, default=200)
+    parser.add_argument('--no-tls', action='store_true',
+                        help='talk to the fake API over plain HTTP')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    tmp_dir = tempfile.mkdtemp()
+    settings.METRICS_DIR = tmp_dir
+    settings.OPENSHIFT_TOKEN_CACHE = os.path.join(tmp_dir, 'tokens.json')
+    try:
+        certfile = keyfile = None
+        if not args.no_tls:
+            certfile, keyfile = make_cert(tmp_dir)
+        server = FakeOpenshiftServer(
+            ('localhost', 0), FakeOpenshift(build_duration=0.2),
+            certfile=certfile, keyfile=keyfile)
+        endpoint = server.start()
+
+        openshift = OpenshiftAPI(endpoint=endpoint, user='test-admin',
+                                 password='admin', cert=certfile)
+        run_job(openshift, 'benchmark')
+        print('Job operations: {} requests over {} connection(s)'.format(
+            sum(server.cluster.requests.values()),
+            openshift.session.connects))
+
+        openshift.create('benchmark')
+        openshift.upload_template('benchmark', TEMPLATE, {})
+        build_id = openshift.build('benchmark', 'build')
+
+        def poll_new_connection():
+            # the session connects again on the next request
+            openshift.session.close()
+            openshift.get_build_status('benchmark', build_id)
+
+        kept_alive = timed(
+            lambda: openshift.get_build_status('benchmark', build_id),
+            args.polls)
+        new_connection = timed(poll_new_connection, args.polls)
+        spawn = timed(lambda: subprocess.check_call(['true']), args.polls)
+
+        print('{:<40} {:>10}'.format('per build status poll', 'ms'))
+        print('{:<40} {:>10.2f}'.format('kept alive connection', kept_alive))
+        print('{:<40} {:>10.2f}'.format(
+            'new {}connection'.format('' if args.no_tls else 'TLS '),
+            new_connection))
+        print('{:<40} {:>10.2f}'.format('process spawn (oc lower bound)',
+                                        spawn))
+        openshift.session.close()
+        server.shutdown()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
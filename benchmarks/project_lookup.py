@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+"""
+moduleauthor: The Container Pipeline Service Team
+
+This module reports, on the fake Openshift API
+(benchmarks/fake_openshift.py) with --projects projects, the time checking
+whether a project exists takes listing all the projects, as get_project
+used to, and looking the project up alone, and how long after a project is
+gone OpenshiftAPI.wait_for_project_deletion returns, where the linter used
+to check every 50 seconds.
+
+    PYTHONPATH=. python benchmarks/project_lookup.py
+"""
+
+from __future__ import print_function
+
+import argparse
+import hashlib
+import logging
+import math
+import os
+import shutil
+import tempfile
+import time
+
+from container_pipeline.lib import settings
+from container_pipeline.lib.openshift_api import OpenshiftAPI
+from fake_openshift import FakeOpenshift, FakeOpenshiftServer
+from openshift_api import timed
+
+
+def listed(openshift, project):
+    """Whether project exists, as get_project used to tell"""
+    output = openshift.request('GET', '/oapi/v1/projects')
+    return project in ' '.join(item['metadata']['name']
+                               for item in output['items'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--projects', type=int, default=2000)
+    parser.add_argument('--lookups', type=int, default=50)
+    parser.add_argument('--project-deletion', type=float, default=2)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    tmp_dir = tempfile.mkdtemp()
+    settings.METRICS_DIR = tmp_dir
+    settings.OPENSHIFT_TOKEN_CACHE = os.path.join(tmp_dir, 'tokens.json')
+    try:
+        cluster = FakeOpenshift(project_deletion=args.project_deletion)
+        # projects are named after hashes of the job names, as the
+        # linter names them
+        names = [hashlib.sha224(str(index)).hexdigest()
+                 for index in range(args.projects)]
+        for name in names:
+            cluster.projects[name] = {
+                'buildconfigs': {}, 'imagestreams': {}, 'builds': {}}
+        server = FakeOpenshiftServer(('localhost', 0), cluster)
+        endpoint = server.start()
+        openshift = OpenshiftAPI(endpoint=endpoint, user='test-admin',
+                                 password='admin')
+        openshift.login()
+
+        project = names[-1]
+        print('{:<32} {:>10}'.format('project lookup', 'ms'))
+        print('{:<32} {:>10.2f}'.format('list all projects', timed(
+            lambda: listed(openshift, project), args.lookups)))
+        print('{:<32} {:>10.2f}'.format('look the project up', timed(
+            lambda: openshift.get_project(project), args.lookups)))
+        prefix = project[:10]
+        print('{} exists: listed {}, looked up {}'.format(
+            prefix, listed(openshift, prefix),
+            openshift.get_project(prefix)))
+        existing = openshift.get_projects(names[:5] + [prefix])
+        assert existing == set(names[:5]), existing
+
+        openshift.delete(project)
+        with cluster.lock:
+            deleted = cluster.projects[project]['deleted']
+        assert openshift.wait_for_project_deletion(project, 60)
+        print('project gone after {:.1f}s, noticed {:.1f}ms after, polling '
+              'every 50s would notice it after {:.0f}s'.format(
+                  args.project_deletion, 1000 * (time.time() - deleted),
+                  50 * math.ceil(args.project_deletion / 50.0)))
+        print('requests: {}'.format(', '.join(
+            '{} {}'.format(count, name) for (method, name), count in sorted(
+                cluster.requests.items()) if 'namespace' in name)))
+        openshift.session.close()
+        server.shutdown()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
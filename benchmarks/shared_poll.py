@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+"""
+moduleauthor: The Container Pipeline Service Team
+
+This module runs concurrent builds, from threads of several worker
+processes, on the fake Openshift API (benchmarks/fake_openshift.py), and
+reports the requests sent to poll their status until they are done, and how
+long after a build is done Openshift.wait_for_build_status returns, when
+every build is polled on its own and when the list of all the builds is
+shared by the workers (container_pipeline.lib.build_status).
+
+    PYTHONPATH=. python benchmarks/shared_poll.py
+"""
+
+from __future__ import print_function
+
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from container_pipeline.lib import settings
+from container_pipeline.lib.openshift_api import OpenshiftAPI
+from build_watch import p95
+from fake_openshift import FakeOpenshift, FakeOpenshiftServer
+from openshift_api import TEMPLATE
+
+
+def wait_for_build(endpoint, project, poll_interval, noticed):
+    """Run a build and record when its completion was noticed"""
+    openshift = OpenshiftAPI(endpoint=endpoint, user='test-admin',
+                             password='admin')
+    openshift.login()
+    openshift.create(project)
+    openshift.upload_template(project, TEMPLATE, {})
+    build_id = openshift.build(project, 'build')
+    assert openshift.wait_for_build_status(
+        project, build_id, 'Complete', retry_delay=poll_interval)
+    noticed.append((project, build_id, time.time()))
+
+
+def worker(endpoint, index, args, results):
+    """A worker process, waiting for builds from --threads threads"""
+    noticed = []
+    threads = [threading.Thread(target=wait_for_build, args=(
+        endpoint, 'project-{}-{}'.format(index, thread), args.poll_interval,
+        noticed)) for thread in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put(noticed)
+
+
+def run(args, shared):
+    settings.OPENSHIFT_WATCH_BUILDS = False
+    settings.OPENSHIFT_SHARED_POLL = shared
+    settings.OPENSHIFT_POLL_INTERVAL = args.poll_interval
+    rand = random.Random(args.seed)
+    cluster = FakeOpenshift(build_duration=lambda: rand.uniform(
+        args.min_build, args.max_build))
+    server = FakeOpenshiftServer(('localhost', 0), cluster)
+    endpoint = server.start()
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(
+        endpoint, index, args, results)) for index in range(args.processes)]
+    for process in processes:
+        process.start()
+    latencies = []
+    for _ in processes:
+        for project, build_id, noticed in results.get():
+            with cluster.lock:
+                done = cluster.projects[project]['builds'][build_id]['done']
+            latencies.append(noticed - done)
+    for process in processes:
+        process.join()
+    server.shutdown()
+    polls = sum(count for (method, name), count in cluster.requests.items()
+                if name in ('get_build', 'list_all_builds'))
+    return latencies, polls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=10)
+    parser.add_argument('--poll-interval', type=float, default=1)
+    parser.add_argument('--min-build', type=float, default=2)
+    parser.add_argument('--max-build', type=float, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    tmp_dir = tempfile.mkdtemp()
+    settings.METRICS_DIR = tmp_dir
+    settings.OPENSHIFT_TOKEN_CACHE = os.path.join(tmp_dir, 'tokens.json')
+    settings.BUILD_STATUS_FILE = os.path.join(tmp_dir, 'builds.json')
+    builds = args.processes * args.threads
+    try:
+        print('{:<8} {:>12} {:>12} {:>10} {:>12}'.format(
+            'mode', 'mean (ms)', 'p95 (ms)', 'polls', 'polls/build'))
+        for mode, shared in (('poll', False), ('shared', True)):
+            latencies, polls = run(args, shared)
+            assert len(latencies) == builds
+            print('{:<8} {:>12.1f} {:>12.1f} {:>10} {:>12.2f}'.format(
+                mode, 1000 * sum(latencies) / len(latencies),
+                1000 * p95(latencies), polls, float(polls) / builds))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+"""
+moduleauthor: The Container Pipeline Service Team
+
+This module runs the login and a request of every job of several worker
+processes on the fake Openshift API (benchmarks/fake_openshift.py), with
+and without the token cache shared by the workers of the host
+(container_pipeline.lib.openshift.TokenCache), revoking all the tokens
+halfway, and reports the logins sent to the OAuth server and the time a
+login takes.
+
+    PYTHONPATH=. python benchmarks/token_cache.py
+"""
+
+from __future__ import print_function
+
+import argparse
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from container_pipeline.lib import settings
+from container_pipeline.lib.openshift import TokenCache
+from container_pipeline.lib.openshift_api import OpenshiftAPI
+from fake_openshift import FakeOpenshift, FakeOpenshiftServer
+
+
+def worker(endpoint, jobs, results):
+    """A worker process, logging in for every job"""
+    openshift = OpenshiftAPI(endpoint=endpoint, user='test-admin',
+                             password='admin')
+    elapsed = 0
+    for _ in range(jobs):
+        start = time.time()
+        openshift.login()
+        elapsed += time.time() - start
+        assert not openshift.get_project('benchmark')
+    openshift.session.close()
+    results.put(elapsed)
+
+
+def run_workers(endpoint, args):
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(
+        endpoint, args.jobs, results)) for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    elapsed = sum(results.get() for _ in processes)
+    for process in processes:
+        process.join()
+    return elapsed
+
+
+def run(args, cache):
+    get = TokenCache.get
+    if not cache:
+        # login every time, as the workers used to
+        TokenCache.get = lambda self, endpoint, user: None
+    try:
+        if os.path.exists(settings.OPENSHIFT_TOKEN_CACHE):
+            os.remove(settings.OPENSHIFT_TOKEN_CACHE)
+        cluster = FakeOpenshift()
+        server = FakeOpenshiftServer(('localhost', 0), cluster)
+        endpoint = server.start()
+        elapsed = run_workers(endpoint, args)
+        with cluster.lock:
+            cluster.tokens.clear()
+        elapsed += run_workers(endpoint, args)
+        server.shutdown()
+    finally:
+        TokenCache.get = get
+    logins = cluster.requests[('GET', 'authorize')]
+    return logins, elapsed * 1000.0 / (2 * args.processes * args.jobs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--jobs', type=int, default=50)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    tmp_dir = tempfile.mkdtemp()
+    settings.METRICS_DIR = tmp_dir
+    settings.OPENSHIFT_TOKEN_CACHE = os.path.join(tmp_dir, 'tokens.json')
+    try:
+        print('{:<10} {:>8} {:>10} {:>14}'.format(
+            'mode', 'jobs', 'logins', 'login (ms)'))
+        for mode, cache in (('no cache', False), ('cache', True)):
+            logins, login_time = run(args, cache)
+            print('{:<10} {:>8} {:>10} {:>14.2f}'.format(
+                mode, 2 * args.processes * args.jobs, logins, login_time))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
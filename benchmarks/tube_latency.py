@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+"""
+moduleauthor: The Container Pipeline Service Team
+
+This module benchmarks how long a job takes to cross the pipeline tubes
+(lint -> build -> test -> scan -> delivery). A no-op consumer is run for
+every hop, so the numbers only show queueing latency. Jobs are either moved
+between tubes by a dispatcher, as with master_tube, or put straight on the
+next tube.
+
+It needs a beanstalkd to talk to, e.g.
+
+    beanstalkd -l 127.0.0.1 -p 11300 &
+    PYTHONPATH=. python benchmarks/tube_latency.py --mode poll
+    PYTHONPATH=. python benchmarks/tube_latency.py --mode reserve
+    PYTHONPATH=. python benchmarks/tube_latency.py --route direct
+"""
+
+import argparse
+import json
+import logging
+import threading
+import time
+import uuid
+
+from container_pipeline.lib.queue import JobQueue
+
+HOPS = ('start_linter', 'start_build', 'start_test', 'start_scan',
+        'start_delivery')
+
+
+def poll_get(queue, poll_delay):
+    """Old JobQueue.get behaviour: check tube stats, sleep when empty"""
+    while True:
+        if queue._conn.stats_tube(queue.sub)['current-jobs-ready'] > 0:
+            return queue._conn.reserve()
+        time.sleep(poll_delay)
+
+
+def get(queue, args):
+    """Reserve a job the way asked for on the command line"""
+    if args.mode == 'poll':
+        return poll_get(queue, args.poll_delay)
+    return queue.get()
+
+
+def send(queue, args, prefix, job, tube):
+    """Put job to a tube, through the dispatcher when asked to"""
+    job['last_put'] = time.time()
+    if args.route == 'dispatcher':
+        job['action'] = tube
+        queue.put(json.dumps(job), prefix + 'master_tube')
+    else:
+        queue.put(json.dumps(job), prefix + tube)
+
+
+def dispatch(args, prefix):
+    """Move jobs from master tube to the tube for their action"""
+    queue = JobQueue(args.host, args.port, sub=prefix + 'master_tube',
+                     logger=logging.getLogger('benchmark'))
+    for _ in range(args.jobs * len(HOPS)):
+        job_obj = get(queue, args)
+        job = json.loads(job_obj.body)
+        queue.put(json.dumps(job), prefix + job['action'])
+        queue.delete(job_obj)
+
+
+def hop(args, prefix, index, results):
+    """Consume jobs from one tube and relay them to the next one"""
+    sub = prefix + HOPS[index]
+    queue = JobQueue(args.host, args.port, sub=sub,
+                     logger=logging.getLogger('benchmark'))
+    for _ in range(args.jobs):
+        job_obj = get(queue, args)
+        job = json.loads(job_obj.body)
+        now = time.time()
+        job['hops'].append(now - job['last_put'])
+        if index + 1 < len(HOPS):
+            send(queue, args, prefix, job, HOPS[index + 1])
+        else:
+            job['total'] = now - job['created']
+            results.append(job)
+        queue.delete(job_obj)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11300)
+    parser.add_argument('--mode', choices=('poll', 'reserve'),
+                        default='reserve')
+    parser.add_argument('--route', choices=('dispatcher', 'direct'),
+                        default='dispatcher')
+    parser.add_argument('--jobs', type=int, default=20)
+    parser.add_argument('--interval', type=float, default=0.5,
+                        help='seconds between two submitted jobs')
+    parser.add_argument('--poll-delay', type=float, default=30,
+                        help='sleep of the poll mode when a tube is empty')
+    args = parser.parse_args()
+
+    # use private tubes so that running workers are not disturbed
+    prefix = 'bench-{}-'.format(uuid.uuid4().hex[:8])
+    results = []
+    threads = [threading.Thread(target=hop, args=(args, prefix, i, results))
+               for i in range(len(HOPS))]
+    if args.route == 'dispatcher':
+        threads.append(threading.Thread(target=dispatch, args=(args, prefix)))
+    for t in threads:
+        t.daemon = True
+        t.start()
+
+    producer = JobQueue(args.host, args.port, sub=prefix + HOPS[0],
+                        logger=logging.getLogger('benchmark'))
+    for _ in range(args.jobs):
+        send(producer, args, prefix,
+             {'created': time.time(), 'hops': []}, HOPS[0])
+        time.sleep(args.interval)
+    for t in threads:
+        t.join()
+
+    totals = sorted(r['total'] for r in results)
+    hops = sorted(h for r in results for h in r['hops'])
+    print('mode={} route={} jobs={} hops/job={}'.format(
+        args.mode, args.route, len(results), len(HOPS)))
+    print('per transition: mean {:.3f}s  max {:.3f}s'.format(
+        sum(hops) / len(hops), hops[-1]))
+    print('end to end    : mean {:.3f}s  p50 {:.3f}s  max {:.3f}s'.format(
+        sum(totals) / len(totals), totals[len(totals) // 2], totals[-1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""
+In-memory fake of the beanstalkd commands the pipeline puts, reserves and
+handles jobs and reads stats with, over a real socket, for the tests of
+container_pipeline.lib.queue and of the workers
+"""
+import SocketServer
+import threading
+import time
+
+
+class FakeBeanstalkdHandler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        using = 'default'
+        watching = set(['default'])
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.split()
+            name, args = command[0], command[1:]
+            if name == 'quit':
+                return
+            elif name == 'use':
+                using = args[0]
+                self.reply('USING {}'.format(using))
+            elif name == 'watch':
+                watching.add(args[0])
+                self.reply('WATCHING {}'.format(len(watching)))
+            elif name == 'ignore':
+                watching.discard(args[0])
+                self.reply('WATCHING {}'.format(len(watching)))
+            elif name == 'put':
+                body = self.rfile.read(int(args[3]))
+                self.rfile.read(2)
+                if self.server.drop():
+                    return
+                self.reply(self.server.put(using, body, *map(int, args[:3])))
+            elif name == 'reserve-with-timeout':
+                jid = self.server.reserve(watching, int(args[0]))
+                if jid is None:
+                    self.reply('TIMED_OUT')
+                else:
+                    body = self.server.jobs[jid]['body']
+                    self.reply('RESERVED {} {}\r\n{}'.format(
+                        jid, len(body), body))
+            elif name in ('delete', 'bury', 'release', 'touch', 'kick-job'):
+                self.reply(self.server.update(name, int(args[0]), *map(
+                    int, args[1:])))
+            elif name == 'stats-job':
+                job = self.server.jobs.get(int(args[0]))
+                if job is None:
+                    self.reply('NOT_FOUND')
+                else:
+                    self.reply_yaml(
+                        'id: {}\ntube: {}\nstate: {}\npri: {}\n'
+                        'reserves: {}\n'.format(
+                            args[0], job['tube'], job['state'],
+                            job['priority'], job['reserves']))
+            elif name == 'stats-tube':
+                jobs = [job for job in self.server.jobs.values()
+                        if job['tube'] == args[0]]
+                if not jobs:
+                    self.reply('NOT_FOUND')
+                else:
+                    self.reply_yaml(''.join(
+                        'current-jobs-{}: {}\n'.format(state, sum(
+                            job['state'] == state for job in jobs))
+                        for state in ('ready', 'reserved', 'delayed',
+                                      'buried')))
+            else:
+                self.reply('UNKNOWN_COMMAND')
+
+    def reply(self, line):
+        self.wfile.write(line + '\r\n')
+
+    def reply_yaml(self, body):
+        self.reply('OK {}\r\n{}'.format(len(body), body))
+
+
+class FakeBeanstalkd(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    """
+    Fake beanstalkd server, jobs larger than max_job_size are refused with
+    JOB_TOO_BIG as beanstalkd refuses them. The connection putting the job
+    numbered drop_at (from 1) is closed before the job is put, once.
+    Delayed jobs are not made ready when their delay passed, only when they
+    are kicked.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, max_job_size=65535):
+        SocketServer.TCPServer.__init__(
+            self, ('localhost', 0), FakeBeanstalkdHandler)
+        self.max_job_size = max_job_size
+        self.lock = threading.Lock()
+        # id -> {'tube', 'body', 'priority', 'delay', 'ttr', 'state',
+        #        'reserves'}
+        self.jobs = {}
+        self.last_id = 0
+        self.drop_at = None
+        self.puts = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def drop(self):
+        with self.lock:
+            self.puts += 1
+            if self.puts == self.drop_at:
+                self.drop_at = None
+                return True
+            return False
+
+    def put(self, tube, body, priority, delay, ttr):
+        if len(body) > self.max_job_size:
+            return 'JOB_TOO_BIG'
+        with self.lock:
+            self.last_id += 1
+            self.jobs[self.last_id] = {
+                'tube': tube, 'body': body, 'priority': priority,
+                'delay': delay, 'ttr': ttr,
+                'state': 'delayed' if delay else 'ready', 'reserves': 0}
+            return 'INSERTED {}'.format(self.last_id)
+
+    def reserve(self, tubes, timeout):
+        """Reserve the ready job of tubes to go first, None on timeout"""
+        deadline = time.time() + timeout
+        while True:
+            with self.lock:
+                ready = [(job['priority'], jid)
+                         for jid, job in self.jobs.items()
+                         if job['state'] == 'ready' and job['tube'] in tubes]
+                if ready:
+                    jid = min(ready)[1]
+                    self.jobs[jid]['state'] = 'reserved'
+                    self.jobs[jid]['reserves'] += 1
+                    return jid
+            if time.time() >= deadline:
+                return None
+            time.sleep(0.01)
+
+    def update(self, command, jid, *args):
+        """Run command on job jid, return the reply"""
+        with self.lock:
+            job = self.jobs.get(jid)
+            if job is None:
+                return 'NOT_FOUND'
+            if command == 'kick-job':
+                if job['state'] not in ('delayed', 'buried'):
+                    return 'NOT_FOUND'
+                job['state'] = 'ready'
+                return 'KICKED'
+            if job['state'] != 'reserved':
+                return 'NOT_FOUND'
+            if command == 'delete':
+                del self.jobs[jid]
+                return 'DELETED'
+            if command == 'bury':
+                job['state'] = 'buried'
+                return 'BURIED'
+            if command == 'release':
+                job['priority'], job['delay'] = args
+                job['state'] = 'delayed' if job['delay'] else 'ready'
+                return 'RELEASED'
+            return 'TOUCHED'
+
+    def bodies(self, tube):
+        with self.lock:
+            return [job['body'] for _, job in sorted(self.jobs.items())
+                    if job['tube'] == tube]
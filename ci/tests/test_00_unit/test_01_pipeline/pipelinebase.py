@@ -0,0 +1,80 @@
+import shutil
+import tempfile
+
+from ci.tests.base import BaseTestCase
+from container_pipeline.lib import settings
+
+
+class PipelineBase(BaseTestCase):
+    """
+    Base test case for the modules of the pipeline. The settings pointing
+    at shared directories are pointed at a temporary directory of the test,
+    and set back after it, as are the settings set with set_settings() and
+    the attributes replaced with patch().
+    """
+
+    def setUp(self):
+        super(PipelineBase, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self._settings = {}
+        self._patched = []
+        self.set_settings(
+            METRICS_DIR=self.tmp_dir,
+            JOB_BLOB_DIR=self.tmp_dir + '/blobs',
+            OPENSHIFT_TOKEN_CACHE=self.tmp_dir + '/tokens.json',
+            BUILD_STATUS_FILE=self.tmp_dir + '/builds.json')
+
+    def tearDown(self):
+        for name, value in self._settings.items():
+            setattr(settings, name, value)
+        for obj, name, value in reversed(self._patched):
+            setattr(obj, name, value)
+        shutil.rmtree(self.tmp_dir)
+        super(PipelineBase, self).tearDown()
+
+    def set_settings(self, **values):
+        for name, value in values.items():
+            self._settings.setdefault(name, getattr(settings, name))
+            setattr(settings, name, value)
+
+    def patch(self, obj, name, value):
+        """Replace attribute name of obj with value, for the test"""
+        self._patched.append((obj, name, getattr(obj, name)))
+        setattr(obj, name, value)
+
+
+_test_database = None
+
+
+class DatabaseBase(PipelineBase):
+    """
+    Base test case for the code using the models of the pipeline. The test
+    database, an in-memory sqlite one, is created for the first of these
+    tests, and each test runs in a transaction rolled back after it.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super(DatabaseBase, cls).setUpClass()
+        global _test_database
+        if _test_database is None:
+            from container_pipeline.lib import dj  # noqa
+            from django.conf import settings as django_settings
+            from django.db import connection
+            # the tables are created from the models, the app has no
+            # migrations
+            django_settings.MIGRATION_MODULES = {'container_pipeline': None}
+            _test_database = connection.creation.create_test_db(
+                verbosity=0, serialize=False)
+
+    def setUp(self):
+        super(DatabaseBase, self).setUp()
+        from django.db import transaction
+        self._atomic = transaction.atomic()
+        self._atomic.__enter__()
+
+    def tearDown(self):
+        from django.db import transaction
+        transaction.set_rollback(True)
+        self._atomic.__exit__(None, None, None)
+        super(DatabaseBase, self).tearDown()
@@ -0,0 +1,90 @@
+import json
+import unittest
+
+from ci.tests.test_00_unit.test_01_pipeline.pipelinebase import PipelineBase
+from container_pipeline.lib import blobs
+from container_pipeline.lib.job import Job, SCHEMA_VERSION, decode, \
+    encode, msgpack
+
+
+class JobTests(PipelineBase):
+
+    def setUp(self):
+        super(JobTests, self).setUp()
+        self.set_settings(JOB_BLOB_MIN_SIZE=1024)
+        self.job = Job(action='start_build', namespace='centos-centos-latest',
+                       depends_on=['centos/base:latest'], attempts=0,
+                       custom_field={'key': 'value'})
+
+    def test_00_fields_behave_like_a_dictionary(self):
+        self.assertEqual(self.job['action'], 'start_build')
+        self.assertEqual(self.job.get('custom_field'), {'key': 'value'})
+        self.assertEqual(self.job.get('notify_email', 'default'), 'default')
+        self.assertIn('action', self.job)
+        self.assertNotIn('notify_email', self.job)
+        self.assertRaises(KeyError, lambda: self.job['unknown'])
+        self.assertEqual(set(self.job.keys()), set(
+            ['action', 'namespace', 'depends_on', 'attempts',
+             'custom_field']))
+
+    def test_01_encoded_job_decodes_to_the_same_fields(self):
+        decoded = decode(encode(self.job))
+        self.assertIsInstance(decoded, Job)
+        self.assertEqual(decoded.to_dict(), self.job.to_dict())
+
+    def test_02_encoding_leaves_unset_fields_out(self):
+        data = json.loads(encode(self.job))
+        self.assertNotIn('notify_email', data)
+        self.assertEqual(data['_v'], SCHEMA_VERSION)
+
+    def test_03_plain_dictionaries_are_encoded_as_jobs(self):
+        decoded = decode(encode({'action': 'notify_user', 'msg': None}))
+        self.assertEqual(decoded.to_dict(), {'action': 'notify_user',
+                                             'msg': None})
+
+    def test_04_fields_set_to_none_stay_set(self):
+        self.job['notify_email'] = None
+        self.job['other_field'] = None
+        for job in (self.job, decode(encode(self.job))):
+            self.assertIn('notify_email', job)
+            self.assertIn('other_field', job)
+            self.assertIsNone(job.get('notify_email', 'default'))
+            self.assertIsNone(job.get('other_field', 'default'))
+        self.assertIsNone(self.job.pop('notify_email', 'default'))
+        self.assertNotIn('notify_email', self.job)
+        self.assertEqual(self.job.pop('notify_email', 'default'), 'default')
+        self.assertIsNone(self.job['notify_email'])
+
+    def test_05_large_fields_go_to_the_blob_store(self):
+        self.job['dockerfile'] = 'RUN true\n' * 200
+        body = encode(self.job)
+        self.assertLess(len(body), 1024)
+        digest = json.loads(body)['_blobs']['dockerfile']
+        self.assertEqual(blobs.load(digest), self.job['dockerfile'])
+
+        decoded = decode(body)
+        # not loaded until read, and put back on as the same reference
+        self.assertEqual(json.loads(encode(decoded))['_blobs'],
+                         {'dockerfile': digest})
+        self.assertEqual(decoded['dockerfile'], self.job['dockerfile'])
+
+    def test_06_small_fields_stay_in_the_job(self):
+        self.job['dockerfile'] = 'FROM centos\n'
+        data = json.loads(encode(self.job))
+        self.assertEqual(data['dockerfile'], 'FROM centos\n')
+        self.assertNotIn('_blobs', data)
+
+    def test_07_checkpoints_resume_at_the_first_phase_not_completed(self):
+        self.assertEqual(self.job.resume_action(), 'start_linter')
+        self.job.checkpoint('dockerlint')
+        self.job.checkpoint('build', image='registry/image:test')
+        decoded = decode(encode(self.job))
+        self.assertEqual(decoded.resume_action(), 'start_test')
+        self.assertEqual(decoded['checkpoints']['build'],
+                         {'image': 'registry/image:test'})
+
+    @unittest.skipUnless(msgpack, 'msgpack is not installed')
+    def test_08_msgpack_encoded_job_decodes_to_the_same_fields(self):
+        body = encode(self.job, codec='msgpack')
+        self.assertNotEqual(body[:1], '{')
+        self.assertEqual(decode(body).to_dict(), self.job.to_dict())
@@ -0,0 +1,47 @@
+import os
+import time
+
+from ci.tests.test_00_unit.test_01_pipeline.pipelinebase import PipelineBase
+from container_pipeline.lib import blobs, settings
+
+
+class BlobsTests(PipelineBase):
+
+    def test_00_stored_value_loads_back(self):
+        value = {'logs': ['line'] * 100}
+        digest = blobs.store(value)
+        self.assertEqual(blobs.load(digest), value)
+        self.assertEqual(blobs.BlobRef(digest).load(), value)
+
+    def test_01_values_are_stored_under_their_digest(self):
+        digest = blobs.store(u'caf\xe9')
+        self.assertEqual(digest, blobs.store(u'caf\xe9'))
+        self.assertNotEqual(digest, blobs.store(u'cafe'))
+        self.assertTrue(os.path.exists(blobs.path(digest)))
+        self.assertEqual(os.listdir(os.path.dirname(blobs.path(digest))),
+                         [digest[2:]])
+
+    def test_02_small_values_are_not_stored(self):
+        self.assertIsNone(blobs.store('small', min_size=1024))
+        self.assertFalse(os.path.exists(settings.JOB_BLOB_DIR))
+
+    def test_03_missing_blob_fails_clearly(self):
+        digest = blobs.store('removed')
+        os.remove(blobs.path(digest))
+        with self.assertRaises(blobs.BlobNotFound) as context:
+            blobs.BlobRef(digest).load()
+        self.assertIn(digest, str(context.exception))
+
+    def test_04_collect_removes_the_blobs_not_stored_for_a_while(self):
+        old = blobs.store('old')
+        stored_again = blobs.store('stored again')
+        fresh = blobs.store('fresh')
+        long_ago = time.time() - 3600
+        for digest in (old, stored_again):
+            os.utime(blobs.path(digest), (long_ago, long_ago))
+        self.assertEqual(blobs.store('stored again'), stored_again)
+
+        self.assertEqual(blobs.collect(max_age=60), 1)
+        self.assertFalse(os.path.exists(blobs.path(old)))
+        self.assertEqual(blobs.load(stored_again), 'stored again')
+        self.assertEqual(blobs.load(fresh), 'fresh')
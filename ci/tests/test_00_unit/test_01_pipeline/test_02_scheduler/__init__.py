@@ -0,0 +1,59 @@
+from ci.tests.base import BaseTestCase
+from container_pipeline.lib.scheduler import FairShareScheduler
+
+
+def pop_all(scheduler):
+    popped = []
+    while len(scheduler):
+        popped.append(scheduler.pop())
+    return popped
+
+
+class FairShareSchedulerTests(BaseTestCase):
+
+    def test_00_empty_scheduler_pops_none(self):
+        scheduler = FairShareScheduler()
+        self.assertEqual(len(scheduler), 0)
+        self.assertIsNone(scheduler.pop())
+
+    def test_01_keys_take_turns(self):
+        scheduler = FairShareScheduler()
+        for index in range(3):
+            scheduler.push('busy', 'busy-{}'.format(index))
+        scheduler.push('other', 'other-0')
+        self.assertEqual(len(scheduler), 4)
+        self.assertEqual(pop_all(scheduler), [
+            ('busy', 'busy-0'), ('other', 'other-0'),
+            ('busy', 'busy-1'), ('busy', 'busy-2')])
+
+    def test_02_items_of_a_key_keep_their_order(self):
+        scheduler = FairShareScheduler()
+        for index in range(5):
+            scheduler.push('key', index)
+        self.assertEqual([item for _, item in pop_all(scheduler)],
+                         range(5))
+
+    def test_03_keys_pop_up_to_their_weight_in_a_turn(self):
+        scheduler = FairShareScheduler(weights={'heavy': 2})
+        for index in range(4):
+            scheduler.push('heavy', index)
+            scheduler.push('light', index)
+        self.assertEqual([key for key, _ in pop_all(scheduler)], [
+            'heavy', 'heavy', 'light', 'heavy', 'heavy', 'light', 'light',
+            'light'])
+
+    def test_04_urgent_priorities_go_first(self):
+        scheduler = FairShareScheduler()
+        scheduler.push('weekly', 'scan', priority=3000)
+        scheduler.push('user', 'build', priority=1000)
+        scheduler.push('weekly', 'build', priority=1000)
+        self.assertEqual(pop_all(scheduler), [
+            ('user', 'build'), ('weekly', 'build'), ('weekly', 'scan')])
+
+    def test_05_items_lists_all_the_waiting_items(self):
+        scheduler = FairShareScheduler()
+        scheduler.push('a', 1)
+        scheduler.push('b', 2, priority=10)
+        scheduler.push('a', 3)
+        scheduler.pop()
+        self.assertEqual(sorted(scheduler.items()), [2, 3])
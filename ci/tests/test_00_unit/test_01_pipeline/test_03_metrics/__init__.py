@@ -0,0 +1,93 @@
+import json
+
+from ci.tests.base import BaseTestCase
+from container_pipeline.lib import metrics
+
+
+class RegistryTests(BaseTestCase):
+
+    def setUp(self):
+        super(RegistryTests, self).setUp()
+        self.registry = metrics.Registry()
+
+    def test_00_counters_add_up_by_labels(self):
+        self.registry.inc('pipeline_jobs_total', worker='build')
+        self.registry.inc('pipeline_jobs_total', 2, worker='build')
+        self.registry.inc('pipeline_jobs_total', worker='test')
+        self.assertEqual(self.registry.counters, {
+            ('pipeline_jobs_total', (('worker', 'build'),)): 3,
+            ('pipeline_jobs_total', (('worker', 'test'),)): 1})
+
+    def test_01_histograms_count_values_in_their_bucket(self):
+        self.registry.observe('pipeline_job_duration_seconds', 0.2)
+        self.registry.observe('pipeline_job_duration_seconds', 7200)
+        histogram = self.registry.histograms[
+            ('pipeline_job_duration_seconds', ())]
+        self.assertEqual(histogram[metrics.BUCKETS.index(0.5)], 1)
+        self.assertEqual(histogram[metrics.BUCKETS.index(float('inf'))], 1)
+        self.assertEqual(sum(histogram[:-1]), 2)
+        self.assertEqual(histogram[-1], 7200.2)
+
+    def test_02_dumped_registries_load_summed(self):
+        self.registry.inc('pipeline_jobs_total', worker='build')
+        self.registry.observe('pipeline_job_duration_seconds', 1)
+        other = metrics.Registry()
+        other.inc('pipeline_jobs_total', worker='build')
+        data = json.loads(json.dumps(self.registry.dump()))
+        other.load(data)
+        other.load(data)
+        self.assertEqual(other.counters, {
+            ('pipeline_jobs_total', (('worker', 'build'),)): 3})
+        self.assertEqual(other.histograms[
+            ('pipeline_job_duration_seconds', ())][-1], 2)
+
+    def test_03_gauges_of_stale_dumps_are_left_out(self):
+        self.registry.set('pipeline_autoscaler_workers_running', 2,
+                          tube='start_build')
+        self.registry.set('pipeline_autoscaler_workers_running', 3,
+                          tube='start_build')
+        other = metrics.Registry()
+        data = json.loads(json.dumps(self.registry.dump()))
+        other.load(data)
+        other.load(data, gauges=False)
+        self.assertEqual(other.gauges, {
+            ('pipeline_autoscaler_workers_running',
+             (('tube', 'start_build'),)): 3})
+        self.assertIn('pipeline_autoscaler_workers_running{tube="start_build"}'
+                      ' 3', other.render().splitlines())
+
+    def test_04_render_in_prometheus_text_format(self):
+        self.registry.inc('pipeline_jobs_total', worker='build',
+                          outcome='success')
+        self.registry.observe('pipeline_job_duration_seconds', 0.3,
+                              worker='build')
+        output = self.registry.render(gauges=[
+            ('pipeline_tube_jobs', {'tube': 'start_build', 'state': 'ready'},
+             4)])
+        lines = output.splitlines()
+        self.assertIn('# TYPE pipeline_jobs_total counter', lines)
+        self.assertIn('pipeline_jobs_total{outcome="success",worker="build"}'
+                      ' 1', lines)
+        self.assertIn('pipeline_job_duration_seconds_bucket{worker="build",'
+                      'le="0.1"} 0', lines)
+        self.assertIn('pipeline_job_duration_seconds_bucket{worker="build",'
+                      'le="0.5"} 1', lines)
+        self.assertIn('pipeline_job_duration_seconds_bucket{worker="build",'
+                      'le="+Inf"} 1', lines)
+        self.assertIn('pipeline_job_duration_seconds_count{worker="build"} 1',
+                      lines)
+        self.assertIn('# TYPE pipeline_tube_jobs gauge', lines)
+        self.assertIn('pipeline_tube_jobs{state="ready",tube="start_build"} 4',
+                      lines)
+
+    def test_05_label_values_are_escaped(self):
+        self.registry.inc('pipeline_jobs_total', worker='say "hi"\\')
+        self.assertIn(r'pipeline_jobs_total{worker="say \"hi\"\\"} 1',
+                      self.registry.render())
+
+    def test_06_build_gauges_count_builds_by_phase(self):
+        self.assertEqual(metrics.build_gauges({
+            'p/build-1': 'Complete', 'p/build-2': 'Running',
+            'q/build-1': 'Complete'}), [
+            ('pipeline_builds', {'phase': 'Complete'}, 2),
+            ('pipeline_builds', {'phase': 'Running'}, 1)])
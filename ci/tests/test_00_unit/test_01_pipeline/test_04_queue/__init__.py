@@ -0,0 +1,108 @@
+import time
+
+from ci.tests.test_00_unit.test_01_pipeline.fake_beanstalkd import \
+    FakeBeanstalkd
+from ci.tests.test_00_unit.test_01_pipeline.pipelinebase import PipelineBase
+from container_pipeline.lib.job import Job, decode
+from container_pipeline.lib.queue import JobQueue, QueueException
+from container_pipeline.vendors import beanstalkc
+
+
+class PutManyTests(PipelineBase):
+
+    def setUp(self):
+        super(PutManyTests, self).setUp()
+        self.server = FakeBeanstalkd(max_job_size=100).start()
+        self.queue = JobQueue('localhost', self.server.port, sub=None,
+                              pub='start_build')
+
+    def tearDown(self):
+        self.queue._conn.close()
+        self.server.stop()
+        super(PutManyTests, self).tearDown()
+
+    def test_00_jobs_are_put_in_order(self):
+        bodies = ['job-{}'.format(index) for index in range(250)]
+        jids = self.queue.put_many(bodies, batch_size=100)
+        self.assertEqual(jids, range(1, 251))
+        self.assertEqual(self.server.bodies('start_build'), bodies)
+
+    def test_01_jobs_get_the_delay_priority_and_ttr_asked_for(self):
+        self.set_settings(BEANSTALKD_TUBE_TTR={'start_scan': 600})
+        jid, = self.queue.put_many(['job'], tube='start_scan', delay=1.5,
+                                   priority=1000)
+        job = self.server.jobs[jid]
+        self.assertEqual((job['tube'], job['delay'], job['priority'],
+                          job['ttr']), ('start_scan', 2, 1000, 600))
+
+    def test_02_refused_job_raises_once_the_others_are_put(self):
+        self.assertRaises(QueueException, self.queue.put_many,
+                          ['first', 'x' * 200, 'last'])
+        self.assertEqual(self.server.bodies('start_build'),
+                         ['first', 'last'])
+        # all the replies were read, the connection is still usable
+        self.assertEqual(self.queue.put('next'), 3)
+
+    def test_03_put_and_put_many_share_the_connection(self):
+        self.queue.put_many(['first'], tube='start_test')
+        self.queue.put('second', tube='start_build')
+        self.queue.put_many(['third'], tube='start_test')
+        self.assertEqual(self.server.bodies('start_test'),
+                         ['first', 'third'])
+        self.assertEqual(self.server.bodies('start_build'), ['second'])
+
+    def test_04_broken_connection_puts_the_batch_again(self):
+        self.server.drop_at = 15
+        bodies = ['job-{}'.format(index) for index in range(30)]
+        jids = self.queue.put_many(bodies, batch_size=10)
+        self.assertEqual(len(jids), 30)
+        # the jobs of the first batch are not put twice
+        self.assertEqual(self.server.bodies('start_build'),
+                         bodies[:14] + bodies[10:])
+
+
+class PutJobTests(PipelineBase):
+
+    def setUp(self):
+        super(PutJobTests, self).setUp()
+        self.server = FakeBeanstalkd().start()
+        self.queue = JobQueue('localhost', self.server.port, sub=None)
+
+    def tearDown(self):
+        self.queue._conn.close()
+        self.server.stop()
+        super(PutJobTests, self).tearDown()
+
+    def test_00_job_is_stamped_with_the_time_it_is_ready(self):
+        job = Job(action='start_build')
+        start = time.time()
+        self.queue.put_job(job, delay=30, tube='start_test')
+        stamped, = [decode(body) for body in
+                    self.server.bodies('start_test')]
+        self.assertGreaterEqual(stamped['enqueued_at'], start + 30)
+        self.assertLessEqual(stamped['enqueued_at'], time.time() + 30)
+
+
+class BoundedQueueTests(PipelineBase):
+
+    def setUp(self):
+        super(BoundedQueueTests, self).setUp()
+        self.server = FakeBeanstalkd().start()
+        self.server.put('start_build', 'job', 0, 0, 60)
+
+    def tearDown(self):
+        self.server.stop()
+        super(BoundedQueueTests, self).tearDown()
+
+    def test_00_gives_up_while_beanstalkd_is_down_and_connects_again(self):
+        down = FakeBeanstalkd()
+        port = down.port
+        down.server_close()
+        # creating the queue does not connect yet
+        queue = JobQueue('localhost', port, sub=None, max_attempts=1)
+        self.assertRaises(beanstalkc.SocketError, queue.stats_tube,
+                          'start_build')
+        self.assertIsNone(queue._conn)
+        queue.port = self.server.port
+        self.assertEqual(
+            queue.stats_tube('start_build')['current-jobs-ready'], 1)
@@ -0,0 +1,95 @@
+import fcntl
+import logging
+import multiprocessing
+import time
+
+from ci.tests.test_00_unit.test_01_pipeline.pipelinebase import PipelineBase
+from container_pipeline.lib.build_status import BuildStatusPoller
+
+
+class FakeOpenshift(object):
+    """Lists the phases given, one list per call, the last one after"""
+
+    def __init__(self, *lists):
+        self.lists = list(lists)
+        self.calls = 0
+        self.logger = logging.getLogger('console')
+
+    def list_builds(self):
+        self.calls += 1
+        if len(self.lists) > 1:
+            return self.lists.pop(0)
+        return self.lists[0]
+
+
+class BuildStatusPollerTests(PipelineBase):
+
+    def test_00_builds_are_listed_once_per_interval(self):
+        openshift = FakeOpenshift({'p/build-1': 'Running'})
+        poller = BuildStatusPoller(interval=0.2)
+        self.assertEqual(poller.snapshot(openshift), {'p/build-1': 'Running'})
+        self.assertEqual(poller.snapshot(openshift), {'p/build-1': 'Running'})
+        self.assertEqual(openshift.calls, 1)
+
+        time.sleep(0.2)
+        poller.snapshot(openshift)
+        self.assertEqual(openshift.calls, 2)
+
+    def test_01_other_processes_read_the_last_list(self):
+        openshift = FakeOpenshift({'p/build-1': 'Complete'})
+        BuildStatusPoller(interval=60).snapshot(openshift)
+        other = BuildStatusPoller(interval=60)
+        self.assertEqual(other.snapshot(openshift),
+                         {'p/build-1': 'Complete'})
+        self.assertEqual(openshift.calls, 1)
+
+    def test_02_failed_list_gives_none(self):
+        openshift = FakeOpenshift(None)
+        poller = BuildStatusPoller(interval=60)
+        self.assertIsNone(poller.snapshot(openshift))
+        self.assertIsNone(poller.wait(openshift, 'p', 'build-1'))
+
+    def test_03_wait_returns_the_phase_the_build_ended_in(self):
+        openshift = FakeOpenshift(
+            {}, {'p/build-1': 'New'}, {'p/build-1': 'Running'},
+            {'p/build-1': 'Failed'})
+        poller = BuildStatusPoller(interval=0.01)
+        self.assertEqual(poller.wait(openshift, 'p', 'build-1'), 'Failed')
+        self.assertEqual(openshift.calls, 4)
+
+    def test_04_wait_gives_up_on_a_missing_build(self):
+        openshift = FakeOpenshift({'p/build-2': 'Running'})
+        poller = BuildStatusPoller(interval=0.01)
+        self.assertIsNone(poller.wait(openshift, 'p', 'build-1',
+                                      empty_retries=3))
+        self.assertEqual(openshift.calls, 4)
+
+    def test_05_wait_does_not_spin_on_a_stale_list(self):
+        poller = BuildStatusPoller(interval=5)
+        poller.builds, poller.updated = {'p/build-1': 'Running'}, 1
+        snapshot = poller.snapshot
+        calls = []
+
+        def counted(openshift):
+            calls.append(time.time())
+            return snapshot(openshift)
+        poller.snapshot = counted
+
+        # another process is listing the builds for a second
+        locked = multiprocessing.Event()
+        process = multiprocessing.Process(target=hold_lock, args=(
+            poller.status_file + '.lock', locked, 1))
+        process.start()
+        locked.wait()
+        openshift = FakeOpenshift({'p/build-1': 'Complete'})
+        self.assertEqual(poller.wait(openshift, 'p', 'build-1'), 'Complete')
+        process.join()
+        self.assertLessEqual(len(calls), 4)
+        self.assertEqual(openshift.calls, 1)
+
+
+def hold_lock(path, locked, seconds):
+    with open(path, 'a') as lock:
+        fcntl.lockf(lock, fcntl.LOCK_EX)
+        locked.set()
+        time.sleep(seconds)
@@ -0,0 +1,166 @@
+import threading
+import time
+
+from benchmarks.fake_openshift import FakeOpenshift, FakeOpenshiftServer
+from benchmarks.openshift_api import TEMPLATE
+from ci.tests.test_00_unit.test_01_pipeline.pipelinebase import PipelineBase
+from container_pipeline.lib.openshift import OpenshiftError
+from container_pipeline.lib.openshift_api import APIError, OpenshiftAPI
+
+
+class OpenshiftAPITests(PipelineBase):
+    """OpenshiftAPI against the fake Openshift API of the benchmarks"""
+
+    def setUp(self):
+        super(OpenshiftAPITests, self).setUp()
+        # no credentials to fall back to, the fake refuses empty ones
+        self.set_settings(OPENSHIFT_WATCH_TIMEOUT=5, OPENSHIFT_USER='',
+                          OPENSHIFT_PASSWORD='')
+        self.cluster = FakeOpenshift(build_duration=0.2,
+                                     failing_builds=['test'])
+        self.server = FakeOpenshiftServer(('localhost', 0), self.cluster)
+        self.endpoint = self.server.start()
+        self.openshift = self.client()
+        self.openshift.login()
+
+    def tearDown(self):
+        self.openshift.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+        super(OpenshiftAPITests, self).tearDown()
+
+    def client(self, user='test-admin', password='admin'):
+        return OpenshiftAPI(endpoint=self.endpoint, user=user,
+                            password=password)
+
+    def requests(self, name):
+        with self.cluster.lock:
+            return sum(count for (_, route), count in
+                       self.cluster.requests.items() if route == name)
+
+    def revoke_tokens(self):
+        with self.cluster.lock:
+            self.cluster.tokens.clear()
+
+    def create_project(self, project='project'):
+        self.openshift.create(project)
+        self.openshift.upload_template(project, TEMPLATE, {
+            'SOURCE_REPOSITORY_URL': 'https://github.com/example/example',
+            'TAG': 'example'})
+
+    def test_00_login_gets_a_token_shared_by_the_clients(self):
+        self.assertTrue(self.cluster.authorized(self.openshift.token))
+        other = self.client()
+        other.login()
+        self.assertEqual(other.token, self.openshift.token)
+        self.assertEqual(self.requests('authorize'), 1)
+
+    def test_01_login_with_wrong_credentials_fails(self):
+        self.assertRaises(OpenshiftError, self.client(
+            user='nobody', password='').login)
+
+    def test_02_refused_token_logs_in_again(self):
+        self.revoke_tokens()
+        self.assertFalse(self.openshift.get_project('project'))
+        self.assertEqual(self.requests('authorize'), 2)
+        self.assertTrue(self.cluster.authorized(self.openshift.token))
+        self.assertEqual(self.requests('get_project'), 2)
+
+    def test_03_request_fails_when_login_again_does(self):
+        self.revoke_tokens()
+        self.openshift.login_password = self.openshift.password = ''
+        with self.assertRaises(APIError) as context:
+            self.openshift.request('GET', '/oapi/v1/projects')
+        self.assertEqual(context.exception.status, 401)
+
+    def test_04_upload_template_creates_its_objects(self):
+        self.create_project()
+        with self.cluster.lock:
+            objects = self.cluster.projects['project']
+            self.assertEqual(sorted(objects['buildconfigs']),
+                             ['build', 'delivery', 'test'])
+            self.assertEqual(sorted(objects['imagestreams']), ['example'])
+            build = objects['buildconfigs']['build']
+            self.assertEqual(build['spec']['source']['git']['uri'],
+                             'https://github.com/example/example')
+
+    def test_05_upload_template_to_missing_project_fails(self):
+        self.assertRaises(OpenshiftError, self.openshift.upload_template,
+                          'missing', TEMPLATE, {})
+
+    def test_06_build_runs_a_build_of_the_config(self):
+        self.create_project()
+        self.assertEqual(self.openshift.build('project', 'build'), 'build-1')
+        self.assertEqual(self.openshift.build('project', 'build'), 'build-2')
+        self.assertRaises(OpenshiftError, self.openshift.build, 'project',
+                          'missing')
+
+    def test_07_watch_build_returns_the_phase_it_ended_in(self):
+        self.create_project()
+        build_id = self.openshift.build('project', 'build')
+        self.assertEqual(self.openshift.watch_build('project', build_id),
+                         'Complete')
+        failing_id = self.openshift.build('project', 'test')
+        self.assertEqual(self.openshift.watch_build('project', failing_id),
+                         'Failed')
+        self.assertEqual(self.requests('watch_builds'), 2)
+        self.assertEqual(self.requests('get_build'), 2)
+
+    def test_08_watch_build_of_missing_build_gives_none(self):
+        self.create_project()
+        self.assertIsNone(self.openshift.watch_build('project', 'build-9'))
+
+    def test_09_wait_for_project_deletion_watches_the_namespace(self):
+        self.cluster.project_deletion = 0.3
+        self.create_project()
+        self.openshift.delete('project')
+        start = time.time()
+        self.assertTrue(self.openshift.wait_for_project_deletion(
+            'project', 10))
+        self.assertLess(time.time() - start, 2)
+        self.assertFalse(self.openshift.get_project('project'))
+        self.assertEqual(self.requests('watch_namespaces'), 1)
+
+    def test_10_wait_for_project_deletion_times_out(self):
+        self.cluster.project_deletion = 10
+        self.create_project()
+        self.openshift.delete('project')
+        self.assertFalse(self.openshift.wait_for_project_deletion(
+            'project', 0.5, retry_delay=0.1))
+
+    def test_11_missing_project_is_deleted_already(self):
+        self.assertTrue(self.openshift.wait_for_project_deletion(
+            'missing', 10))
+        self.assertEqual(self.requests('watch_namespaces'), 0)
+
+    def test_12_watches_use_the_token_of_a_login_again(self):
+        self.cluster.project_deletion = 0.3
+        self.create_project()
+        build_id = self.openshift.build('project', 'build')
+        self.revoke_tokens()
+        self.assertEqual(self.openshift.watch_build('project', build_id),
+                         'Complete')
+        self.openshift.delete('project')
+        self.revoke_tokens()
+        self.assertTrue(self.openshift.wait_for_project_deletion(
+            'project', 10))
+        self.assertEqual(self.requests('watch_builds'), 1)
+        self.assertEqual(self.requests('watch_namespaces'), 1)
+
+    def test_13_threads_use_sessions_of_their_own(self):
+        sessions = []
+        thread = threading.Thread(
+            target=lambda: sessions.append(self.openshift.session))
+        thread.start()
+        thread.join()
+        self.assertIsNot(sessions[0], self.openshift.session)
+        self.assertIs(self.client().session, self.openshift.session)
+
+    def test_14_get_projects_lists_the_projects_once(self):
+        self.create_project()
+        self.create_project('other')
+        self.assertEqual(
+            self.openshift.get_projects(['project', 'missing', 'other']),
+            {'project', 'other'})
+        self.assertEqual(self.requests('list_projects'), 1)
+        self.assertEqual(self.requests('get_project'), 0)
@@ -0,0 +1,144 @@
+import os
+import stat
+import subprocess
+import threading
+
+from ci.tests.test_00_unit.test_01_pipeline.pipelinebase import PipelineBase
+from container_pipeline.lib.openshift import (
+    Openshift, OpenshiftError, TokenCache)
+
+# Fake oc: login with password admin writes a new token to the --config
+# file and adds it to the tokens in $FAKE_OC_DIR/tokens, other commands are
+# refused unless their config has one of those. Projects project and other
+# exist. Commands are logged to $FAKE_OC_DIR/commands.
+FAKE_OC = r'''#!/bin/sh
+echo "$@" >> "$FAKE_OC_DIR/commands"
+config=$(echo "$@" | sed -n 's/.*--config \([^ ]*\).*/\1/p')
+case "$1" in
+login)
+    [ "$5" = "-p" ] && [ "$6" = "admin" ] || exit 1
+    token=token-$(wc -l < "$FAKE_OC_DIR/commands")
+    echo "$token" >> "$FAKE_OC_DIR/tokens"
+    echo "$token" > "$config"
+    echo "Login successful."
+    ;;
+whoami)
+    cat "$config"
+    ;;
+*)
+    if ! grep -qx "$(cat "$config" 2>/dev/null)" "$FAKE_OC_DIR/tokens"; then
+        echo "error: You must be logged in to the server (Unauthorized)" >&2
+        exit 1
+    fi
+    if [ "$2" = "projects" ]; then
+        printf 'project/project\nproject/other\n'
+        exit 0
+    fi
+    [ "$2" = "project/missing" ] && { echo "not found" >&2; exit 1; }
+    echo "project/$(echo "$2" | cut -d/ -f2)"
+    ;;
+esac
+'''
+
+
+class OpenshiftOcTests(PipelineBase):
+    """Openshift, the oc backend, running a fake oc"""
+
+    def setUp(self):
+        super(OpenshiftOcTests, self).setUp()
+        oc = os.path.join(self.tmp_dir, 'oc')
+        with open(oc, 'w') as f:
+            f.write(FAKE_OC)
+        os.chmod(oc, stat.S_IRWXU)
+        open(os.path.join(self.tmp_dir, 'tokens'), 'w').close()
+        self.environ = dict(os.environ)
+        os.environ['PATH'] = self.tmp_dir + os.pathsep + os.environ['PATH']
+        os.environ['FAKE_OC_DIR'] = self.tmp_dir
+        self.openshift = self.client()
+        self.openshift.login()
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        super(OpenshiftOcTests, self).tearDown()
+
+    def client(self, password='admin'):
+        return Openshift(endpoint='https://openshift:8443',
+                         user='test-admin', password=password,
+                         config=os.path.join(self.tmp_dir, 'node.kubeconfig'),
+                         cert='ca.crt')
+
+    def commands(self, name):
+        with open(os.path.join(self.tmp_dir, 'commands')) as f:
+            return [line for line in f if line.startswith(name + ' ')]
+
+    def revoke_tokens(self):
+        open(os.path.join(self.tmp_dir, 'tokens'), 'w').close()
+
+    def test_00_login_is_shared_by_the_clients(self):
+        other = self.client()
+        other.login()
+        self.assertEqual(other.token, self.openshift.token)
+        self.assertEqual(len(self.commands('login')), 1)
+        self.assertTrue(other.get_project('project'))
+
+    def test_01_token_is_not_on_the_command_line(self):
+        self.openshift.get_project('project')
+        with open(os.path.join(self.tmp_dir, 'commands')) as f:
+            self.assertNotIn(self.openshift.token, f.read())
+
+    def test_02_refused_token_logs_in_again(self):
+        self.revoke_tokens()
+        self.assertTrue(self.openshift.get_project('project'))
+        self.assertEqual(len(self.commands('login')), 2)
+        self.assertEqual(len(self.commands('get')), 2)
+
+    def test_03_other_errors_do_not_login_again(self):
+        self.assertFalse(self.openshift.get_project('missing'))
+        self.assertEqual(len(self.commands('login')), 1)
+        self.assertEqual(len(self.commands('get')), 1)
+
+    def test_04_command_fails_when_login_again_does(self):
+        self.revoke_tokens()
+        self.openshift.login_password = 'wrong'
+        with self.assertRaises(subprocess.CalledProcessError) as context:
+            self.openshift.run_oc('oc get project/project {}'.format(
+                self.openshift.oc_cmd_suffix))
+        self.assertIn('Unauthorized', context.exception.output)
+
+    def test_05_login_error_does_not_show_the_password(self):
+        with self.assertRaises(OpenshiftError) as context:
+            Openshift(endpoint='https://other:8443', user='test-admin',
+                      password='secret', config=os.path.join(
+                          self.tmp_dir, 'other.kubeconfig'),
+                      cert='ca.crt').login()
+        self.assertNotIn('secret', str(context.exception))
+
+    def test_06_get_projects_lists_the_projects_once(self):
+        self.assertEqual(
+            self.openshift.get_projects(['project', 'missing', 'other']),
+            {'project', 'other'})
+        self.assertEqual(len(self.commands('get')), 1)
+
+
+class TokenCacheTests(PipelineBase):
+    """TokenCache, the tokens shared by the workers"""
+
+    def test_00_threads_do_not_lose_the_tokens_of_each_other(self):
+        cache = TokenCache(os.path.join(self.tmp_dir, 'tokens.json'))
+        users = ['user-{}'.format(index) for index in range(8)]
+
+        def put(user):
+            for index in range(20):
+                cache.put('https://openshift:8443', user,
+                          '{}-{}'.format(user, index), 86400)
+
+        threads = [threading.Thread(target=put, args=(user,))
+                   for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(
+            [cache.get('https://openshift:8443', user) for user in users],
+            ['{}-19'.format(user) for user in users])
@@ -0,0 +1,78 @@
+from ci.tests.test_00_unit.test_01_pipeline.pipelinebase import \
+    DatabaseBase, PipelineBase
+from container_pipeline.utils import BuildTracker, DatabaseLeases, \
+    FileLeases
+
+
+class FakeQueue(object):
+    """Queue telling the state of the jobs it was given, by id"""
+
+    def __init__(self, states):
+        self.states = states
+
+    def stats_job(self, jid):
+        state = self.states.get(jid)
+        return {'state': state} if state else None
+
+
+class LeasesTests(object):
+    """Tests of a lease backend, self.leases"""
+
+    def test_00_lease_is_held_until_released(self):
+        self.leases.acquire('a', 60)
+        self.assertTrue(self.leases.is_held('a', 60))
+        self.assertEqual(self.leases.held(['a', 'b'], 60), set(['a']))
+        self.assertTrue(self.leases.renew('a', 60))
+        self.assertEqual(self.leases.release('a'), [])
+        self.assertFalse(self.leases.is_held('a', 60))
+        self.assertFalse(self.leases.renew('a', 60))
+
+    def test_01_release_returns_the_waiters(self):
+        self.leases.acquire('a', 60)
+        self.leases.add_waiter('a', 5)
+        self.leases.add_waiter('a', 6)
+        self.assertEqual(self.leases.release('a'), [5, 6])
+        self.assertEqual(self.leases.release('a'), [])
+
+    def test_02_jobs_are_recorded_for_leases_taken(self):
+        self.leases.acquire('a', 60)
+        self.assertTrue(self.leases.set_job('a', 7))
+        self.assertFalse(self.leases.set_job('b', 8))
+        self.assertEqual(self.leases.jobs(['a', 'b']), {'a': 7})
+
+    def test_03_expired_builds_run_while_their_job_is_queued(self):
+        self.set_settings(BUILD_LOCK_TTL=0)
+        for name in ('a', 'b', 'c'):
+            self.leases.acquire(name, 0)
+        self.leases.set_job('a', 1)
+        self.leases.set_job('b', 2)
+        queue = FakeQueue({1: 'ready', 2: 'buried'})
+        # names can be looked through only once, as the garbage collector
+        # passes them
+        self.assertEqual(BuildTracker.running_set(
+            (name for name in ('a', 'b', 'c')), leases=self.leases,
+            queue=queue), set(['a']))
+
+    def test_04_tracker_runs_from_start_to_complete(self):
+        tracker = BuildTracker('a', leases=self.leases,
+                               queue=FakeQueue({}))
+        self.assertFalse(tracker.is_running())
+        tracker.start()
+        self.assertTrue(tracker.is_running())
+        tracker.add_waiter(3)
+        self.assertEqual(tracker.complete(), [3])
+        self.assertFalse(tracker.is_running())
+
+
+class FileLeasesTests(LeasesTests, PipelineBase):
+
+    def setUp(self):
+        super(FileLeasesTests, self).setUp()
+        self.leases = FileLeases(self.tmp_dir)
+
+
+class DatabaseLeasesTests(LeasesTests, DatabaseBase):
+
+    def setUp(self):
+        super(DatabaseLeasesTests, self).setUp()
+        self.leases = DatabaseLeases()
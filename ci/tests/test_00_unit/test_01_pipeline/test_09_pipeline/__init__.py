@@ -0,0 +1,101 @@
+import datetime
+
+from ci.tests.test_00_unit.test_01_pipeline.pipelinebase import DatabaseBase
+from django.utils import timezone
+
+
+class IntakeBase(DatabaseBase):
+    """
+    Base test case for the intake of the builds triggered by Jenkins,
+    pipeline.main(), with the cause of the builds and their lint faked
+    """
+
+    def setUp(self):
+        super(IntakeBase, self).setUp()
+        from container_pipeline import models, pipeline
+        self.models = models
+        self.pipeline = pipeline
+        self.causes = {}
+        self.linted = []
+        self.patch(pipeline, 'get_cause_of_build',
+                   lambda master, job_name, number: self.causes[number])
+        self.patch(pipeline, 'trigger_dockerfile_linter', self.linted.append)
+
+    def trigger(self, number, cause='Git commit 0123456789abcdef',
+                target_file='Dockerfile'):
+        self.causes[number] = cause
+        self.pipeline.main([
+            'centos', 'httpd', 'https://github.com/example/example',
+            'master', '/httpd', target_file, 'someone@example.com',
+            'latest', '', 'tag{}'.format(number), number, './'])
+
+    def queue_lint(self, job):
+        """Queue the lint of the build of job, as the linter trigger does"""
+        self.linted.append(job)
+        build = self.models.Build.objects.get(uuid=job['uuid'])
+        build.status = 'processing'
+        build.save()
+        self.models.BuildPhase.objects.create(
+            build=build, phase='dockerlint', status='queued')
+
+
+class PipelineTests(IntakeBase):
+    """Intake of the builds triggered by Jenkins, pipeline.main()"""
+
+    def test_00_priority_class_is_decided_at_intake(self):
+        self.trigger('1', 'Git commit 0123456789abcdef')
+        self.trigger('2', 'RPM update in enabled repos')
+        self.trigger('3', 'Change in upstream project centos-base-latest')
+        self.assertEqual([job['priority'] for job in self.linted],
+                         ['interactive', 'rebuild', 'rebuild'])
+        self.assertEqual(self.linted[1]['cause_of_build'],
+                         'RPM update in enabled repos')
+
+
+class CoalesceTests(IntakeBase):
+    """Triggers merged into a build of the project not linted yet"""
+
+    def setUp(self):
+        super(CoalesceTests, self).setUp()
+        self.set_settings(BUILD_COALESCE_WINDOW=3600)
+        self.patch(self.pipeline, 'trigger_dockerfile_linter',
+                   self.queue_lint)
+
+    def builds(self):
+        return list(self.models.Build.objects.order_by('id').values_list(
+            'coalesced_triggers', flat=True))
+
+    def test_00_triggers_are_merged_until_the_lint_starts(self):
+        self.trigger('1')
+        self.trigger('2')
+        self.trigger('3')
+        self.assertEqual(self.builds(), ['2\n3'])
+        self.assertEqual(len(self.linted), 1)
+        self.models.BuildPhase.objects.update(status='processing')
+        self.trigger('4')
+        self.assertEqual(self.builds(), ['2\n3', None])
+        self.assertEqual(len(self.linted), 2)
+
+    def test_01_builds_of_another_dockerfile_are_not_merged(self):
+        self.trigger('1')
+        self.trigger('2', target_file='Dockerfile.other')
+        self.assertEqual(self.builds(), [None, None])
+
+    def test_02_builds_older_than_the_window_are_not_merged(self):
+        self.trigger('1')
+        self.models.Build.objects.update(
+            created=timezone.now() - datetime.timedelta(seconds=3601))
+        self.trigger('2')
+        self.assertEqual(self.builds(), [None, None])
+
+    def test_03_weekly_scans_are_not_merged_into(self):
+        self.trigger('1')
+        self.models.Build.objects.update(weekly_scan=True)
+        self.trigger('2')
+        self.assertEqual(self.builds(), [None, None])
+
+    def test_04_no_window_merges_nothing(self):
+        self.set_settings(BUILD_COALESCE_WINDOW=0)
+        self.trigger('1')
+        self.trigger('2')
+        self.assertEqual(self.builds(), [None, None])
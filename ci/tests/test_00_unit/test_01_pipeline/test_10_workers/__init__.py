@@ -0,0 +1,322 @@
+import json
+import os
+import signal
+import threading
+import time
+
+from ci.tests.test_00_unit.test_01_pipeline.fake_beanstalkd import \
+    FakeBeanstalkd
+from ci.tests.test_00_unit.test_01_pipeline.pipelinebase import DatabaseBase
+from container_pipeline.lib import dj  # noqa
+from container_pipeline.lib.job import Job, decode, encode
+from container_pipeline.models import Build, BuildPhase, PhaseTiming, \
+    Project
+from container_pipeline.utils import BuildTracker
+from container_pipeline.workers import build
+from container_pipeline.workers.base import BaseWorker
+
+
+class FailingWorker(BaseWorker):
+    """Worker failing every job, after changing it, and stopping"""
+    NAME = 'Failing worker'
+
+    def handle_job(self, job):
+        job['image_name'] = 'changed'
+        job['msg'] = 'failed'
+        self.stopping.set()
+        raise Exception('failed')
+
+
+class BuildWorker(BaseWorker):
+    """Worker of the build phase, recording the jobs it handles"""
+    NAME = 'Build worker'
+
+    def __init__(self, *args, **kwargs):
+        super(BuildWorker, self).__init__(*args, **kwargs)
+        self.build_phase_name = 'build'
+        self.handled = []
+
+    def handle_job(self, job):
+        self.handled.append(job)
+        self.stopping.set()
+
+
+class TimedWorker(BuildWorker):
+    """Build worker timing a step of its jobs"""
+
+    def handle_job(self, job):
+        self.job = job
+        self.setup_data()
+        with self.span('start_build'):
+            time.sleep(0.1)
+        super(TimedWorker, self).handle_job(job)
+
+
+class StoppedWorker(BaseWorker):
+    """Worker getting SIGTERM while it handles its jobs"""
+    NAME = 'Stopped worker'
+    handled = []
+
+    def handle_job(self, job):
+        self.handled.append(job['uuid'])
+        os.kill(os.getpid(), signal.SIGTERM)
+        # the job being handled is done, however long it takes
+        threading.Event().wait(0.5)
+
+
+class WorkerBase(DatabaseBase):
+    """
+    Base test case for the workers, getting jobs of a fake beanstalkd, and
+    keeping builds in the test database
+    """
+
+    def setUp(self):
+        super(WorkerBase, self).setUp()
+        self.server = FakeBeanstalkd().start()
+        self.set_settings(BEANSTALKD_HOST='localhost',
+                          BEANSTALKD_PORT=self.server.port,
+                          WORKER_DRAIN_CHECK_INTERVAL=1)
+
+    def tearDown(self):
+        self.server.stop()
+        super(WorkerBase, self).tearDown()
+
+    def put(self, tube='test', **fields):
+        """Put a job with fields to tube, return its id"""
+        fields.setdefault('logs_dir', self.tmp_dir)
+        reply = self.server.put(tube, encode(fields), 1024, 0, 60)
+        return int(reply.split()[1])
+
+    def create_worker(self, cls, sub='test'):
+        """Worker cls of tube sub, its connection closed after the test"""
+        worker = cls(sub=sub)
+        self.addCleanup(worker.queue._conn.close)
+        return worker
+
+    def create_build(self, uuid='uuid', **phases):
+        """
+        Create build uuid, with BuildPhase rows of the given statuses. The
+        phases complete are checkpointed, with no artifacts.
+        """
+        project, _ = Project.objects.get_or_create(name='centos-httpd-latest')
+        build = Build.objects.create(uuid=uuid, project=project,
+                                     status='processing')
+        for phase, status in phases.items():
+            BuildPhase.objects.create(
+                build=build, phase=phase, status=status,
+                artifacts='{}' if status == 'complete' else None)
+        return build
+
+    def jobs(self, tube='test'):
+        """Jobs of tube, with their state"""
+        with self.server.lock:
+            return [(decode(job['body']), job['state'])
+                    for _, job in sorted(self.server.jobs.items())
+                    if job['tube'] == tube]
+
+
+class RetryTests(WorkerBase):
+    """BaseWorker, retrying the jobs failed"""
+
+    def test_00_failed_job_is_put_again_as_it_was_reserved(self):
+        self.set_settings(JOB_MAX_ATTEMPTS=3, JOB_RETRY_DELAY=60)
+        self.put(image_name='image', attempts=1)
+        self.create_worker(FailingWorker).work()
+        (job, state), = self.jobs()
+        self.assertEqual(state, 'delayed')
+        self.assertEqual(job['attempts'], 2)
+        self.assertEqual(job['image_name'], 'image')
+        self.assertIsNone(job['msg'])
+        with self.server.lock:
+            delay, = [entry['delay'] for entry in self.server.jobs.values()]
+        self.assertEqual(delay, 120)
+
+    def test_01_job_failed_max_attempts_times_is_buried(self):
+        self.set_settings(JOB_MAX_ATTEMPTS=3)
+        self.put(image_name='image', attempts=2)
+        self.create_worker(FailingWorker).work()
+        (job, state), = self.jobs()
+        self.assertEqual(state, 'buried')
+        self.assertEqual(job['attempts'], 2)
+
+
+class CheckpointTests(WorkerBase):
+    """BaseWorker, passing on the jobs of phases completed already"""
+
+    def setUp(self):
+        super(CheckpointTests, self).setUp()
+        self.worker = self.create_worker(BuildWorker)
+
+    def reserve(self, **fields):
+        self.put(**fields)
+        job_obj = self.worker.queue.get(timeout=1)
+        return decode(job_obj.body), job_obj
+
+    def test_00_job_checkpointed_resumes_at_the_next_phase(self):
+        job, job_obj = self.reserve(uuid='uuid', checkpoints={
+            'dockerlint': {}, 'build': {'image': 'registry/image:test'}})
+        self.assertTrue(self.worker.skip_checkpointed(job, job_obj))
+        (put, state), = self.jobs('start_test')
+        self.assertEqual(put['action'], 'start_test')
+        self.assertEqual(put['checkpoints']['build'],
+                         {'image': 'registry/image:test'})
+
+    def test_01_job_retried_gets_the_checkpoints_of_its_build(self):
+        build = self.create_build(dockerlint='complete', test='queued')
+        BuildPhase.objects.create(build=build, phase='build',
+                                  status='complete', artifacts=json.dumps(
+                                      {'image': 'registry/image:test'}))
+        job, job_obj = self.reserve(uuid='uuid', attempts=1)
+        self.assertTrue(self.worker.skip_checkpointed(job, job_obj))
+        (put, state), = self.jobs('start_test')
+        self.assertEqual(put['checkpoints'], {
+            'dockerlint': {}, 'build': {'image': 'registry/image:test'}})
+
+    def test_02_job_reserved_before_gets_the_checkpoints_of_its_build(self):
+        self.create_build(dockerlint='complete', build='complete')
+        self.put(uuid='uuid')
+        # back to the tube, as when the worker reserving it was stopped
+        self.worker.queue.release(self.worker.queue.get(timeout=1))
+        job_obj = self.worker.queue.get(timeout=1)
+        self.assertTrue(self.worker.skip_checkpointed(
+            decode(job_obj.body), job_obj))
+        self.assertEqual(len(self.jobs('start_test')), 1)
+
+    def test_03_job_not_checkpointed_is_handled(self):
+        self.create_build(build='complete')
+        job, job_obj = self.reserve(uuid='uuid')
+        # the phase completed is not looked up for a job reserved first
+        self.assertFalse(self.worker.skip_checkpointed(job, job_obj))
+        job, job_obj = self.reserve(uuid='other', attempts=1)
+        self.assertFalse(self.worker.skip_checkpointed(job, job_obj))
+
+    def test_04_checkpoint_records_the_artifacts(self):
+        build = self.create_build(build='processing')
+        self.worker.job = Job.from_dict({'uuid': 'uuid'})
+        self.worker.build = build
+        self.worker.build_phase = BuildPhase.objects.get(build=build,
+                                                         phase='build')
+        self.worker.checkpoint(image='registry/image:test')
+        self.assertEqual(self.worker.job.resume_action(), 'start_linter')
+        self.assertEqual(self.worker.job['checkpoints'],
+                         {'build': {'image': 'registry/image:test'}})
+        self.assertEqual(json.loads(BuildPhase.objects.get(
+            build=build, phase='build').artifacts),
+            {'image': 'registry/image:test'})
+
+    def test_05_checkpointed_job_is_not_handled_by_the_loop(self):
+        self.put(uuid='uuid', checkpoints={'dockerlint': {}, 'build': {}})
+        self.put(uuid='other')
+        self.worker.work()
+        self.assertEqual([job['uuid'] for job in self.worker.handled],
+                         ['other'])
+        self.assertEqual(self.jobs(), [])
+        self.assertEqual(len(self.jobs('start_test')), 1)
+
+
+class DrainTests(WorkerBase):
+    """BaseWorker, stopping once its jobs are done on SIGTERM"""
+
+    def setUp(self):
+        super(DrainTests, self).setUp()
+        self.patch(StoppedWorker, 'handled', [])
+        handler = signal.getsignal(signal.SIGTERM)
+        self.addCleanup(signal.signal, signal.SIGTERM, handler)
+
+    def test_00_worker_stops_once_its_job_is_done(self):
+        for index in range(3):
+            self.put(uuid='job-{}'.format(index))
+        self.create_worker(StoppedWorker).run()
+        self.assertEqual(StoppedWorker.handled, ['job-0'])
+        self.assertEqual([(job['uuid'], state) for job, state in self.jobs()],
+                         [('job-1', 'ready'), ('job-2', 'ready')])
+
+    def test_01_worker_threads_stop_once_their_jobs_are_done(self):
+        for index in range(6):
+            self.put(uuid='job-{}'.format(index))
+        self.create_worker(StoppedWorker).run(concurrency=2)
+        handled = StoppedWorker.handled
+        self.assertIn(len(handled), (1, 2))
+        # the jobs not handled are back in the tube, none is reserved
+        self.assertEqual(
+            sorted(job['uuid'] for job, state in self.jobs()
+                   if state == 'ready'),
+            sorted(set('job-{}'.format(index) for index in range(6)) -
+                   set(handled)))
+
+
+class SpanTests(WorkerBase):
+    """BaseWorker, timing the steps of the jobs"""
+
+    def test_00_steps_are_saved_to_the_phase_of_the_build(self):
+        build = self.create_build(build='queued')
+        self.put(uuid='uuid', enqueued_at=time.time() - 5)
+        self.create_worker(TimedWorker).work()
+        timings = dict(PhaseTiming.objects.filter(
+            build_phase__build=build, build_phase__phase='build').values_list(
+                'name', 'duration'))
+        self.assertEqual(sorted(timings),
+                         ['handle_job', 'queue_wait', 'start_build'])
+        self.assertGreaterEqual(timings['queue_wait'], 5)
+        self.assertGreaterEqual(timings['start_build'], 0.1)
+        self.assertGreaterEqual(timings['handle_job'],
+                                timings['start_build'])
+
+    def test_01_steps_of_jobs_without_a_build_are_only_logged(self):
+        self.put(uuid='uuid')
+        worker = self.create_worker(BuildWorker)
+        worker.work()
+        self.assertEqual(worker.spans, [])
+        self.assertEqual(PhaseTiming.objects.count(), 0)
+
+    def test_02_steps_of_the_previous_job_are_not_saved_again(self):
+        self.create_build(build='queued')
+        self.create_build(uuid='other', build='queued')
+        worker = self.create_worker(TimedWorker)
+        self.put(uuid='uuid')
+        worker.work()
+        worker.stopping.clear()
+        self.put(uuid='other')
+        worker.work()
+        self.assertEqual(sorted(PhaseTiming.objects.filter(
+            build_phase__build__uuid='other').values_list(
+                'name', flat=True)),
+            ['handle_job', 'queue_wait', 'start_build'])
+
+
+class ParkTests(WorkerBase):
+    """Jobs of child images parked until the builds of their parents end"""
+
+    def setUp(self):
+        super(ParkTests, self).setUp()
+        self.set_settings(BUILD_PARENT_WAIT_TIMEOUT=3600)
+        self.worker = self.create_worker(build.BuildWorker, sub='start_build')
+        self.create_build(build='queued')
+        BuildTracker('parent').start()
+
+    def handle(self):
+        """Handle the job of the child, whose parent is in build"""
+        self.worker.handle_job(Job.from_dict({
+            'uuid': 'uuid', 'action': 'start_build', 'namespace': 'child',
+            'job_name': 'child', 'depends_on': 'other,parent',
+            'logs_dir': self.tmp_dir}))
+
+    def test_00_job_is_parked_until_the_parent_completes(self):
+        self.handle()
+        (job, state), = self.jobs('start_build')
+        self.assertEqual((job['namespace'], state), ('child', 'delayed'))
+        self.assertEqual(BuildPhase.objects.get(phase='build').status,
+                         'requeuedparent')
+        # as the delivery worker does once the parent is delivered
+        worker = self.create_worker(BuildWorker, sub='start_delivery')
+        worker.job = Job.from_dict({'namespace': 'parent'})
+        worker.complete_build()
+        (job, state), = self.jobs('start_build')
+        self.assertEqual(state, 'ready')
+        self.assertFalse(BuildTracker('parent').is_running())
+
+    def test_01_job_is_released_if_the_parent_completed_meanwhile(self):
+        self.patch(BuildTracker, 'is_running', lambda tracker: False)
+        self.handle()
+        (job, state), = self.jobs('start_build')
+        self.assertEqual(state, 'ready')
@@ -0,0 +1,101 @@
+import itertools
+
+from ci.tests.test_00_unit.test_01_pipeline.pipelinebase import PipelineBase
+from container_pipeline.lib import dj  # noqa
+from container_pipeline.management.commands.autoscaleworkers import \
+    WorkerPool
+from django.conf import settings as django_settings
+
+
+class FakeProcess(object):
+    """Worker process, exiting when waited for"""
+    pids = itertools.count(1000)
+
+    def __init__(self):
+        self.pid = next(self.pids)
+        self.returncode = None
+        self.terminated = False
+
+    def poll(self):
+        return self.returncode
+
+    def terminate(self):
+        self.terminated = True
+
+    def wait(self):
+        self.returncode = 0
+        return self.returncode
+
+
+class FakeWorkerPool(WorkerPool):
+    """Pool spawning fake processes"""
+
+    def spawn(self):
+        self.processes.append(FakeProcess())
+        self.spawned += 1
+
+
+def tube_stats(ready=0, reserved=0):
+    return {'current-jobs-ready': ready, 'current-jobs-reserved': reserved}
+
+
+class WorkerPoolTests(PipelineBase):
+    """WorkerPool, scaling the workers of a tube by its depth"""
+
+    def setUp(self):
+        super(WorkerPoolTests, self).setUp()
+        self.patch(django_settings, 'AUTOSCALER_JOBS_PER_WORKER', 2)
+        self.patch(django_settings, 'AUTOSCALER_SCALE_DOWN_DELAY', 300)
+        self.pool = FakeWorkerPool('start_build', 'build.py', min=1, max=4)
+
+    def test_00_workers_needed_are_within_the_bounds(self):
+        self.assertEqual(self.pool.desired(tube_stats()), 1)
+        self.assertEqual(self.pool.desired(tube_stats(ready=3)), 2)
+        self.assertEqual(self.pool.desired(tube_stats(3, reserved=2)), 3)
+        self.assertEqual(self.pool.desired(tube_stats(ready=100)), 4)
+
+    def test_01_workers_are_spawned_at_once(self):
+        self.pool.scale(tube_stats(), 0)
+        self.assertEqual(len(self.pool.processes), 1)
+        self.pool.scale(tube_stats(ready=5), 10)
+        self.assertEqual(len(self.pool.processes), 3)
+        decision = self.pool.last_decision
+        self.assertEqual((decision['action'], decision['from'],
+                          decision['to'], decision['ready']),
+                         ('spawned', 1, 3, 5))
+
+    def test_02_workers_are_reaped_once_the_surplus_lasted(self):
+        self.pool.scale(tube_stats(ready=8), 0)
+        oldest = self.pool.processes[0]
+        self.pool.scale(tube_stats(ready=1), 10)
+        self.pool.scale(tube_stats(ready=1), 309)
+        self.assertEqual(len(self.pool.processes), 4)
+        self.pool.scale(tube_stats(ready=1), 310)
+        self.assertEqual(self.pool.processes, [oldest])
+        self.assertEqual(len(self.pool.stopping), 3)
+        self.assertTrue(all(process.terminated
+                            for process in self.pool.stopping))
+        self.assertEqual(self.pool.last_decision['action'], 'reaped')
+        # the workers stopping are forgotten once they exited
+        for process in self.pool.stopping:
+            process.wait()
+        self.pool.collect()
+        self.assertEqual(self.pool.stopping, [])
+        self.assertEqual(self.pool.status(tube_stats())['reaped'], 3)
+
+    def test_03_surplus_ends_when_the_jobs_come_back(self):
+        self.pool.scale(tube_stats(ready=8), 0)
+        self.pool.scale(tube_stats(), 10)
+        self.pool.scale(tube_stats(ready=8), 200)
+        self.pool.scale(tube_stats(), 400)
+        self.assertEqual(len(self.pool.processes), 4)
+        self.pool.scale(tube_stats(), 700)
+        self.assertEqual(len(self.pool.processes), 1)
+
+    def test_04_crashed_workers_are_replaced(self):
+        self.pool.scale(tube_stats(ready=4), 0)
+        self.pool.processes[0].returncode = 1
+        self.pool.scale(tube_stats(ready=4), 10)
+        self.assertEqual(len(self.pool.processes), 2)
+        status = self.pool.status(tube_stats(ready=4))
+        self.assertEqual((status['crashed'], status['spawned']), (1, 3))
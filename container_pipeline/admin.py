@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from container_pipeline.models import Project, Build, BuildPhase
+from container_pipeline.models import Project, Build, BuildPhase, \
+    PhaseTiming
 
 
 @admin.register(Project)
@@ -22,3 +23,9 @@ class BuildPhase(admin.ModelAdmin):
     list_display = ('build', 'phase', 'status', 'created', 'start_time',
                     'end_time', 'last_updated')
     search_fields = ('build',)
+
+
+@admin.register(PhaseTiming)
+class PhaseTimingAdmin(admin.ModelAdmin):
+    list_display = ('build_phase', 'name', 'start_time', 'duration')
+    list_filter = ('name',)
@@ -5,6 +5,7 @@ from container_pipeline.lib.registry import mark_removal_from_local_registry, \
 
 import config
 import lib
+from container_pipeline.lib import blobs
 from container_pipeline.utils import BuildTracker, get_container_name
 
 
@@ -91,10 +92,11 @@ class GarbageCollector(object):
         """Orphans mismatched images from registry."""
         lib.print_msg("Marking mismatched containers for removal...",
                       self._verbose)
+        # For every entry in mismatched, if a build is not currently
+        # running remove it
+        # Formulate necessary data
+        mismatched = []
         for container_full_name, tag_list in self._mismatched.iteritems():
-            # For every entry in mismatched, if a build is not currently
-            # running remove it
-            # Formulate necessary data
             for tag in tag_list:
                 if "/" in container_full_name:
                     container_namespace, container_name = \
@@ -102,19 +104,19 @@ class GarbageCollector(object):
                 else:
                     container_namespace = None
                     container_name = container_full_name
-                mark_removal_from_local_registry(
-                    self._verbose,
-                    container_namespace,
-                    container_name,
-                    tag,
-                    BuildTracker(
-                        get_container_name(
-                            container_namespace,
-                            container_name,
-                            tag
-                        )
-                    ).is_running()
-                )
+                mismatched.append((container_namespace, container_name, tag))
+        # check the builds of all of them at once
+        running = BuildTracker.running_set(
+            [get_container_name(*entry) for entry in mismatched])
+        for container_namespace, container_name, tag in mismatched:
+            mark_removal_from_local_registry(
+                self._verbose,
+                container_namespace,
+                container_name,
+                tag,
+                get_container_name(
+                    container_namespace, container_name, tag) in running
+            )
 
     def _delete_revision_tags(self):
         """
@@ -134,12 +136,22 @@ class GarbageCollector(object):
         ]
         lib.run_cmd(cmd, no_shell=not self._verbose)
 
+    def _delete_old_blobs(self):
+        """
+        Deletes the values of job fields no job stored for a while from
+        the blob store of the jobs.
+        """
+        lib.print_msg("Deleting old blobs of jobs...", self._verbose)
+        removed = blobs.collect()
+        lib.print_msg("Deleted {} blob(s)".format(removed), self._verbose)
+
     def _cleanup(self):
         """
         Does the actual removal of images from registry
         """
         self._delete_from_registry()
         self._delete_revision_tags()
+        self._delete_old_blobs()
 
     def _gcollect(self):
         """Deletes the mismatched images from registry."""
@@ -0,0 +1,128 @@
+"""
+This module contains the content addressed store for large fields of jobs,
+so that they are not passed through beanstalkd at every hop. A value is
+stored once in settings.JOB_BLOB_DIR, under the sha256 of its JSON encoding,
+and jobs carry that digest instead of the value. Blobs not stored again for
+JOB_BLOB_MAX_AGE seconds are removed by collect().
+"""
+import errno
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+from container_pipeline.lib import settings
+
+logger = logging.getLogger('console')
+
+
+class BlobNotFound(Exception):
+    """The value of a job field is not in the blob store"""
+
+    def __init__(self, digest):
+        super(BlobNotFound, self).__init__(
+            'Blob {} is not in the blob store {}, it was removed by the '
+            'garbage collector, or the store is not shared with the worker '
+            'which stored it'.format(digest, settings.JOB_BLOB_DIR))
+        self.digest = digest
+
+
+class BlobRef(object):
+    """
+    Reference to a value in the blob store, loaded on first use.
+    """
+    __slots__ = ('digest',)
+
+    def __init__(self, digest):
+        self.digest = digest
+
+    def __repr__(self):
+        return 'BlobRef({!r})'.format(self.digest)
+
+    def load(self):
+        """Load the value, raises BlobNotFound if it is not in the store"""
+        return load(self.digest)
+
+
+def path(digest):
+    """Get path of the blob file for digest"""
+    return os.path.join(settings.JOB_BLOB_DIR, digest[:2], digest[2:])
+
+
+def store(value, min_size=0):
+    """
+    Store value, if its JSON encoding is at least min_size bytes long, and
+    return its digest, else return None. Values already in the store are
+    not written again, but are kept for JOB_BLOB_MAX_AGE seconds more.
+    """
+    # most values are small, tell them without sorting the keys, which
+    # takes json out of its C encoder
+    if len(json.dumps(value, separators=(',', ':'))) < min_size:
+        return None
+    data = json.dumps(value, sort_keys=True, separators=(',', ':'))
+    if isinstance(data, type(u'')):
+        data = data.encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()
+    blob_path = path(digest)
+    try:
+        os.utime(blob_path, None)
+        return digest
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+    blob_dir = os.path.dirname(blob_path)
+    try:
+        os.makedirs(blob_dir)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    # write to a temporary file first, so that a reader never sees a blob
+    # half written, since workers share the store over NFS
+    fd, tmp_path = tempfile.mkstemp(dir=blob_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.rename(tmp_path, blob_path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return digest
+
+
+def load(digest):
+    """Load the value stored under digest, raises BlobNotFound if missing"""
+    try:
+        with open(path(digest), 'rb') as f:
+            return json.loads(f.read().decode('utf-8'))
+    except IOError as e:
+        if e.errno == errno.ENOENT:
+            raise BlobNotFound(digest)
+        raise
+
+
+def collect(max_age=None):
+    """
+    Remove the blobs not stored for max_age seconds, JOB_BLOB_MAX_AGE by
+    default, and the temporary files left by writers which crashed. Return
+    the number of files removed.
+    """
+    max_age = max_age if max_age is not None else settings.JOB_BLOB_MAX_AGE
+    oldest = time.time() - max_age
+    removed = 0
+    for blob_dir, _, names in os.walk(settings.JOB_BLOB_DIR):
+        for name in names:
+            blob_path = os.path.join(blob_dir, name)
+            try:
+                if os.path.getmtime(blob_path) < oldest:
+                    os.remove(blob_path)
+                    removed += 1
+            except OSError as e:
+                # stored again, or removed by another collector
+                if e.errno != errno.ENOENT:
+                    logger.error('Failed to remove blob {}: {}'.format(
+                        blob_path, e))
+    return removed
@@ -0,0 +1,148 @@
+"""
+This module contains the shared poller of the status of Openshift builds.
+Rather than every worker polling the build it waits for, the builds of all
+the projects are listed in one call every OPENSHIFT_POLL_INTERVAL seconds,
+and all the waiting workers read the list. The list is kept in memory for
+the threads of a process, and in settings.BUILD_STATUS_FILE for the other
+processes, so that only the process refreshing it lists the builds.
+"""
+import errno
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+
+from container_pipeline.lib import settings
+
+# phases of builds which are done
+BUILD_TERMINAL_PHASES = ('Complete', 'Failed', 'Error', 'Cancelled')
+
+
+class BuildStatusPoller(object):
+    """
+    Status of all the builds, as {'<project>/<build id>': phase}, refreshed
+    at most every interval seconds by the first process needing it.
+    """
+
+    def __init__(self, status_file=None, interval=None):
+        self.status_file = status_file or settings.BUILD_STATUS_FILE
+        self.interval = interval or settings.OPENSHIFT_POLL_INTERVAL
+        self._lock = threading.Lock()
+        self.builds = None
+        self.updated = 0
+
+    def fresh(self):
+        return time.time() - self.updated < self.interval
+
+    def read(self):
+        """Load the builds listed by the last process to refresh them"""
+        try:
+            with open(self.status_file) as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return
+        if data.get('time', 0) > self.updated:
+            self.builds, self.updated = data['builds'], data['time']
+
+    def write(self):
+        # write to a temporary file first, so that readers never see the
+        # list half written
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(self.status_file))
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'time': self.updated, 'builds': self.builds}, f)
+            os.chmod(tmp_path, 0o644)
+            os.rename(tmp_path, self.status_file)
+        except (IOError, OSError):
+            os.remove(tmp_path)
+            raise
+
+    def snapshot(self, openshift):
+        """
+        Get the status of all the builds, listing them with openshift if
+        the last list is older than interval and no other process is
+        listing them, None if they could not be listed.
+        """
+        with self._lock:
+            if self.fresh():
+                return self.builds
+            self.read()
+            if self.fresh():
+                return self.builds
+            try:
+                lock = open(self.status_file + '.lock', 'a')
+            except IOError as e:
+                openshift.logger.error(
+                    'Could not open build status lock: {}'.format(e))
+                return None
+            try:
+                try:
+                    fcntl.lockf(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except IOError as e:
+                    if e.errno not in (errno.EACCES, errno.EAGAIN):
+                        raise
+                    # another process is listing them, the last list will
+                    # do until it wrote the new one, if we have one
+                    if self.builds is not None:
+                        return self.builds
+                    fcntl.lockf(lock, fcntl.LOCK_EX)
+                # the list may have been refreshed while we got the lock
+                self.read()
+                if self.fresh():
+                    return self.builds
+                builds = openshift.list_builds()
+                if builds is None:
+                    return None
+                self.builds, self.updated = builds, time.time()
+                try:
+                    self.write()
+                except (IOError, OSError) as e:
+                    openshift.logger.error(
+                        'Could not write build status: {}'.format(e))
+                return self.builds
+            finally:
+                lock.close()
+
+    def wait(self, openshift, project, build_id, empty_retries=10):
+        """
+        Wait for a build to be done and return the phase it ended in, None
+        if the builds could not be listed, or if the build was missing from
+        empty_retries lists in a row.
+        """
+        key = '{}/{}'.format(project, build_id)
+        missing = 0
+        last_time = None
+        while True:
+            builds = self.snapshot(openshift)
+            if builds is None:
+                return None
+            phase = builds.get(key)
+            if phase in BUILD_TERMINAL_PHASES:
+                return phase
+            if self.updated != last_time:
+                last_time = self.updated
+                openshift.logger.info('Openshift build status for: {}: {}'
+                                      .format(key, phase))
+                missing = missing + 1 if phase is None else 0
+                if missing > empty_retries:
+                    return None
+            # the list may be stale while another process refreshes it,
+            # look again in a while rather than spin until it is done
+            time.sleep(max(0.1 * self.interval,
+                           self.updated + self.interval - time.time()))
+
+
+_poller = None
+_poller_lock = threading.Lock()
+
+
+def get_build_status_poller():
+    """Get the build status poller shared by the threads of the process"""
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = BuildStatusPoller()
+        return _poller
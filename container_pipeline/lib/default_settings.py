@@ -165,12 +165,131 @@ LOGGING = dict(
             "level": "DEBUG",
             "propogate": False,
             "handlers": ["console", "log_to_file"]
+        },
+        'build-scheduler': {
+            "level": "DEBUG",
+            "propagate": False,
+            "handlers": ["console", "log_to_file"]
+        },
+        'autoscaler': {
+            "level": "DEBUG",
+            "propagate": False,
+            "handlers": ["console", "log_to_file"]
+        },
+        'metrics': {
+            "level": "INFO",
+            "propagate": False,
+            "handlers": ["console", "log_to_file"]
         }
     },
 )
 
 BEANSTALKD_HOST = os.environ.get('BEANSTALKD_HOST') or '127.0.0.1'
 BEANSTALKD_PORT = int(os.environ.get('BEANSTALKD_PORT') or '11300')
+# Seconds a worker blocks in reserve before re-issuing it
+BEANSTALKD_RESERVE_TIMEOUT = int(
+    os.environ.get('BEANSTALKD_RESERVE_TIMEOUT') or '60')
+# Time to run (in seconds) of a reserved job before beanstalkd hands it to
+# another worker. Workers touch their job every JOB_HEARTBEAT_INTERVAL
+# seconds while handling it, so this only bounds how long a job stays stuck
+# after its worker died.
+BEANSTALKD_DEFAULT_TTR = 120
+BEANSTALKD_TUBE_TTR = {
+    'start_linter': 300,
+    'start_build': 600,
+    'start_test': 600,
+    'start_scan': 600,
+    'start_delivery': 600,
+    'start_build_fair': 600,
+}
+JOB_HEARTBEAT_INTERVAL = 30
+# Put jobs straight on the tube for their action instead of going through
+# master_tube and the dispatcher worker
+BEANSTALKD_DIRECT_ROUTING = (
+    os.environ.get('BEANSTALKD_DIRECT_ROUTING') or 'true').lower() == 'true'
+# Codec of jobs on the queue: 'json', or 'msgpack' (needs msgpack installed
+# wherever jobs are read, mail service included)
+JOB_CODEC = os.environ.get('JOB_CODEC') or 'json'
+# Large fields of jobs (Dockerfile, scanners' messages and logs) of at least
+# JOB_BLOB_MIN_SIZE bytes are stored once in JOB_BLOB_DIR, shared by all the
+# workers, and only their sha256 is put on the queue
+JOB_BLOB_DIR = os.environ.get('JOB_BLOB_DIR') or \
+    os.path.join(LOGS_BASE_DIR, 'blobs')
+JOB_BLOB_MIN_SIZE = int(os.environ.get('JOB_BLOB_MIN_SIZE') or '1024')
+# Blobs not stored again for JOB_BLOB_MAX_AGE seconds, longer than a job
+# lives, buried ones waiting to be replayed included, are removed by the
+# registry garbage collector
+JOB_BLOB_MAX_AGE = int(
+    os.environ.get('JOB_BLOB_MAX_AGE') or str(30 * 24 * 3600))
+# Failed jobs are retried in the same phase, JOB_RETRY_DELAY seconds times
+# the number of attempts later. A job is buried in its tube once it failed
+# JOB_MAX_ATTEMPTS times, see the replayjobs management command.
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS') or '3')
+JOB_RETRY_DELAY = int(os.environ.get('JOB_RETRY_DELAY') or '60')
+# Number of jobs a worker process handles at once, unless overridden with
+# its --concurrency option
+WORKER_CONCURRENCY = int(os.environ.get('WORKER_CONCURRENCY') or '1')
+# On SIGTERM, workers finish the jobs they handle and stop. Idle workers
+# notice it within WORKER_DRAIN_CHECK_INTERVAL seconds.
+WORKER_DRAIN_CHECK_INTERVAL = int(
+    os.environ.get('WORKER_DRAIN_CHECK_INTERVAL') or '5')
+# With PROFILE_JOBS, or for jobs with their 'profile' field set, workers
+# handle jobs under cProfile. The profile is written to the logs_dir of the
+# job, to be read with `python -m pstats`, and the PROFILE_TOP functions the
+# most time was spent in are logged.
+PROFILE_JOBS = (os.environ.get('PROFILE_JOBS') or 'false').lower() == 'true'
+PROFILE_TOP = int(os.environ.get('PROFILE_TOP') or '25')
+# A trigger of a project which already has a build queued, created less than
+# BUILD_COALESCE_WINDOW seconds ago and not building yet, is merged into it
+# instead of starting a build of its own. 0 disables it.
+BUILD_COALESCE_WINDOW = int(os.environ.get('BUILD_COALESCE_WINDOW') or '3600')
+# With BUILD_FAIR_SHARE, the build scheduler worker moves jobs from
+# start_build to BUILD_FAIR_SHARE_TUBE, which build workers consume, in
+# weighted round robin across namespaces (appid). It keeps at most
+# BUILD_FAIR_SHARE_BACKLOG jobs ready there, so that the order is decided by
+# the scheduler. A namespace gets BUILD_FAIR_SHARE_WEIGHTS[appid] turns per
+# round, 1 if not listed.
+BUILD_FAIR_SHARE = (
+    os.environ.get('BUILD_FAIR_SHARE') or 'false').lower() == 'true'
+BUILD_FAIR_SHARE_TUBE = 'start_build_fair'
+BUILD_FAIR_SHARE_BACKLOG = int(
+    os.environ.get('BUILD_FAIR_SHARE_BACKLOG') or '2')
+BUILD_FAIR_SHARE_WEIGHTS = {}
+# Worker processes run by the autoscaleworkers management command, per tube.
+# It keeps between 'min' and 'max' of them running, one for every
+# AUTOSCALER_JOBS_PER_WORKER jobs ready or reserved in the tube. The linter
+# and scan workers share fixed paths and docker images on their host, hence
+# a single one of them.
+WORKERS_DIR = os.path.join(BASE_DIR, 'workers')
+AUTOSCALER_WORKERS = {
+    'start_linter': {'script': os.path.join(WORKERS_DIR, 'linter.py'),
+                     'min': 1, 'max': 1},
+    'start_build': {'script': os.path.join(WORKERS_DIR, 'build.py'),
+                    'min': 1, 'max': 8},
+    'start_test': {'script': os.path.join(WORKERS_DIR, 'test.py'),
+                   'min': 1, 'max': 4},
+    'start_scan': {'script': os.path.join(WORKERS_DIR, 'scan.py'),
+                   'min': 1, 'max': 1},
+    'start_delivery': {'script': os.path.join(WORKERS_DIR, 'delivery.py'),
+                       'min': 1, 'max': 4},
+}
+AUTOSCALER_JOBS_PER_WORKER = int(
+    os.environ.get('AUTOSCALER_JOBS_PER_WORKER') or '5')
+AUTOSCALER_INTERVAL = int(os.environ.get('AUTOSCALER_INTERVAL') or '30')
+# Workers are reaped only after the tube needed fewer of them for this long
+AUTOSCALER_SCALE_DOWN_DELAY = int(
+    os.environ.get('AUTOSCALER_SCALE_DOWN_DELAY') or '300')
+AUTOSCALER_STATUS_FILE = os.path.join(LOGS_BASE_DIR, 'autoscaler.json')
+# Processes write their metrics to a file of their own in METRICS_DIR every
+# METRICS_FLUSH_INTERVAL seconds, and the servemetrics management command
+# serves them summed on METRICS_PORT, see container_pipeline.lib.metrics.
+# Files of processes gone for METRICS_RETENTION seconds are removed.
+METRICS_DIR = os.path.join(LOGS_BASE_DIR, 'metrics')
+METRICS_FLUSH_INTERVAL = int(
+    os.environ.get('METRICS_FLUSH_INTERVAL') or '15')
+METRICS_PORT = int(os.environ.get('METRICS_PORT') or '9190')
+METRICS_RETENTION = int(
+    os.environ.get('METRICS_RETENTION') or str(7 * 24 * 3600))
 OPENSHIFT_ENDPOINT = os.environ.get('OPENSHIFT_ENDPOINT') or \
     'https://localhost:8443'
 OPENSHIFT_USER = os.environ.get('OPENSHIFT_USER') or 'test-admin'
@@ -178,6 +297,40 @@ OPENSHIFT_PASSWORD = os.environ.get('OPENSHIFT_PASSWORD') or 'admin'
 OC_CONFIG = os.environ.get('OC_CONFIG') or \
     '/opt/cccp-service/client/node.kubeconfig'
 OC_CERT = os.environ.get('OC_CERT') or '/opt/cccp-service/client/ca.crt'
+# Tokens of the Openshift users, shared by the workers of the host so that
+# they login only when the token expired or was refused, on the volume the
+# worker containers all mount. Openshift does not tell `oc login` when its
+# tokens expire, they are kept for OPENSHIFT_TOKEN_TTL seconds, the default
+# lifetime of Openshift tokens.
+OPENSHIFT_TOKEN_CACHE = os.environ.get('OPENSHIFT_TOKEN_CACHE') or \
+    os.path.join(LOGS_BASE_DIR, 'openshift-tokens.json')
+OPENSHIFT_TOKEN_TTL = int(os.environ.get('OPENSHIFT_TOKEN_TTL') or '86400')
+# Openshift client of the workers: 'oc' runs the oc command for every
+# operation, 'api' talks to the REST API of OPENSHIFT_ENDPOINT over a kept
+# alive connection, see container_pipeline.lib.openshift_api
+OPENSHIFT_BACKEND = os.environ.get('OPENSHIFT_BACKEND') or 'oc'
+# Seconds to wait for a response of the REST API
+OPENSHIFT_API_TIMEOUT = int(os.environ.get('OPENSHIFT_API_TIMEOUT') or '60')
+# Wait for builds to be done by watching them, rather than by polling their
+# status every 30 seconds. Watches are restarted every
+# OPENSHIFT_WATCH_TIMEOUT seconds, and polling takes over if watching fails.
+OPENSHIFT_WATCH_BUILDS = (
+    os.environ.get('OPENSHIFT_WATCH_BUILDS') or 'true').lower() == 'true'
+OPENSHIFT_WATCH_TIMEOUT = int(
+    os.environ.get('OPENSHIFT_WATCH_TIMEOUT') or '300')
+# Seconds the linter waits for the project of the previous job of a
+# container to be deleted, before creating it again
+OPENSHIFT_PROJECT_DELETION_TIMEOUT = int(
+    os.environ.get('OPENSHIFT_PROJECT_DELETION_TIMEOUT') or '500')
+# Poll the status of builds by listing the builds of all the projects once
+# every OPENSHIFT_POLL_INTERVAL seconds for all the workers, rather than
+# every build on its own. The list is shared in BUILD_STATUS_FILE and
+# served as /builds by the servemetrics management command.
+OPENSHIFT_SHARED_POLL = (
+    os.environ.get('OPENSHIFT_SHARED_POLL') or 'true').lower() == 'true'
+OPENSHIFT_POLL_INTERVAL = int(
+    os.environ.get('OPENSHIFT_POLL_INTERVAL') or '30')
+BUILD_STATUS_FILE = os.path.join(LOGS_BASE_DIR, 'builds.json')
 
 SCANNERS_STATUS_FILE = "scanners_status.json"
 LINTER_RESULT_FILE = "linter_results.txt"
@@ -194,4 +347,13 @@ UPSTREAM_PACKAGE_CACHE = os.path.join(BASE_DIR, 'tracking/data')
 BEANSTALK_SERVER = 'localhost'
 
 # Build worker
-BUILD_RETRY_DELAY = os.environ.get('BUILD_RETRY_DELAY') or 120  # in seconds
+# Builds are marked running with leases kept in the database ('db'), or as
+# lock files in /srv/pipeline-logs ('file'). A lease expires BUILD_LOCK_TTL
+# seconds after it was taken, or last renewed by a worker handling a job of
+# the build, so that a crashed build does not block its children forever.
+BUILD_TRACKER_BACKEND = os.environ.get('BUILD_TRACKER_BACKEND') or 'db'
+BUILD_LOCK_TTL = int(os.environ.get('BUILD_LOCK_TTL') or '7200')
+# Jobs waiting for a parent build are parked until its delivery completes,
+# or this long at most, in case the parent never completes
+BUILD_PARENT_WAIT_TIMEOUT = int(
+    os.environ.get('BUILD_PARENT_WAIT_TIMEOUT') or '1800')  # in seconds
@@ -0,0 +1,259 @@
+"""
+This module contains the job record which is passed between the workers of
+the container pipeline service, and the codec used to put it on the queue.
+"""
+import json
+
+from container_pipeline.lib import blobs, settings
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Bump this when fields of a job change meaning, and teach Job.from_dict()
+# to upgrade records of older versions.
+SCHEMA_VERSION = 1
+
+FIELDS = (
+    "uuid",          # unique identifier for the job
+    "action",        # action to be performed (lint, build, scan, etc.)
+    "appid",         # equivalent to namespace in Docker hub lingo
+    "jobid",         # equivalent to image name in Docker hub lingo
+    "desired_tag",   # tag to be applied to the image
+    "test_tag",      # temporary tag to be applied to image
+    "project_name",  # centos/centos:latest will be centos-centos-latest
+    "project_hash_key",  # hash value of `project_name` key
+    "namespace",     # same as project_name, still used by the workers
+    "job_name",      # same as project_name, still used by the workers
+    "image_name",    # <appid>/<jobid>:<desired_tag>
+    "image_under_test",  # image being tested
+    "output_image",  # full path to the built image
+    "repo_url",      # url of the remote git repository to build
+    "repo_branch",   # branch of the repository to checkout
+    "repo_build_path",  # path on the repo where Dockerfile can be found
+    "target_file",   # name of the Dockerfile to build the image from
+    "build_context",  # build context of the build
+    "depends_on",    # parent images, their rebuild rebuilds this one too
+    "notify_email",  # email to send notifications to
+    "jenkins_build_number",  # build number for the job in Jenkins
+    "cause_of_build",  # cause of build trigger
+    "dockerfile",    # contents of the Dockerfile for linter purpose
+    "logs_dir",      # directory where all workers' logs files are stored
+    "logs_URL",      # https URL for the logs hosted on nginx
+    "logs_file_path",  # path to the logs of all scanners
+    "delivery_log_file",  # log file for delivery worker
+    "msg",           # message for the user, or scanners' messages
+    "lint_status",   # status of lint process
+    "build_status",  # status of build process
+    "delivery_status",  # status of delivery process
+    "lint_retry",    # number of retries in dockerfile lint
+    "retry",         # whether the job is retried, see retry_delay
+    "retry_delay",   # seconds to wait after last_run_timestamp
+    "last_run_timestamp",
+    "attempts",      # number of failed attempts in the current phase
+    "enqueued_at",   # time the job was put to be ready, see lib.queue
+    "priority",      # priority class of the job, see lib.queue
+    "checkpoints",   # phases completed, with their artifacts
+    "weekly",        # whether this is a weekly scan job
+    "profile",       # whether to profile the handling of the job
+    "tag",           # desired tag of weekly scan jobs
+)
+
+# Phases of a build, in order, with the action of the jobs handling them
+PHASES = (
+    ("dockerlint", "start_linter"),
+    ("build", "start_build"),
+    ("test", "start_test"),
+    ("scan", "start_scan"),
+    ("delivery", "start_delivery"),
+)
+
+# Fields which can grow large, they are put on the queue as a reference to
+# the blob store when they are at least JOB_BLOB_MIN_SIZE bytes, see
+# container_pipeline.lib.blobs
+BLOB_FIELDS = ("dockerfile", "msg", "logs_URL", "logs_file_path")
+
+
+class Job(object):
+    """
+    A job of the pipeline. It keeps the well known fields in slots, any
+    other field in `extra`, and behaves like the dictionaries jobs used to
+    be, so workers can keep using job['field'] and job.get('field'). A
+    known field never set reads as None and is left out when encoding the
+    job, while one set to None is kept, as in a dictionary: its slot is
+    assigned, whatever the value. Fields decoded as a reference to the blob
+    store are loaded when first read, and put back on the queue as the same
+    reference if not.
+    """
+    __slots__ = FIELDS + ('extra',)
+
+    def __init__(self, **fields):
+        self.extra = {}
+        for key, value in fields.items():
+            self[key] = value
+
+    def __getitem__(self, key):
+        if key in _FIELDS:
+            return self._field(key)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        if key in _FIELDS:
+            setattr(self, key, value)
+        else:
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        if key in _FIELDS:
+            return hasattr(self, key)
+        return key in self.extra
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def get(self, key, default=None):
+        """Get a field, or default if it is unset"""
+        if key in _FIELDS:
+            return self._field(key) if hasattr(self, key) else default
+        return self.extra.get(key, default)
+
+    def pop(self, key, default=None):
+        """Unset a field and return its value, or default if it was unset"""
+        if key in _FIELDS:
+            if not hasattr(self, key):
+                return default
+            value = self._field(key)
+            delattr(self, key)
+            return value
+        return self.extra.pop(key, default)
+
+    def keys(self):
+        """Get names of the fields which are set"""
+        return [field for field in FIELDS
+                if hasattr(self, field)] + list(self.extra)
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def copy(self):
+        return Job.from_dict(self.to_dict())
+
+    def checkpoint(self, phase, **artifacts):
+        """Record phase as completed, with its artifacts"""
+        checkpoints = dict(self.get('checkpoints') or {})
+        checkpoints[phase] = artifacts
+        self['checkpoints'] = checkpoints
+
+    def resume_action(self):
+        """
+        Get the action of the first phase not completed, None if all of
+        them are
+        """
+        checkpoints = self.get('checkpoints') or {}
+        for phase, action in PHASES:
+            if phase not in checkpoints:
+                return action
+        return None
+
+    def to_dict(self):
+        """Get the fields which are set as a dictionary"""
+        data = self._raw()
+        for field in BLOB_FIELDS:
+            if isinstance(data.get(field), blobs.BlobRef):
+                data[field] = self._field(field)
+        return data
+
+    def _field(self, field):
+        value = getattr(self, field, None)
+        if isinstance(value, blobs.BlobRef):
+            value = value.load()
+            setattr(self, field, value)
+        return value
+
+    def _raw(self):
+        # like to_dict(), but keeps references to the blob store as is
+        data = dict(self.extra)
+        for field in FIELDS:
+            value = getattr(self, field, _UNSET)
+            if value is not _UNSET:
+                data[field] = value
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create job from a dictionary, as created by to_dict()"""
+        job = cls()
+        extra = job.extra
+        for key, value in data.items():
+            if key in _FIELDS:
+                setattr(job, key, value)
+            else:
+                extra[key] = value
+        return job
+
+    def encode(self):
+        """Encode job to put it on the queue"""
+        return encode(self)
+
+    @classmethod
+    def decode(cls, body):
+        """Decode job from the body of a queue job"""
+        return decode(body)
+
+
+_FIELDS = frozenset(FIELDS)
+# value of the slots of the fields never set
+_UNSET = object()
+
+
+def encode(job, codec=None):
+    """
+    Encode a job, or a plain dictionary, for the queue. Unset fields are
+    left out, large fields are moved to the blob store and the schema
+    version is added. The codec is JOB_CODEC, unless given: 'json', or
+    'msgpack' if msgpack is installed.
+    """
+    data = job._raw() if isinstance(job, Job) else dict(job)
+    refs = {}
+    for field in BLOB_FIELDS:
+        value = data.get(field)
+        if isinstance(value, blobs.BlobRef):
+            refs[field] = value.digest
+        elif value is not None:
+            try:
+                digest = blobs.store(value, settings.JOB_BLOB_MIN_SIZE)
+            except (IOError, OSError):
+                # keep the value in the job, it still fits on the queue
+                # unless it is really large
+                continue
+            if digest is not None:
+                refs[field] = digest
+    if refs:
+        for field in refs:
+            del data[field]
+        data['_blobs'] = refs
+    data['_v'] = SCHEMA_VERSION
+    if (codec or settings.JOB_CODEC) == 'msgpack' and msgpack:
+        return msgpack.packb(data, use_bin_type=True)
+    return json.dumps(data, separators=(',', ':'))
+
+
+def decode(body):
+    """
+    Decode a job from the queue. Both codecs can be read whatever JOB_CODEC
+    says, so that jobs put before switching it are not lost.
+    """
+    if body[:1] in ('{', b'{'):
+        data = json.loads(body)
+    elif msgpack:
+        data = msgpack.unpackb(body, raw=False)
+    else:
+        raise ValueError('Cannot decode job, msgpack is not installed')
+    data.pop('_v', 0)
+    for field, digest in data.pop('_blobs', {}).items():
+        data[field] = blobs.BlobRef(digest)
+    return Job.from_dict(data)
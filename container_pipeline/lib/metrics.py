@@ -0,0 +1,314 @@
+"""
+This module contains the metrics of the container pipeline service. Every
+process keeps its metrics in an in-process registry, cheap to update, and a
+thread writes them to a file of its own in settings.METRICS_DIR every
+METRICS_FLUSH_INTERVAL seconds. The servemetrics management command serves
+the metrics of all the processes summed, along with the stats of the tubes,
+in the Prometheus text format.
+"""
+import atexit
+import collections
+import contextlib
+import errno
+import glob
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from container_pipeline.lib import settings
+
+COUNTER = 'counter'
+HISTOGRAM = 'histogram'
+GAUGE = 'gauge'
+
+# name -> (type, help)
+METRICS = {
+    'pipeline_jobs_total': (
+        COUNTER, 'Jobs handled, by worker and outcome'),
+    'pipeline_job_duration_seconds': (
+        HISTOGRAM, 'Time workers took to handle a job, by worker'),
+    'pipeline_openshift_polls_total': (
+        COUNTER, 'Openshift build status polls'),
+    'pipeline_openshift_watches_total': (
+        COUNTER, 'Openshift build watches started'),
+    'pipeline_openshift_token_cache_total': (
+        COUNTER, 'Openshift token cache lookups by result, and tokens '
+        'invalidated'),
+    'pipeline_openshift_lists_total': (
+        COUNTER, 'Openshift lists of the builds of all the projects'),
+    'pipeline_scanner_duration_seconds': (
+        HISTOGRAM, 'Time scanners took to run on an image, by scanner'),
+    'pipeline_mail_duration_seconds': (
+        HISTOGRAM, 'Time sending a notification email took'),
+    'pipeline_builds': (
+        GAUGE, 'Openshift builds of all the projects, by phase'),
+    'pipeline_tube_jobs': (
+        GAUGE, 'Jobs in the tubes, by tube and state'),
+    'pipeline_autoscaler_workers_desired': (
+        GAUGE, 'Workers the autoscaler wants for a tube, by tube'),
+    'pipeline_autoscaler_workers_running': (
+        GAUGE, 'Workers the autoscaler runs for a tube, by tube'),
+    'pipeline_autoscaler_decisions_total': (
+        COUNTER, 'Workers spawned or reaped by the autoscaler, by tube and '
+        'action'),
+}
+
+# upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600,
+           float('inf'))
+
+# states of jobs in tubes, as in beanstalkd's stats-tube
+TUBE_STATES = ('ready', 'reserved', 'delayed', 'buried')
+
+logger = logging.getLogger('console')
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class Registry(object):
+    """
+    Counters, histograms and gauges, keyed by name and labels
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        # (name, labels) -> [count of each bucket, sum]
+        self.histograms = {}
+        self.gauges = {}
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * len(BUCKETS) + [0]
+            for index, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram[index] += 1
+                    break
+            histogram[-1] += value
+
+    def dump(self):
+        """Registry as a JSON serializable dictionary, see load()"""
+        with self._lock:
+            return {
+                COUNTER: [[name, dict(labels), value] for (name, labels),
+                          value in self.counters.items()],
+                HISTOGRAM: [[name, dict(labels), list(value)]
+                            for (name, labels), value in
+                            self.histograms.items()],
+                GAUGE: [[name, dict(labels), value] for (name, labels),
+                        value in self.gauges.items()],
+            }
+
+    def load(self, data, gauges=True):
+        """
+        Add the metrics dumped by another registry to this one. Gauges are
+        summed too, unless gauges is False, e.g. for the gauges of a
+        process gone, which do not hold anymore.
+        """
+        for name, labels, value in data.get(COUNTER, []):
+            self.inc(name, value, **labels)
+        for name, labels, value in data.get(GAUGE, []) if gauges else []:
+            key = _key(name, labels)
+            with self._lock:
+                self.gauges[key] = self.gauges.get(key, 0) + value
+        for name, labels, value in data.get(HISTOGRAM, []):
+            key = _key(name, labels)
+            with self._lock:
+                histogram = self.histograms.setdefault(
+                    key, [0] * len(BUCKETS) + [0])
+                for index, count in enumerate(value):
+                    histogram[index] += count
+
+    def render(self, gauges=None):
+        """
+        Metrics in the Prometheus text format. gauges are (name, labels,
+        value) tuples of metrics read at scrape time, besides the gauges of
+        the registry.
+        """
+        samples = {}
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items() +
+                                                self.gauges.items()):
+                samples.setdefault(name, []).append((name, labels, value))
+            for (name, labels), value in sorted(self.histograms.items()):
+                lines = samples.setdefault(name, [])
+                total = 0
+                for bound, count in zip(BUCKETS, value):
+                    total += count
+                    lines.append((name + '_bucket', labels + (
+                        ('le', '+Inf' if bound == float('inf')
+                         else repr(bound)),), total))
+                lines.append((name + '_sum', labels, value[-1]))
+                lines.append((name + '_count', labels, total))
+        for name, labels, value in gauges or []:
+            samples.setdefault(name, []).append(
+                (name, tuple(sorted(labels.items())), value))
+
+        output = []
+        for name in sorted(samples):
+            kind, description = METRICS.get(name, ('untyped', ''))
+            output.append('# HELP {} {}'.format(name, description))
+            output.append('# TYPE {} {}'.format(name, kind))
+            for sample, labels, value in samples[name]:
+                output.append('{}{} {}'.format(sample, _labels(labels),
+                                               _value(value)))
+        return '\n'.join(output) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(
+        name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+        for name, value in labels) + '}'
+
+
+def _value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = Registry()
+
+# pid of the process the flusher thread was started in, see _flusher()
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+
+def inc(name, value=1, **labels):
+    """Increment counter name by value"""
+    _flusher()
+    REGISTRY.inc(name, value, **labels)
+
+
+def gauge(name, value, **labels):
+    """Set gauge name to value"""
+    _flusher()
+    REGISTRY.set(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    """Record value, in seconds, in histogram name"""
+    _flusher()
+    REGISTRY.observe(name, value, **labels)
+
+
+@contextlib.contextmanager
+def timer(name, **labels):
+    """Record the time the block took in histogram name"""
+    start = time.time()
+    try:
+        yield
+    finally:
+        observe(name, time.time() - start, **labels)
+
+
+def path():
+    """Path of the metrics file of this process"""
+    return os.path.join(settings.METRICS_DIR, '{}.{}.json'.format(
+        socket.gethostname(), os.getpid()))
+
+
+def flush():
+    """Write the metrics of this process to its metrics file"""
+    data = json.dumps(REGISTRY.dump())
+    try:
+        os.makedirs(settings.METRICS_DIR)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            logger.error('Failed to create metrics directory: {}'.format(e))
+            return
+    # write to a temporary file first, so that the metrics server never
+    # reads a file half written
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=settings.METRICS_DIR)
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.rename(tmp_path, path())
+    except (IOError, OSError) as e:
+        logger.error('Failed to write metrics: {}'.format(e))
+
+
+def _flusher():
+    """Start the thread flushing metrics, once per process"""
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+
+        def run():
+            while True:
+                time.sleep(settings.METRICS_FLUSH_INTERVAL)
+                flush()
+        thread = threading.Thread(target=run, name='metrics-flusher')
+        thread.daemon = True
+        thread.start()
+        atexit.register(flush)
+
+
+def collect():
+    """
+    Registry with the metrics of all the processes, read from their metrics
+    files. Files not written to for METRICS_RETENTION seconds, left by
+    processes which exited, are removed. The gauges of files not written to
+    for a few flushes, whose process is likely gone, are left out.
+    """
+    registry = Registry()
+    for metrics_file in glob.glob(
+            os.path.join(settings.METRICS_DIR, '*.json')):
+        try:
+            age = time.time() - os.path.getmtime(metrics_file)
+            if age > settings.METRICS_RETENTION:
+                os.remove(metrics_file)
+                continue
+            with open(metrics_file) as f:
+                registry.load(json.load(f), gauges=age < 3 * settings.
+                              METRICS_FLUSH_INTERVAL)
+        except (IOError, OSError, ValueError) as e:
+            logger.warning('Failed to read metrics file {}: {}'.format(
+                metrics_file, e))
+    return registry
+
+
+def tube_gauges(queue, tubes):
+    """Jobs in tubes by state, as gauges for Registry.render()"""
+    gauges = []
+    for tube in tubes:
+        # None until a job was ever put on the tube
+        stats = queue.stats_tube(tube) or {}
+        for state in TUBE_STATES:
+            gauges.append(('pipeline_tube_jobs', {
+                'tube': tube, 'state': state},
+                stats.get('current-jobs-{}'.format(state), 0)))
+    return gauges
+
+
+def build_gauges(builds):
+    """
+    Builds by phase, as gauges for Registry.render(), from the
+    builds of container_pipeline.lib.build_status
+    """
+    phases = collections.Counter(builds.values())
+    return [('pipeline_builds', {'phase': phase}, count)
+            for phase, count in sorted(phases.items())]
@@ -1,8 +1,15 @@
+import fcntl
+import json
 import logging
+import os
 import subprocess
+import tempfile
+import threading
 import time
 
-from container_pipeline.lib import settings
+from container_pipeline.lib import metrics, settings
+from container_pipeline.lib.build_status import (
+    BUILD_TERMINAL_PHASES, get_build_status_poller)
 from container_pipeline.lib.command import run_cmd
 
 
@@ -10,6 +17,103 @@ class OpenshiftError(Exception):
     pass
 
 
+def get_openshift(**kwargs):
+    """
+    Get an Openshift client of the OPENSHIFT_BACKEND setting: running `oc`
+    (Openshift), or talking to the REST API ('api', OpenshiftAPI).
+    """
+    if settings.OPENSHIFT_BACKEND == 'api':
+        from container_pipeline.lib.openshift_api import OpenshiftAPI
+        return OpenshiftAPI(**kwargs)
+    return Openshift(**kwargs)
+
+
+class TokenCache(object):
+    """
+    Tokens of the users logged in to Openshift, shared by the workers of
+    the host in settings.OPENSHIFT_TOKEN_CACHE, so that they login only when
+    the token expired, or was refused.
+    """
+
+    # tokens expiring within this many seconds, or half their lifetime if
+    # shorter, are not used anymore, for a job started with a token to be
+    # done before it expires
+    EXPIRY_MARGIN = 3600
+
+    # lockf locks are held by the process, the threads of a worker take
+    # this one first
+    thread_lock = threading.Lock()
+
+    def __init__(self, path=None):
+        self.path = path or settings.OPENSHIFT_TOKEN_CACHE
+
+    @staticmethod
+    def key(endpoint, user):
+        return '{} {}'.format(endpoint, user)
+
+    def read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def update(self, function):
+        """Apply function to the tokens, the other workers waiting"""
+        try:
+            with self.thread_lock, open(self.path + '.lock', 'a') as lock:
+                fcntl.lockf(lock, fcntl.LOCK_EX)
+                tokens = self.read()
+                function(tokens)
+                # mkstemp creates the file readable by us only
+                fd, tmp_path = tempfile.mkstemp(
+                    dir=os.path.dirname(self.path))
+                try:
+                    with os.fdopen(fd, 'w') as f:
+                        json.dump(tokens, f)
+                    os.rename(tmp_path, self.path)
+                except (IOError, OSError):
+                    os.remove(tmp_path)
+                    raise
+        except (IOError, OSError) as e:
+            logging.getLogger('console').error(
+                'Could not update Openshift token cache: {}'.format(e))
+
+    def get(self, endpoint, user):
+        """Get a token of user, None if there is none valid"""
+        entry = self.read().get(self.key(endpoint, user))
+        if entry is None:
+            result = 'miss'
+        elif entry['expires'] < time.time():
+            result = 'expired'
+        else:
+            result = 'hit'
+        metrics.inc('pipeline_openshift_token_cache_total', result=result)
+        return entry['token'] if result == 'hit' else None
+
+    def put(self, endpoint, user, token, expires_in):
+        def put(tokens):
+            # drop the expired tokens of the other users along
+            now = time.time()
+            for key, entry in tokens.items():
+                if entry['expires'] < now:
+                    del tokens[key]
+            tokens[self.key(endpoint, user)] = {
+                'token': token, 'expires': now + expires_in - min(
+                    self.EXPIRY_MARGIN, expires_in / 2)}
+        self.update(put)
+
+    def invalidate(self, endpoint, user, token):
+        """Forget the token of user, unless it was replaced already"""
+        def invalidate(tokens):
+            key = self.key(endpoint, user)
+            if tokens.get(key, {}).get('token') == token:
+                del tokens[key]
+        metrics.inc('pipeline_openshift_token_cache_total',
+                    result='invalidated')
+        self.update(invalidate)
+
+
 class Openshift(object):
 
     def __init__(self, endpoint=None, user=None, password=None,
@@ -19,51 +123,137 @@ class Openshift(object):
         self.password = password or settings.OPENSHIFT_PASSWORD
         self.config = config or settings.OC_CONFIG
         self.cert = cert or settings.OC_CERT
-        self.oc_login_suffix = (
-            '--config {config} --certificate-authority {cert}'.format(
-                config=self.config, cert=self.cert))
-        self.oc_cmd_suffix = (
-            '--config {config}'.format(
-                config=self.config))
         self.logger = logger or logging.getLogger('console')
+        self.tokens = TokenCache()
+        self.token = None
+        # credentials of the last login, to login again with when the
+        # token is refused
+        self.login_user = self.login_password = None
+
+    def user_config(self, user):
+        """
+        Path of the kubeconfig of user, which `oc login` writes the token
+        of the user to, so that oc commands act as the user who logged in
+        without passing the token on the command line
+        """
+        return '{}.{}'.format(self.config, user)
+
+    @property
+    def oc_cmd_suffix(self):
+        return '--config {config}'.format(
+            config=self.user_config(self.login_user or self.user))
 
     def login(self, user=None, password=None):
-        """Login to openshift"""
+        """
+        Login to openshift, unless a worker of the host did already, see
+        TokenCache. Tokens of `oc login` are cached for OPENSHIFT_TOKEN_TTL
+        seconds.
+        """
         user = user or self.user
         password = password or self.password
+        self.login_user, self.login_password = user, password
+        self.token = self.tokens.get(self.endpoint, user)
+        if self.token and os.path.exists(self.user_config(user)):
+            return
         try:
             self.logger.debug(
                 'Login to openshift:\n{}'.format(
                     run_cmd(
-                        'oc login {endpoint} -u {user} -p {password} {suffix}'
+                        'oc login {endpoint} -u {user} -p {password} '
+                        '--config {config} --certificate-authority {cert}'
                         .format(
                             endpoint=self.endpoint, user=user,
-                            password=password, suffix=self.oc_login_suffix
+                            password=password, config=self.user_config(user),
+                            cert=self.cert
                         ))
                 )
             )
+            token = run_cmd('oc whoami --show-token {suffix}'.format(
+                suffix=self.oc_cmd_suffix)).strip()
         except subprocess.CalledProcessError as e:
+            # the command has the password in it
             raise OpenshiftError(
-                'Openshift login error: {}'.format(e))
+                'Openshift login error: exit status {}'.format(e.returncode))
+        self.tokens.put(self.endpoint, user, token,
+                        settings.OPENSHIFT_TOKEN_TTL)
+        self.token = token
+
+    def run_oc(self, cmd, shell=False):
+        """
+        Run an oc command, a string or a list of its arguments, and return
+        its output. When oc says the token is refused, it is dropped from
+        the cache and the command is run again once logged in again, as
+        OpenshiftAPI.request() does. Raises subprocess.CalledProcessError,
+        with the error output of oc as output.
+        """
+        args = cmd.split() if isinstance(cmd, basestring) and not shell \
+            else cmd
+        for attempt in range(2):
+            process = subprocess.Popen(args, shell=shell,
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE)
+            output, error = process.communicate()
+            if not process.returncode:
+                return output
+            if attempt or not self.login_user or 'Unauthorized' not in error:
+                break
+            # the token expired or was revoked, login again, unless
+            # another worker of the host did already
+            self.logger.info('Openshift token refused, login again')
+            self.tokens.invalidate(self.endpoint, self.login_user,
+                                   self.token)
+            try:
+                self.login(self.login_user, self.login_password)
+            except OpenshiftError as e:
+                self.logger.error(e)
+                break
+        raise subprocess.CalledProcessError(process.returncode, cmd,
+                                            output=error or output)
 
     def get_project(self, project):
+        """Check whether a project exists, looking it up alone"""
         self.logger.debug(
             'Check openshift project: {} existing or not'.format(project))
-        is_existing = False
         try:
-            output = run_cmd(
-                'oc get projects {suffix}'.format(suffix=self.oc_cmd_suffix))
-            if project in output.strip():
-                is_existing = True
+            self.run_oc('oc get project/{project} -o name {suffix}'.format(
+                project=project, suffix=self.oc_cmd_suffix))
         except subprocess.CalledProcessError as e:
-            self.logger.debug('Error during fetching details for \
-                              openshift project  {}: {}'.format(project, e))
-        return is_existing
+            self.logger.debug('Error during fetching details for '
+                              'openshift project {}: {}'.format(project, e))
+            return False
+        return True
+
+    def get_projects(self, projects):
+        """Get the set of projects which exist, listing the projects once"""
+        try:
+            output = self.run_oc('oc get projects -o name {suffix}'.format(
+                suffix=self.oc_cmd_suffix))
+        except subprocess.CalledProcessError as e:
+            self.logger.error(
+                'Error during listing openshift projects: {}'.format(e))
+            return set()
+        # names are listed as project/<name>, or projects/<name>
+        return set(projects) & set(
+            line.rsplit('/', 1)[-1] for line in output.split())
+
+    def wait_for_project_deletion(self, project, timeout, retry_delay=5):
+        """
+        Wait for a project to be gone, True if it was within timeout
+        seconds. `oc get --watch` does not tell when an object is deleted,
+        the project is looked up every retry_delay seconds.
+        """
+        deadline = time.time() + timeout
+        while self.get_project(project):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            time.sleep(min(retry_delay, remaining))
+        return True
 
     def create(self, project):
         self.logger.debug('Create openshift project: {}'.format(project))
         try:
-            run_cmd(
+            self.run_oc(
                 'oc new-project {project} --display-name {project} {suffix}'
                 .format(project=project, suffix=self.oc_cmd_suffix))
         except subprocess.CalledProcessError as e:
@@ -74,7 +264,7 @@ class Openshift(object):
     def delete(self, project):
         self.logger.debug('Delete openshift project: {}'.format(project))
         try:
-            run_cmd(
+            self.run_oc(
                 'oc delete project {project} {suffix}'
                 .format(project=project, suffix=self.oc_cmd_suffix))
         except subprocess.CalledProcessError as e:
@@ -84,7 +274,7 @@ class Openshift(object):
 
     def clean_project(self, project):
         try:
-            run_cmd(
+            self.run_oc(
                 'oc delete build,bc,is -n {project} {suffix}'
                 .format(project=project, suffix=self.oc_cmd_suffix))
         except subprocess.CalledProcessError as e:
@@ -99,7 +289,7 @@ class Openshift(object):
         tmpl_params_str = ' '.join(
             ['-p {k}={v}'.format(k=k, v=v) for k, v in template_data.items()])
         try:
-            run_cmd(
+            self.run_oc(
                 'oc process -n {project} -f {tmpl_path} {tmpl_params} '
                 '{suffix} | '
                 'oc {suffix} -n {project} create -f -'.format(
@@ -127,7 +317,7 @@ class Openshift(object):
         self.logger.debug('Run openshift project build: {}/{}'
                           .format(build, project))
         try:
-            output = run_cmd(
+            output = self.run_oc(
                 'oc --namespace {project} start-build {build} '
                 '{suffix}'.format(
                     project=project, build=build, suffix=self.oc_cmd_suffix)
@@ -143,8 +333,9 @@ class Openshift(object):
 
     def get_build_status(self, project, build_id, status_index=3):
         """Get status of an openshift project build"""
+        metrics.inc('pipeline_openshift_polls_total')
         try:
-            output = run_cmd(
+            output = self.run_oc(
                 'oc get --namespace {project} build/{build_id} {suffix} | '
                 'grep -v STATUS'.format(
                     project=project, build_id=build_id,
@@ -160,12 +351,73 @@ class Openshift(object):
                 .format(project, build_id, e))
             return ""
 
+    def list_builds(self):
+        """
+        Get the status of the builds of all the projects, as
+        {'<project>/<build id>': phase}, None if they could not be listed
+        """
+        metrics.inc('pipeline_openshift_lists_total')
+        cmd = ('oc get builds --all-namespaces {suffix}'.format(
+            suffix=self.oc_cmd_suffix)).split() + [
+            '-o', 'jsonpath={range .items[*]}{.metadata.namespace}/'
+            '{.metadata.name} {.status.phase}{"\\n"}{end}']
+        try:
+            output = self.run_oc(cmd)
+        except (OSError, subprocess.CalledProcessError) as e:
+            self.logger.error('Openshift builds list error: {}'.format(e))
+            return None
+        return dict(line.split() for line in output.splitlines()
+                    if len(line.split()) == 2)
+
+    def get_build_image_digest(self, project, build_id):
+        """Get digest of the image pushed by an openshift project build"""
+        try:
+            output = self.run_oc(
+                'oc get --namespace {project} build/{build_id} '
+                '-o jsonpath={{.status.output.to.imageDigest}} {suffix}'
+                .format(project=project, build_id=build_id,
+                        suffix=self.oc_cmd_suffix))
+            return output.strip()
+        except subprocess.CalledProcessError as e:
+            self.logger.error(
+                'Openshift build image digest fetch error for {}/{}: {}'
+                .format(project, build_id, e))
+            return ""
+
     def wait_for_build_status(self, project, build_id, status,
                               empty_retries=10, retry_delay=30,
                               status_index=3):
-        """Wait for openshift project build to reach a desired state"""
+        """
+        Wait for openshift project build to reach a desired state. With
+        OPENSHIFT_WATCH_BUILDS, the build is watched until it is done, see
+        watch_build(), else, or if watching fails, its status is polled:
+        with OPENSHIFT_SHARED_POLL, in the list of all the builds shared by
+        the workers, see container_pipeline.lib.build_status, else, or if
+        the builds could not be listed, every retry_delay seconds.
+        """
         self.logger.info('Wait for openshift project build: {}/{} to '
                          'be: {}'.format(project, build_id, status))
+        if settings.OPENSHIFT_WATCH_BUILDS:
+            phase = self.watch_build(project, build_id)
+            if phase:
+                return phase == status
+            self.logger.warning('Could not watch build {}/{}, polling its '
+                                'status'.format(project, build_id))
+        if settings.OPENSHIFT_SHARED_POLL:
+            phase = get_build_status_poller().wait(
+                self, project, build_id, empty_retries=empty_retries)
+            if phase:
+                return phase == status
+            self.logger.warning('Could not find build {}/{} in the builds '
+                                'listed, polling its status'.format(
+                                    project, build_id))
+        return self.poll_build_status(project, build_id, status,
+                                      empty_retries, retry_delay,
+                                      status_index)
+
+    def poll_build_status(self, project, build_id, status, empty_retries,
+                          retry_delay, status_index):
+        """Poll status of a build until it reaches status or fails"""
         current_status = None
         empty_retry_count = 0
         while True:
@@ -192,9 +444,47 @@ class Openshift(object):
                 empty_retry_count = 0
             time.sleep(retry_delay)
 
+    def watch_build(self, project, build_id):
+        """
+        Watch a build until it is done, with `oc get --watch`, and return
+        the phase it ended in, None if it could not be watched. The watch is
+        restarted every OPENSHIFT_WATCH_TIMEOUT seconds, in case it hung.
+        """
+        cmd = ('oc get --namespace {project} build/{build_id} --watch '
+               '-o jsonpath={{.status.phase}}{{"\\n"}} {suffix}'.format(
+                   project=project, build_id=build_id,
+                   suffix=self.oc_cmd_suffix)).split()
+        while True:
+            metrics.inc('pipeline_openshift_watches_total')
+            try:
+                process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+            except OSError as e:
+                self.logger.error('Could not watch build {}/{}: {}'.format(
+                    project, build_id, e))
+                return None
+            timer = threading.Timer(settings.OPENSHIFT_WATCH_TIMEOUT,
+                                    process.terminate)
+            timer.start()
+            phase = None
+            try:
+                for line in iter(process.stdout.readline, ''):
+                    phase = line.strip()
+                    self.logger.info('Openshift build status for: {}/{}: {}'
+                                     .format(project, build_id, phase))
+                    if phase in BUILD_TERMINAL_PHASES:
+                        process.terminate()
+                        return phase
+            finally:
+                timer.cancel()
+                process.stdout.close()
+                process.wait()
+            # the watch timed out, else oc failed
+            if process.returncode > 0 or phase is None:
+                return None
+
     def get_build_logs(self, project, build_id, build_type="build"):
         try:
-            output = run_cmd(
+            output = self.run_oc(
                 'oc logs --namespace {project} build/{build_id} {suffix}'
                 .format(
                     project=project, build_id=build_id,
@@ -216,7 +506,7 @@ class Openshift(object):
         try:
             self.logger.debug("Deleting pods for project build: {}/{}"
                               .format(project, build_id))
-            run_cmd(
+            self.run_oc(
                 'oc delete pods --namespace {project} build/{build_id}'
                 ' {suffix}'.format(project=project, build_id=build_id,
                                    suffix=self.oc_cmd_suffix))
@@ -0,0 +1,496 @@
+"""
+This module contains the Openshift client which talks to the REST API of
+Openshift, over a keep-alive connection shared by the clients of a thread,
+instead of running `oc` for every operation. It is used with
+settings.OPENSHIFT_BACKEND = 'api', see openshift.get_openshift().
+"""
+import base64
+import httplib
+import json
+import math
+import socket
+import ssl
+import threading
+import time
+import urllib
+import urlparse
+
+from container_pipeline.lib import metrics, settings
+from container_pipeline.lib.openshift import BUILD_TERMINAL_PHASES, \
+    Openshift, OpenshiftError
+
+# kinds of the Kubernetes API, the others are Openshift's
+KUBERNETES_KINDS = ('Pod', 'Service', 'Secret', 'ConfigMap', 'ServiceAccount',
+                    'PersistentVolumeClaim', 'ReplicationController')
+
+# requests safe to send again when a kept alive connection turned out to
+# be closed by the server
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE')
+
+
+class APIError(OpenshiftError):
+    """Error response of the API server"""
+
+    def __init__(self, message, status=None):
+        super(APIError, self).__init__(message)
+        self.status = status
+
+
+class Session(object):
+    """
+    Keep-alive HTTP(S) connection to an API server. The connection is opened
+    on first use, and opened again when the server closed it.
+    """
+
+    def __init__(self, endpoint, cafile=None, timeout=None):
+        parsed = urlparse.urlsplit(endpoint)
+        self.https = parsed.scheme == 'https'
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if self.https else 80)
+        self.cafile = cafile
+        self.timeout = timeout or settings.OPENSHIFT_API_TIMEOUT
+        self.connects = 0
+        self._conn = None
+
+    def connect(self, timeout=None):
+        timeout = timeout or self.timeout
+        if self.https:
+            context = ssl.create_default_context(cafile=self.cafile)
+            conn = httplib.HTTPSConnection(
+                self.host, self.port, timeout=timeout, context=context)
+        else:
+            conn = httplib.HTTPConnection(self.host, self.port,
+                                          timeout=timeout)
+        self.connects += 1
+        return conn
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        """Send a request, return (status, headers, body) of the response"""
+        while True:
+            reused = self._conn is not None
+            if not reused:
+                self._conn = self.connect()
+            try:
+                self._conn.request(method, path, body, headers or {})
+                response = self._conn.getresponse()
+                data = response.read()
+            except (httplib.HTTPException, socket.error):
+                self.close()
+                if reused and method in IDEMPOTENT_METHODS:
+                    continue
+                raise
+            if response.getheader('connection', '').lower() == 'close':
+                self.close()
+            return response.status, dict(response.getheaders()), data
+
+    def stream(self, path, headers=None):
+        """
+        Send a GET request for a stream of JSON objects, one per line, as
+        watches send, and yield them until the server ends the stream. This
+        takes a connection of its own, for the time the stream lasts.
+        """
+        conn = self.connect(timeout=settings.OPENSHIFT_WATCH_TIMEOUT +
+                            self.timeout)
+        try:
+            conn.request('GET', path, headers=headers or {})
+            response = conn.getresponse()
+            if response.status != 200:
+                raise APIError('GET {} failed with status {}: {}'.format(
+                    path, response.status, response.read()[:500]),
+                    status=response.status)
+            buf = ''
+            while True:
+                # httplib reads chunked responses whole, read the chunks
+                # as they come instead
+                if response.chunked:
+                    size = int(response.fp.readline().split(';')[0], 16)
+                    if not size:
+                        break
+                    data = response.fp.read(size)
+                    response.fp.readline()
+                else:
+                    data = response.fp.readline()
+                    if not data:
+                        break
+                buf += data
+                while '\n' in buf:
+                    line, buf = buf.split('\n', 1)
+                    if line.strip():
+                        yield json.loads(line)
+        finally:
+            conn.close()
+
+
+_sessions = threading.local()
+
+
+def get_session(endpoint, cafile=None):
+    """
+    Get the session to endpoint of the current thread. Sessions are shared
+    by all the clients of a thread, like queues, see lib.queue.get_queue().
+    """
+    sessions = _sessions.__dict__.setdefault('sessions', {})
+    if (endpoint, cafile) not in sessions:
+        sessions[(endpoint, cafile)] = Session(endpoint, cafile)
+    return sessions[(endpoint, cafile)]
+
+
+class OpenshiftAPI(Openshift):
+    """
+    Openshift client with the methods of Openshift, talking to the REST API
+    of Openshift instead of running `oc`.
+    """
+
+    @property
+    def session(self):
+        """
+        Session of the thread using the client, which may not be the thread
+        which created it, e.g. with workers handling jobs concurrently
+        """
+        return get_session(self.endpoint, self.cert)
+
+    def request(self, method, path, data=None, raw=False, ok=(200, 201)):
+        """
+        Send a request to the API, return the decoded JSON response, or the
+        raw one. Raises APIError for responses whose status is not in ok.
+        """
+        headers = {'Accept': 'application/json'}
+        body = None
+        if data is not None:
+            body = json.dumps(data)
+            headers['Content-Type'] = 'application/json'
+        for attempt in range(2):
+            if self.token:
+                headers['Authorization'] = 'Bearer {}'.format(self.token)
+            try:
+                status, _, content = self.session.request(
+                    method, path, body, headers)
+            except (httplib.HTTPException, socket.error) as e:
+                raise APIError('{} {} failed: {}'.format(method, path, e))
+            if status != 401 or not self.token or attempt:
+                break
+            # the token expired or was revoked, login again, unless
+            # another worker of the host did already
+            self.logger.info('Openshift token refused, login again')
+            self.tokens.invalidate(self.endpoint, self.login_user,
+                                   self.token)
+            try:
+                self.login(self.login_user, self.login_password)
+            except OpenshiftError as e:
+                raise APIError('{} {} failed: {}'.format(method, path, e),
+                               status=status)
+        if status not in ok:
+            raise APIError('{} {} failed with status {}: {}'.format(
+                method, path, status, content[:500]), status=status)
+        if raw:
+            return content
+        return json.loads(content) if content else None
+
+    def login(self, user=None, password=None):
+        """
+        Login to openshift, getting a token of the user from the OAuth
+        server, as `oc login` does, unless a worker of the host did already,
+        see TokenCache.
+        """
+        user = user or self.user
+        password = password or self.password
+        self.login_user, self.login_password = user, password
+        self.token = self.tokens.get(self.endpoint, user)
+        if self.token:
+            return
+        self.logger.debug('Login to openshift as {}'.format(user))
+        try:
+            status, headers, _ = self.session.request(
+                'GET', '/oauth/authorize?' + urllib.urlencode({
+                    'response_type': 'token',
+                    'client_id': 'openshift-challenging-client'}), headers={
+                    'Authorization': 'Basic ' + base64.b64encode(
+                        '{}:{}'.format(user, password)),
+                    'X-CSRF-Token': '1'})
+        except (httplib.HTTPException, socket.error) as e:
+            raise OpenshiftError('Openshift login error: {}'.format(e))
+        fragment = urlparse.parse_qs(urlparse.urlsplit(
+            headers.get('location', '')).fragment)
+        if status != 302 or 'access_token' not in fragment:
+            raise OpenshiftError(
+                'Openshift login error: status {}'.format(status))
+        self.token = fragment['access_token'][0]
+        self.tokens.put(self.endpoint, user, self.token, int(fragment.get(
+            'expires_in', [settings.OPENSHIFT_TOKEN_TTL])[0]))
+
+    def get_project(self, project):
+        """Check whether a project exists, looking it up alone"""
+        self.logger.debug(
+            'Check openshift project: {} existing or not'.format(project))
+        try:
+            self.request('GET', '/oapi/v1/projects/{}'.format(project))
+        except APIError as e:
+            self.logger.debug('Error during fetching details for '
+                              'openshift project {}: {}'.format(project, e))
+            return False
+        return True
+
+    def get_projects(self, projects):
+        """Get the set of projects which exist, listing the projects once"""
+        try:
+            output = self.request('GET', '/oapi/v1/projects')
+        except APIError as e:
+            self.logger.error(
+                'Error during listing openshift projects: {}'.format(e))
+            return set()
+        return set(projects) & set(
+            item['metadata']['name'] for item in output.get('items') or [])
+
+    def wait_for_project_deletion(self, project, timeout, retry_delay=5):
+        """
+        Wait for a project to be gone, True if it was within timeout
+        seconds, watching its namespace until it is deleted. The project is
+        looked up every retry_delay seconds if it could not be watched.
+        """
+        deadline = time.time() + timeout
+        try:
+            while True:
+                try:
+                    namespace = self.request(
+                        'GET', '/api/v1/namespaces/{}'.format(project))
+                except APIError as e:
+                    if e.status == 404:
+                        return True
+                    raise
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                # request() may have logged in again, with a new token
+                headers = {'Authorization': 'Bearer {}'.format(self.token)}
+                for event in self.session.stream(
+                        '/api/v1/namespaces?{}'.format(urllib.urlencode({
+                            'watch': 'true',
+                            'fieldSelector': 'metadata.name={}'.format(
+                                project),
+                            'resourceVersion': namespace['metadata'].get(
+                                'resourceVersion', ''),
+                            'timeoutSeconds': int(math.ceil(min(
+                                remaining,
+                                settings.OPENSHIFT_WATCH_TIMEOUT)))})),
+                        headers):
+                    if event['type'] == 'DELETED':
+                        return True
+                    if event['type'] == 'ERROR':
+                        # e.g. the resource version is too old, start over
+                        break
+        except (APIError, httplib.HTTPException, socket.error, KeyError,
+                ValueError) as e:
+            self.logger.error('Could not watch project {}: {}'.format(
+                project, e))
+        return super(OpenshiftAPI, self).wait_for_project_deletion(
+            project, deadline - time.time(), retry_delay)
+
+    def create(self, project):
+        self.logger.debug('Create openshift project: {}'.format(project))
+        try:
+            self.request('POST', '/oapi/v1/projectrequests', {
+                'kind': 'ProjectRequest',
+                'apiVersion': 'v1',
+                'metadata': {'name': project},
+                'displayName': project,
+            })
+        except APIError as e:
+            raise OpenshiftError(
+                'Error during creating openshift project {}: {}'.format(
+                    project, e))
+
+    def delete(self, project):
+        self.logger.debug('Delete openshift project: {}'.format(project))
+        try:
+            self.request('DELETE', '/oapi/v1/projects/{}'.format(project))
+        except APIError as e:
+            raise OpenshiftError(
+                'Error during deleting openshift project {}: {}'.format(
+                    project, e))
+
+    def clean_project(self, project):
+        try:
+            for resource in ('builds', 'buildconfigs', 'imagestreams'):
+                path = '/oapi/v1/namespaces/{}/{}'.format(project, resource)
+                for item in self.request('GET', path).get('items') or []:
+                    self.request('DELETE', '{}/{}'.format(
+                        path, item['metadata']['name']), ok=(200, 404))
+        except APIError as e:
+            self.logger.error('Error during cleaning project {}: {}'.format(
+                project, e))
+
+    def upload_template(self, project, template_path, template_data):
+        """Upload processed template for project from template path."""
+        self.logger.debug('Uploading template data: {} for project: {} from '
+                          'template: {}'.format(
+                              template_data, project, template_path))
+        try:
+            with open(template_path) as f:
+                template = json.load(f)
+            for parameter in template.get('parameters') or []:
+                if parameter['name'] in template_data:
+                    parameter['value'] = template_data[parameter['name']]
+            processed = self.request(
+                'POST', '/oapi/v1/namespaces/{}/processedtemplates'.format(
+                    project), template)
+            for obj in processed.get('objects') or []:
+                self.request('POST', self.collection_path(project, obj), obj)
+        except (APIError, IOError, ValueError) as e:
+            raise OpenshiftError(
+                'Error during uploading processed template for project {}: {}'
+                .format(project, e))
+
+    @staticmethod
+    def collection_path(project, obj):
+        """Path to create obj at, e.g. /oapi/v1/namespaces/p/buildconfigs"""
+        api = 'api' if obj['kind'] in KUBERNETES_KINDS else 'oapi'
+        return '/{}/{}/namespaces/{}/{}s'.format(
+            api, obj.get('apiVersion') or 'v1', project, obj['kind'].lower())
+
+    def build(self, project, build):
+        """Run build for a project"""
+        self.logger.debug('Run openshift project build: {}/{}'
+                          .format(build, project))
+        try:
+            output = self.request(
+                'POST', '/oapi/v1/namespaces/{}/buildconfigs/{}/instantiate'
+                .format(project, build), {
+                    'kind': 'BuildRequest',
+                    'apiVersion': 'v1',
+                    'metadata': {'name': build},
+                })
+        except APIError as e:
+            raise OpenshiftError(
+                'Unable to run build project build: {}/{}\nError: {}'
+                .format(project, build, e))
+        build_id = output['metadata']['name']
+        self.logger.info('Openshift project build run: {}/{}'.format(
+            project, build_id))
+        return build_id
+
+    def get_build(self, project, build_id):
+        return self.request('GET', '/oapi/v1/namespaces/{}/builds/{}'.format(
+            project, build_id))
+
+    def get_build_status(self, project, build_id, status_index=None):
+        """
+        Get status of an openshift project build. status_index is the column
+        of the status in `oc get build`, which is not needed here.
+        """
+        metrics.inc('pipeline_openshift_polls_total')
+        try:
+            status = self.get_build(project, build_id)['status']['phase']
+        except (APIError, KeyError) as e:
+            self.logger.error(
+                'Openshift build status fetch error for {}/{}: {}'
+                .format(project, build_id, e))
+            return ""
+        self.logger.info('Openshift build status for: {}/{}: {}'.format(
+            project, build_id, status))
+        return status
+
+    def list_builds(self):
+        """
+        Get the status of the builds of all the projects, as
+        {'<project>/<build id>': phase}, None if they could not be listed
+        """
+        metrics.inc('pipeline_openshift_lists_total')
+        try:
+            return {
+                '{}/{}'.format(item['metadata']['namespace'],
+                               item['metadata']['name']):
+                item['status']['phase']
+                for item in self.request('GET', '/oapi/v1/builds')['items']}
+        except (APIError, KeyError) as e:
+            self.logger.error('Openshift builds list error: {}'.format(e))
+            return None
+
+    def watch_build(self, project, build_id):
+        """
+        Watch a build until it is done and return the phase it ended in,
+        None if it could not be watched. The watch is restarted from the
+        current state of the build when the server ends it, every
+        OPENSHIFT_WATCH_TIMEOUT seconds at most.
+        """
+        try:
+            while True:
+                build = self.get_build(project, build_id)
+                phase = build['status']['phase']
+                if phase in BUILD_TERMINAL_PHASES:
+                    return phase
+                # get_build() may have logged in again, with a new token
+                headers = {'Authorization': 'Bearer {}'.format(self.token)}
+                metrics.inc('pipeline_openshift_watches_total')
+                for event in self.session.stream(
+                        '/oapi/v1/namespaces/{}/builds?{}'.format(
+                            project, urllib.urlencode({
+                                'watch': 'true',
+                                'fieldSelector': 'metadata.name={}'.format(
+                                    build_id),
+                                'resourceVersion': build['metadata'].get(
+                                    'resourceVersion', ''),
+                                'timeoutSeconds':
+                                    settings.OPENSHIFT_WATCH_TIMEOUT})),
+                        headers):
+                    if event['type'] == 'ERROR':
+                        # e.g. the resource version is too old, start over
+                        break
+                    phase = event['object']['status']['phase']
+                    self.logger.info('Openshift build status for: {}/{}: {}'
+                                     .format(project, build_id, phase))
+                    if phase in BUILD_TERMINAL_PHASES:
+                        return phase
+        except (APIError, httplib.HTTPException, socket.error, KeyError,
+                ValueError) as e:
+            self.logger.error('Could not watch build {}/{}: {}'.format(
+                project, build_id, e))
+            return None
+
+    def get_build_image_digest(self, project, build_id):
+        """Get digest of the image pushed by an openshift project build"""
+        try:
+            build = self.get_build(project, build_id)
+        except APIError as e:
+            self.logger.error(
+                'Openshift build image digest fetch error for {}/{}: {}'
+                .format(project, build_id, e))
+            return ""
+        return ((build.get('status') or {}).get('output') or {}).get(
+            'to', {}).get('imageDigest', '')
+
+    def get_build_logs(self, project, build_id, build_type="build"):
+        try:
+            output = self.request(
+                'GET', '/oapi/v1/namespaces/{}/builds/{}/log'.format(
+                    project, build_id), raw=True)
+            self.logger.debug('Build logs for project build: {}/{}\n{}'.format(
+                project, build_id, output))
+        except APIError as e:
+            self.logger.error(
+                'Could not retrieve {} phase logs for project build: '
+                '{}/{}\n{}'.format(build_type, project, build_id, e))
+            output = 'Could not retrieve %s phase logs.' % build_type
+        return output
+
+    def delete_pods(self, project, build_id):
+        """
+        Deletes the pod of the build from OpenShift for the provided project
+        and build_id.
+        """
+        try:
+            self.logger.debug("Deleting pods for project build: {}/{}"
+                              .format(project, build_id))
+            self.request('DELETE', '/api/v1/namespaces/{}/pods/{}-build'
+                         .format(project, build_id))
+            self.logger.info("Deleted pods for project build: {}/{}"
+                             .format(project, build_id))
+        except APIError as e:
+            self.logger.error(
+                'Could not delete pods for project build: '
+                '{}/{}\n{}'.format(project, build_id, e)
+            )
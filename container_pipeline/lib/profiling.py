@@ -0,0 +1,69 @@
+"""
+This module contains the profiling hook of the container pipeline service,
+which runs the handling of a job under cProfile, to find out where a slow
+worker spends its time in production.
+"""
+import contextlib
+import cProfile
+import os
+import pstats
+import threading
+import time
+from StringIO import StringIO
+
+from container_pipeline.lib import settings
+
+_local = threading.local()
+
+
+def enabled(job):
+    """Whether the handling of job is to be profiled"""
+    return settings.PROFILE_JOBS or bool(job.get('profile'))
+
+
+@contextlib.contextmanager
+def profile(name, job, logger):
+    """
+    Profile the code run in the block, if profiling is enabled for the job,
+    see enabled(). The profile is dumped to <name>.<timestamp>.prof in the
+    logs_dir of the job, next to its service debug log, and the functions
+    the most time was spent in are logged.
+
+    A block run while its thread is profiled already is part of that
+    profile, as cProfile runs one profiler per thread at a time.
+    """
+    if not enabled(job) or getattr(_local, 'active', False):
+        yield
+        return
+    profiler = cProfile.Profile()
+    _local.active = True
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _local.active = False
+        dump(profiler, name, job, logger)
+
+
+def dump(profiler, name, job, logger):
+    """Write profile to the logs_dir of job, and log its top functions"""
+    stream = StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats('cumulative').print_stats(settings.PROFILE_TOP)
+    logger.info('Profile of {} for job {}:\n{}'.format(
+        name, job.get('uuid'), stream.getvalue()))
+
+    logs_dir = job.get('logs_dir')
+    if not logs_dir:
+        return
+    path = os.path.join(logs_dir, '{}.{}.prof'.format(
+        name, time.strftime('%Y%m%d%H%M%S')))
+    try:
+        if not os.path.exists(logs_dir):
+            os.makedirs(logs_dir)
+        stats.dump_stats(path)
+    except (IOError, OSError) as e:
+        logger.error('Failed to write profile to {}: {}'.format(path, e))
+    else:
+        logger.info('Wrote profile to {}'.format(path))
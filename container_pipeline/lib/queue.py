@@ -1,9 +1,35 @@
 import logging
+import math
+import threading
 import time
 
+from container_pipeline.lib import settings
+from container_pipeline.lib.job import encode
 from container_pipeline.vendors import beanstalkc
 
 
+# Actions a job can ask for. The name of the tube and the action are same.
+ACTIONS = ('start_build', 'start_test', 'start_scan', 'start_delivery',
+           'notify_user', 'report_scan_results', 'start_linter',
+           'tracking')
+
+# beanstalkd priorities for the priority classes of jobs, lower is more
+# urgent. Builds triggered by users go before rebuilds due to RPM or parent
+# image updates, which go before the weekly scans.
+PRIORITIES = {
+    'interactive': 1000,
+    'rebuild': 2000,
+    'weekly': 3000,
+}
+DEFAULT_PRIORITY_CLASS = 'interactive'
+
+
+def get_priority(job):
+    """Get beanstalkd priority for the priority class of a job"""
+    return PRIORITIES.get(job.get('priority'),
+                          PRIORITIES[DEFAULT_PRIORITY_CLASS])
+
+
 class QueueException(Exception):
     pass
 
@@ -13,26 +39,35 @@ class QueueEmptyException(QueueException):
 
 
 def retry(delay=30):
-    """Decorator to handle beanstalkd outage and recover"""
+    """
+    Decorator to handle beanstalkd outage and recover. Queues with
+    max_attempts give up after that many attempts instead, raising the
+    error, and connect again on their next call.
+    """
     def _retry(func):
         def wrapper(*args, **kwargs):
+            obj = args[0]
             error_logged = False
+            attempts = 0
             while True:
+                attempts += 1
                 try:
+                    if obj._conn is None and func.__name__ != '_initialize':
+                        obj._initialize()
                     return func(*args, **kwargs)
                 except beanstalkc.SocketError:
-                    obj = args[0]
                     if not error_logged:
                         obj.logger.warning(
                             'Lost connection to beanstalkd at {}:{}'
                             .format(obj.host, obj.port)
                         )
                         error_logged = True
+                    if obj._give_up(attempts):
+                        raise
                     time.sleep(delay)
                     if func != obj._initialize:
                         obj._initialize()
                 except beanstalkc.DeadlineSoon as e:
-                    obj = args[0]
                     obj.logger.warning(e)
                     time.sleep(delay)
                 except QueueEmptyException as e:
@@ -41,8 +76,9 @@ def retry(delay=30):
                 except AttributeError as ae:
                     # this is to log issues where methods
                     # on object self._conn reports attribute error
-                    obj = args[0]
                     obj.logger.warning(str(ae))
+                    if obj._give_up(attempts):
+                        raise
                     time.sleep(delay)
                     # the attribute error is not valid for _initialize method
                     if func != obj._initialize:
@@ -54,45 +90,292 @@ def retry(delay=30):
 
 class JobQueue:
     """Abstraction layer around job queue"""
-    def __init__(self, host, port, sub, pub=None, logger=None):
+    def __init__(self, host, port, sub, pub=None, logger=None,
+                 reserve_timeout=None, max_attempts=None):
         self.host = host
         self.port = port
         self.sub = sub
         self.pub = pub or self.sub
         self.logger = logger or logging.getLogger('console')
+        self.reserve_timeout = reserve_timeout or \
+            settings.BEANSTALKD_RESERVE_TIMEOUT
         self._conn = None
-        self._initialize()
+        # tube the connection currently puts jobs to
+        self._using = None
+        # beanstalkc connections are not thread safe, and a heartbeat
+        # thread touches reserved jobs while the worker puts new ones
+        self._lock = threading.RLock()
+        # attempts of a call before giving up, for callers which have better
+        # to do than wait for beanstalkd, see retry(). They connect on first
+        # use, so that creating the queue does not fail.
+        self.max_attempts = max_attempts
+        if not max_attempts:
+            self._initialize()
 
     @retry()
-    def get(self):
-        """Get job from subscribed tube"""
-        if self._conn.stats_tube(self.sub)['current-jobs-ready'] > 0:
-            return self._conn.reserve()
-        raise QueueEmptyException('No job in queue')
+    def get(self, timeout=None):
+        """
+        Get job from subscribed tube. This blocks in beanstalkd's
+        reserve-with-timeout, so the caller wakes up as soon as a job is
+        ready. The reserve timeout only bounds how long we trust an idle
+        connection before issuing the reserve again. With a timeout (in
+        seconds), None is returned if no job got ready in time.
+        """
+        while True:
+            with self._lock:
+                job = self._conn.reserve(
+                    timeout=self.reserve_timeout if timeout is None
+                    else timeout)
+            if job or timeout is not None:
+                return job
 
     @retry()
-    def put(self, data, tube=None):
-        """Put job to tube"""
-        if tube:
-            self._conn.use(tube)
-        self.logger.debug('Put data to tube {}: {}'.format(tube, data))
-        self._conn.put(data)
-        self._conn.use(self.sub)
+    def put(self, data, tube=None, delay=0,
+            priority=beanstalkc.DEFAULT_PRIORITY):
+        """
+        Put job to tube and return its id. With a delay (in seconds),
+        beanstalkd holds the job back and only makes it ready once the delay
+        has passed, so nobody has to sleep on it. The job's time to run is
+        looked up for the tube in BEANSTALKD_TUBE_TTR.
+        """
+        tube = tube or self.pub
+        ttr = settings.BEANSTALKD_TUBE_TTR.get(
+            tube, settings.BEANSTALKD_DEFAULT_TTR)
+        self.logger.debug('Put data to tube {} with delay {}s: {}'.format(
+            tube, delay, data))
+        with self._lock:
+            self._use(tube)
+            return self._conn.put(data, priority=priority,
+                                  delay=int(math.ceil(delay)), ttr=ttr)
+
+    def put_many(self, data_list, tube=None, delay=0,
+                 priority=beanstalkc.DEFAULT_PRIORITY, batch_size=100):
+        """
+        Put many jobs to a tube and return their ids. The put commands are
+        pipelined in batches, so a batch costs a single round trip to
+        beanstalkd instead of one per job. If the connection breaks, it is
+        opened again and the batch it broke in is put again, so only jobs
+        of that batch may be put twice. Jobs refused by beanstalkd do not
+        stop the others from being put, QueueException is raised once they
+        all were.
+        """
+        tube = tube or self.pub
+        ttr = settings.BEANSTALKD_TUBE_TTR.get(
+            tube, settings.BEANSTALKD_DEFAULT_TTR)
+        jids = []
+        refused = 0
+        start = 0
+        while start < len(data_list):
+            batch = data_list[start:start + batch_size]
+            try:
+                if self._conn is None:
+                    self._initialize()
+                with self._lock:
+                    self._use(tube)
+                    batch_jids = self._conn.put_many(
+                        batch, priority=priority,
+                        delay=int(math.ceil(delay)), ttr=ttr)
+            except beanstalkc.SocketError:
+                self.logger.warning(
+                    'Lost connection to beanstalkd at {}:{}, putting the '
+                    'jobs from {} on again'.format(
+                        self.host, self.port, start))
+                self._initialize()
+                continue
+            jids.extend(jid for jid in batch_jids if jid is not None)
+            refused += batch_jids.count(None)
+            start += batch_size
+        self.logger.debug('Put {} jobs to tube {}'.format(len(jids), tube))
+        if refused:
+            raise QueueException(
+                'beanstalkd refused {} of the {} jobs put to tube {}'.format(
+                    refused, len(data_list), tube))
+        return jids
+
+    def put_job(self, job, delay=0, tube=None):
+        """
+        Put job (a Job or a dictionary) to the tube for its action, unless
+        tube is given. With BEANSTALKD_DIRECT_ROUTING the job goes straight
+        to that tube, else it goes to master_tube for the dispatcher worker
+        to move it. The priority comes from the job's priority class. The
+        job is stamped with the time it is ready, once its delay passed, so
+        that the worker getting it knows how long it waited.
+        """
+        job['enqueued_at'] = time.time() + delay
+        return self.put(encode(job), tube or self.route(job.get('action')),
+                        delay=delay, priority=get_priority(job))
+
+    def route(self, action):
+        """Get the tube to put a job with the given action to"""
+        if settings.BEANSTALKD_DIRECT_ROUTING and action in ACTIONS:
+            return action
+        return 'master_tube'
+
+    @retry()
+    def release(self, job, delay=0):
+        """Release a reserved job back to its tube, optionally delayed"""
+        with self._lock:
+            job.release(delay=int(math.ceil(delay)))
 
     @retry()
     def delete(self, job):
         """Delete job from queue"""
-        job.delete()
+        with self._lock:
+            job.delete()
+
+    @retry()
+    def bury(self, job):
+        """
+        Bury a reserved job. It stays in its tube, but nobody reserves it
+        until it is kicked or replayed.
+        """
+        with self._lock:
+            job.bury()
+
+    @retry()
+    def stats_tube(self, tube):
+        """Get statistics of a tube, None if the tube does not exist"""
+        with self._lock:
+            try:
+                return self._conn.stats_tube(tube)
+            except beanstalkc.CommandFailed:
+                return None
+
+    @retry()
+    def stats_job(self, job):
+        """
+        Get statistics of a job, or of the job with that id, None if the
+        job does not exist
+        """
+        with self._lock:
+            try:
+                if isinstance(job, (int, long)):
+                    return self._conn.stats_job(job)
+                return job.stats()
+            except beanstalkc.CommandFailed:
+                return None
+
+    @retry()
+    def peek_buried(self, tube):
+        """Get the next buried job of a tube, if any, without reserving it"""
+        with self._lock:
+            self._use(tube)
+            return self._conn.peek_buried()
+
+    @retry()
+    def kick_job(self, jid):
+        """
+        Make a delayed or buried job ready now. Return False if there is no
+        such job, or it is not delayed nor buried.
+        """
+        try:
+            with self._lock:
+                self._conn.kick_job(jid)
+        except beanstalkc.CommandFailed:
+            return False
+        return True
+
+    def touch(self, job):
+        """
+        Ask beanstalkd for more time to process a reserved job. This is not
+        retried: if the connection is gone, so is the reservation.
+        """
+        try:
+            with self._lock:
+                job.touch()
+        except beanstalkc.BeanstalkcException as e:
+            self.logger.warning('Failed to touch job {}: {}'.format(
+                job.jid, e))
+
+    def _use(self, tube):
+        """Switch the tube jobs are put to, unless it's the current one"""
+        if tube != self._using:
+            self._conn.use(tube)
+            self._using = tube
+
+    def _give_up(self, attempts):
+        """
+        Whether a call failed max_attempts times, then the connection is
+        dropped to be opened again on the next call
+        """
+        if not self.max_attempts or attempts < self.max_attempts:
+            return False
+        with self._lock:
+            if self._conn:
+                self._conn.close()
+            self._conn = None
+        return True
 
     @retry()
     def _initialize(self):
         """Initialize connection to queue backend"""
-        if self._conn:
-            self._conn.close()
-            del self._conn
-            self._conn = None
-        self._conn = beanstalkc.Connection(host=self.host, port=self.port)
-        self._conn.watch(self.sub)
-        self._conn.use(self.pub)
+        with self._lock:
+            if self._conn:
+                self._conn.close()
+                del self._conn
+                self._conn = None
+            self._conn = beanstalkc.Connection(host=self.host, port=self.port)
+            self._using = 'default'
+            # a queue without subscription is only used to put jobs
+            if self.sub:
+                self._conn.watch(self.sub)
+                # Every connection watches the 'default' tube to start with.
+                # Ignore it, else a blocking reserve would also pick jobs
+                # from there.
+                if self.sub != 'default':
+                    self._conn.ignore('default')
+            if self.pub:
+                self._use(self.pub)
         self.logger.info('Connection to beanstalkd at {}:{} initialized'
                          .format(self.host, self.port))
+
+
+_pool = threading.local()
+
+
+def get_queue(host=None, port=None, logger=None):
+    """
+    Get a queue to put jobs with. Queues are shared by everything running
+    in the same thread of the process, one per beanstalkd server, so that
+    callers putting jobs now and then don't open a connection each time.
+    beanstalkc connections aren't thread safe, hence not one per process.
+    """
+    host = host or settings.BEANSTALKD_HOST
+    port = port or settings.BEANSTALKD_PORT
+    queues = _pool.__dict__.setdefault('queues', {})
+    if (host, port) not in queues:
+        queues[(host, port)] = JobQueue(host, port, sub=None, logger=logger)
+    return queues[(host, port)]
+
+
+class JobHeartbeat(threading.Thread):
+    """
+    Touch a reserved job at regular intervals, so that beanstalkd does not
+    release it to another worker while it is still being processed. The
+    on_beat callable, if any, is called along, e.g. to renew other leases.
+    """
+
+    def __init__(self, queue, job, interval=None, on_beat=None):
+        super(JobHeartbeat, self).__init__()
+        self.daemon = True
+        self.queue = queue
+        self.job = job
+        self.interval = interval or settings.JOB_HEARTBEAT_INTERVAL
+        self.on_beat = on_beat
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.queue.touch(self.job)
+            if self.on_beat:
+                try:
+                    self.on_beat()
+                except Exception as e:
+                    self.queue.logger.warning(
+                        'Heartbeat of job {} failed: {}'.format(
+                            self.job.jid, e))
+
+    def stop(self):
+        """Stop touching the job"""
+        self._stopped.set()
+        self.join()
@@ -0,0 +1,75 @@
+"""
+This module contains the fair share scheduler of the container pipeline
+service, which keeps a namespace with a lot of jobs from making the jobs of
+other namespaces wait behind all of its own.
+"""
+import collections
+
+
+class FairShareScheduler(object):
+    """
+    Weighted round robin over first in first out sub-queues, one per key.
+    Every key with items waiting gets up to its weight items popped in turn,
+    so an item waits for at most the weights of the other keys per item
+    ahead of it in its own sub-queue, however many items other keys have.
+    Items of a more urgent priority, lower is more urgent as in beanstalkd,
+    are popped before any item of a less urgent one.
+    """
+
+    def __init__(self, weights=None, default_weight=1):
+        self.weights = weights or {}
+        self.default_weight = default_weight
+        # priority -> key -> items of the key, keys in round robin order
+        self._queues = {}
+        # priority -> items the key at the head of the round can still pop
+        self._credits = {}
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def weight(self, key):
+        return max(1, self.weights.get(key, self.default_weight))
+
+    def push(self, key, item, priority=0):
+        """Add item to the sub-queue of key"""
+        queues = self._queues.setdefault(
+            priority, collections.OrderedDict())
+        if key not in queues:
+            queues[key] = collections.deque()
+        queues[key].append(item)
+        self._size += 1
+
+    def pop(self):
+        """
+        Remove and return the next (key, item) to be handled, None if no
+        item is waiting.
+        """
+        if not self._size:
+            return None
+        priority = min(self._queues)
+        queues = self._queues[priority]
+        key, items = next(iter(queues.items()))
+        credit = self._credits.get(priority) or self.weight(key)
+        item = items.popleft()
+        self._size -= 1
+        credit -= 1
+        if not items:
+            del queues[key]
+            credit = 0
+        elif not credit:
+            # move the key to the end of the round
+            del queues[key]
+            queues[key] = items
+        self._credits[priority] = credit
+        if not queues:
+            del self._queues[priority]
+            del self._credits[priority]
+        return key, item
+
+    def items(self):
+        """All the items waiting, in no particular order"""
+        for queues in self._queues.values():
+            for items in queues.values():
+                for item in items:
+                    yield item
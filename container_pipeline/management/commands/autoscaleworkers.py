@@ -0,0 +1,187 @@
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from container_pipeline.lib import metrics
+from container_pipeline.lib.queue import ACTIONS, JobQueue
+
+logger = logging.getLogger('autoscaler')
+
+
+class WorkerPool(object):
+    """
+    Worker processes consuming a tube, scaled between min and max
+    """
+
+    def __init__(self, tube, script, min, max):
+        self.tube = tube
+        self.script = script
+        self.min = min
+        self.max = max
+        self.processes = []
+        # reaped workers, until they exited
+        self.stopping = []
+        # since when the tube needs fewer workers than are running
+        self.surplus_since = None
+        self.spawned = 0
+        self.reaped = 0
+        self.crashed = 0
+        self.last_decision = None
+
+    def desired(self, stats):
+        """Number of workers the tube needs, given its stats"""
+        jobs = (stats.get('current-jobs-ready', 0) +
+                stats.get('current-jobs-reserved', 0))
+        needed = -(-jobs // settings.AUTOSCALER_JOBS_PER_WORKER)
+        return max(self.min, min(self.max, needed))
+
+    def collect(self):
+        """Forget about the workers which exited"""
+        self.stopping = [p for p in self.stopping if p.poll() is None]
+        for process in list(self.processes):
+            if process.poll() is not None:
+                logger.warning('{} worker {} exited with code {}'.format(
+                    self.tube, process.pid, process.returncode))
+                self.processes.remove(process)
+                self.crashed += 1
+        metrics.gauge('pipeline_autoscaler_workers_running',
+                      len(self.processes), tube=self.tube)
+
+    def scale(self, stats, now):
+        """Spawn or reap workers so that the tube has as many as it needs"""
+        self.collect()
+        desired = self.desired(stats)
+        running = len(self.processes)
+        metrics.gauge('pipeline_autoscaler_workers_desired', desired,
+                      tube=self.tube)
+        if desired > running:
+            self.surplus_since = None
+            for _ in range(desired - running):
+                self.spawn()
+            self.decide('spawned', running, desired, stats)
+        elif desired < running:
+            if self.surplus_since is None:
+                self.surplus_since = now
+            if now - self.surplus_since >= \
+                    settings.AUTOSCALER_SCALE_DOWN_DELAY:
+                for _ in range(running - desired):
+                    self.reap()
+                self.surplus_since = None
+                self.decide('reaped', running, desired, stats)
+        else:
+            self.surplus_since = None
+        metrics.gauge('pipeline_autoscaler_workers_running',
+                      len(self.processes), tube=self.tube)
+
+    def spawn(self):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [
+            os.path.dirname(settings.BASE_DIR), env.get('PYTHONPATH')]))
+        process = subprocess.Popen([sys.executable, self.script], env=env)
+        self.processes.append(process)
+        self.spawned += 1
+
+    def reap(self):
+        # newest first, the oldest workers were kept for the baseline load
+        process = self.processes.pop()
+        process.terminate()
+        self.stopping.append(process)
+        self.reaped += 1
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes + self.stopping:
+            process.wait()
+        self.processes = []
+        self.stopping = []
+
+    def decide(self, action, running, desired, stats):
+        self.last_decision = {
+            'action': action,
+            'from': running,
+            'to': desired,
+            'ready': stats.get('current-jobs-ready', 0),
+            'reserved': stats.get('current-jobs-reserved', 0),
+            'time': time.time(),
+        }
+        metrics.inc('pipeline_autoscaler_decisions_total', abs(
+            desired - running), tube=self.tube, action=action)
+        logger.info('{}: {} workers {} -> {} ({} ready, {} reserved)'.format(
+            self.tube, action, running, desired,
+            self.last_decision['ready'], self.last_decision['reserved']))
+
+    def status(self, stats):
+        return {
+            'min': self.min,
+            'max': self.max,
+            'running': len(self.processes),
+            'stopping': len(self.stopping),
+            'desired': self.desired(stats),
+            'ready': stats.get('current-jobs-ready', 0),
+            'reserved': stats.get('current-jobs-reserved', 0),
+            'spawned': self.spawned,
+            'reaped': self.reaped,
+            'crashed': self.crashed,
+            'last_decision': self.last_decision,
+        }
+
+
+class Command(BaseCommand):
+    help = ('Run pipeline workers, scaling each type between its bounds by '
+            'the depth of its tube')
+
+    def handle(self, *args, **options):
+        pools = [
+            WorkerPool(tube, **settings.AUTOSCALER_WORKERS[tube])
+            for tube in ACTIONS if tube in settings.AUTOSCALER_WORKERS]
+        # a single attempt at the stats, rather than retrying until
+        # beanstalkd is back, the loop tries again in a while
+        queue = JobQueue(settings.BEANSTALKD_HOST, settings.BEANSTALKD_PORT,
+                         sub=None, logger=logger, max_attempts=1)
+
+        def terminate(signum, frame):
+            raise SystemExit(0)
+        signal.signal(signal.SIGTERM, terminate)
+
+        logger.info('Scaling workers of tubes: {}'.format(
+            ', '.join(pool.tube for pool in pools)))
+        try:
+            while True:
+                status = {}
+                now = time.time()
+                for pool in pools:
+                    try:
+                        # None until a job was ever put on the tube
+                        stats = queue.stats_tube(pool.tube) or {}
+                    except Exception as e:
+                        # keep the workers as they are until it recovers
+                        logger.error('Could not get stats of tube {}: {}'
+                                     .format(pool.tube, e))
+                        pool.collect()
+                        continue
+                    pool.scale(stats, now)
+                    status[pool.tube] = pool.status(stats)
+                self.export_status(status)
+                time.sleep(settings.AUTOSCALER_INTERVAL)
+        finally:
+            logger.info('Stopping workers')
+            for pool in pools:
+                pool.stop()
+
+    def export_status(self, status):
+        """
+        Export the autoscaler status and decisions, for monitoring
+        """
+        try:
+            with open(settings.AUTOSCALER_STATUS_FILE, 'w') as f:
+                json.dump(status, f, indent=4, sort_keys=True)
+        except IOError as e:
+            logger.error('Failed to write autoscaler status: {}'.format(e))
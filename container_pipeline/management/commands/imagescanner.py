@@ -5,6 +5,7 @@ import sys
 from django.utils import timezone
 from django.conf import settings
 
+from container_pipeline.lib.job import decode
 from container_pipeline.lib.queue import JobQueue
 
 from container_pipeline.models.tracking import Package,\
@@ -126,7 +127,7 @@ class Command(BaseCommand):
                     try:
                         job = queue.get()
                         try:
-                            job_details = json.loads(job.body)
+                            job_details = decode(job.body)
                         except ValueError:
                             logger.error(
                                 'Error in loading job body: %s' % job.body)
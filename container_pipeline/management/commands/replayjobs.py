@@ -0,0 +1,68 @@
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from container_pipeline.lib.job import decode
+from container_pipeline.lib.queue import ACTIONS, JobQueue
+
+logger = logging.getLogger('console')
+
+
+class Command(BaseCommand):
+    help = ('Replay jobs buried after failing too often, from the phase '
+            'they failed in')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'tubes', nargs='*',
+            help='Tubes to replay buried jobs of (default: all pipeline '
+                 'tubes, master_tube and the fair share build tube)')
+        parser.add_argument(
+            '--list', action='store_true', dest='list',
+            help='Only list the buried jobs')
+
+    def handle(self, *args, **options):
+        tubes = options['tubes'] or (
+            ('master_tube',) + ACTIONS + (settings.BUILD_FAIR_SHARE_TUBE,))
+        queue = JobQueue(host=settings.BEANSTALKD_HOST,
+                         port=settings.BEANSTALKD_PORT,
+                         sub='master_tube', logger=logger)
+        for tube in tubes:
+            if options['list']:
+                self.list_buried(queue, tube)
+            else:
+                self.replay_buried(queue, tube)
+
+    def list_buried(self, queue, tube):
+        """List buried jobs of a tube, the next to be replayed first"""
+        stats = queue.stats_tube(tube) or {}
+        self.stdout.write('{}: {} buried job(s)'.format(
+            tube, stats.get('current-jobs-buried', 0)))
+        job_obj = queue.peek_buried(tube)
+        if job_obj:
+            self.stdout.write('  next: {}'.format(job_obj.body))
+
+    def replay_buried(self, queue, tube):
+        """
+        Put buried jobs of a tube back to it, with a fresh retry counter,
+        so that they are handled again in the phase they failed in.
+        """
+        replayed = 0
+        while True:
+            job_obj = queue.peek_buried(tube)
+            if not job_obj:
+                break
+            try:
+                job = decode(job_obj.body)
+            except ValueError:
+                # it can't be replayed, and would be peeked over and over
+                logger.error('Deleting job {} of tube {} with invalid body: '
+                             '{}'.format(job_obj.jid, tube, job_obj.body))
+                queue.delete(job_obj)
+                continue
+            job['attempts'] = 0
+            queue.put_job(job, tube=tube)
+            queue.delete(job_obj)
+            replayed += 1
+        self.stdout.write('{}: replayed {} job(s)'.format(tube, replayed))
@@ -0,0 +1,111 @@
+import json
+import logging
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from container_pipeline.lib import metrics
+from container_pipeline.lib.build_status import (
+    BUILD_TERMINAL_PHASES, get_build_status_poller)
+from container_pipeline.lib.openshift import OpenshiftError, get_openshift
+from container_pipeline.lib.queue import ACTIONS, JobQueue
+
+logger = logging.getLogger('metrics')
+
+# tubes whose jobs are counted, besides the ones of the actions
+TUBES = ACTIONS + ('master_tube', settings.BUILD_FAIR_SHARE_TUBE)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Serves the metrics of the pipeline processes, and the stats of the tubes
+    read from beanstalkd at scrape time, on /metrics, and the status of the
+    builds in flight as JSON on /builds
+    """
+
+    openshift = None
+    # a single attempt at the stats, so that scrapes do not hang while
+    # beanstalkd is down
+    queue = None
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == '/metrics':
+            self.metrics()
+        elif path == '/builds':
+            self.builds()
+        else:
+            self.send_error(404)
+
+    def metrics(self):
+        try:
+            if MetricsHandler.queue is None:
+                MetricsHandler.queue = JobQueue(
+                    settings.BEANSTALKD_HOST, settings.BEANSTALKD_PORT,
+                    sub=None, logger=logger, max_attempts=1)
+            gauges = metrics.tube_gauges(MetricsHandler.queue, TUBES)
+        except Exception as e:
+            logger.error('Could not get stats of tubes: {}'.format(e))
+            gauges = []
+        builds = self.get_builds()
+        if builds is not None:
+            gauges.extend(metrics.build_gauges(builds))
+        self.respond(metrics.collect().render(gauges),
+                     'text/plain; version=0.0.4')
+
+    def builds(self):
+        builds = self.get_builds()
+        if builds is None:
+            self.send_error(503, 'Could not list the builds')
+            return
+        self.respond(json.dumps({
+            'time': get_build_status_poller().updated,
+            'builds': {key: phase for key, phase in builds.items()
+                       if phase not in BUILD_TERMINAL_PHASES},
+        }, indent=2, sort_keys=True), 'application/json')
+
+    def get_builds(self):
+        """
+        Status of the builds of all the projects, listed at most every
+        OPENSHIFT_POLL_INTERVAL seconds by the workers or by us
+        """
+        cls = type(self)
+        try:
+            if cls.openshift is None:
+                openshift = get_openshift(logger=logger)
+                openshift.login()
+                cls.openshift = openshift
+        except OpenshiftError as e:
+            logger.error('Could not login to Openshift: {}'.format(e))
+            return None
+        builds = get_build_status_poller().snapshot(cls.openshift)
+        if builds is None:
+            # login again next time, in case it expired
+            cls.openshift = None
+        return builds
+
+    def respond(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class Command(BaseCommand):
+    help = ('Serve metrics of the pipeline workers and tubes in the '
+            'Prometheus text format, and the builds in flight')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=settings.METRICS_PORT)
+
+    def handle(self, *args, **options):
+        # one request at a time, scrapes are few and share the connection
+        # to beanstalkd
+        server = HTTPServer(('', options['port']), MetricsHandler)
+        logger.info('Serving metrics on port {}'.format(options['port']))
+        server.serve_forever()
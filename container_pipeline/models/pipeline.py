@@ -78,6 +78,10 @@ class Build(models.Model):
 
     trigger = models.TextField(max_length=125, default=None,
                                null=True, blank=True)
+    # Jenkins build numbers of triggers merged into this build while it was
+    # queued, one per line, see pipeline.coalesce_build()
+    coalesced_triggers = models.TextField(default=None, null=True,
+                                          blank=True)
 
     created = models.DateTimeField(auto_now_add=True, blank=True)
     last_updated = models.DateTimeField(auto_now=True, blank=True)
@@ -94,6 +98,30 @@ class Build(models.Model):
         return '{}:{}'.format(self.project, self.uuid)
 
 
+class BuildLock(models.Model):
+    """
+    This model is used to store the leases marking builds of images as
+    running, see container_pipeline.utils.BuildTracker. A lease is held
+    until it expires, unless it is renewed.
+    """
+    name = models.CharField(max_length=200, unique=True, db_index=True)
+    expires = models.DateTimeField(db_index=True)
+    # ids of the queue jobs parked until the build completes, one per line
+    waiters = models.TextField(default='', blank=True)
+    # id of the queue job carrying the build to its next phase
+    jid = models.IntegerField(null=True, blank=True)
+
+    created = models.DateTimeField(auto_now_add=True, blank=True)
+    last_updated = models.DateTimeField(auto_now=True, blank=True)
+
+    class Meta:
+        app_label = 'container_pipeline'
+        db_table = 'build_locks'
+
+    def __str__(self):
+        return self.name
+
+
 class BuildPhase(models.Model):
     """
     This model is used to store information about every phase of
@@ -122,6 +150,9 @@ class BuildPhase(models.Model):
                               db_index=True, blank=True)
     log_file_path = models.CharField(max_length=100, blank=True, null=True,
                                      default=None)
+    # artifacts of the phase once completed, as JSON, e.g. the digest of the
+    # built image, see BaseWorker.checkpoint()
+    artifacts = models.TextField(default=None, blank=True, null=True)
 
     start_time = models.DateTimeField(default=None, blank=True, null=True)
     end_time = models.DateTimeField(default=None, blank=True, null=True)
@@ -137,6 +168,28 @@ class BuildPhase(models.Model):
         return '{}:{}'.format(self.build, self.phase)
 
 
+class PhaseTiming(models.Model):
+    """
+    This model is used to store how long the steps of a build phase took,
+    e.g. waiting in the queue, starting the Openshift build or exporting
+    its logs, see BaseWorker.span().
+    """
+    build_phase = models.ForeignKey(BuildPhase, related_name='timings')
+    name = models.CharField(max_length=50, db_index=True)
+    start_time = models.DateTimeField()
+    # seconds
+    duration = models.FloatField()
+
+    created = models.DateTimeField(auto_now_add=True, blank=True)
+
+    class Meta:
+        app_label = 'container_pipeline'
+        db_table = 'phase_timings'
+
+    def __str__(self):
+        return '{}:{}'.format(self.build_phase, self.name)
+
+
 class ContainerImage(models.Model):
     """
     This model is used to hold information about every container image
@@ -1,70 +1,59 @@
+import datetime
 import logging
+import os
 import sys
+import urlparse
 import uuid
 
 from container_pipeline.lib import dj  # noqa
 from container_pipeline.lib import settings
+from container_pipeline.lib.job import Job
 from container_pipeline.lib.log import load_logger
 from container_pipeline.models import Build, Project
-from container_pipeline.utils import get_job_hash, get_project_name, \
-    form_targetfile_link
+from container_pipeline.utils import get_cause_of_build, get_job_hash, \
+    get_project_name, form_targetfile_link, is_rebuild
+from django.db import transaction
 from django.utils import timezone
 from trigger_dockerfile_lint import trigger_dockerfile_linter
 
 
 def create_new_job():
     """
-    Creates new job (a dictionary) with default value as `None` for all the
-    keys. This is the central place for creation of a job for container
-    pipeline service
+    Creates new job with all its fields unset. This is the central place for
+    creation of a job for container pipeline service, see
+    container_pipeline.lib.job for the fields of a job.
     """
-    job = dict.fromkeys([
-        "uuid",          # unique identifier for the job
-        "action",        # action to be performed (lint, build, scan, etc.)
-                         # remove
-        "appid",         # equivalent to namespacein Docker hub lingo
-        # TODO: this one needs to go away
-        "beanstalk_server",  # beanstalk server to connect to
-        "build_status",  # status of build process
-        "cause_of_build",   # cause of build trigger
-        "delivery_status",   # status of delivery process
-        "depends_on",    # parent image. Rebuild of parent will cause child to
-        "desired_tag",   # tag to be applied to the image
-        "dockerfile",    # contents of the Dockerfile for linter purpose
-        "image_name",    # <appid>/<jobid>:<desired_tag>
-        "image_under_test",  # image being tested
-        "jenkins_build_number"  # build number for the job in Jenkins
-        "job_name",      # same as project_name. need to remove
-        "jobid",         # equivalent to image name in Docker hub lingo
-        "last_run_timestamp",
-        "lint_status",   # status of lint process
-        "logs_URL",      # https URL for the logs hosted on nginx
-        "logs_dir",      # directory where all workers' logs files will be
-                         # stored
-        "logs_file_path",   # path to the logs of all scanners
-        "namespace",     # again same as project_name & job_name. need to
-        "notify_email",  # email to send notifications to
-        "output_image",  # full path to the built image
-        "project_hash_key",  # hash value of `project_name` key
-        "project_name",  # centos/centos:latest will be centos-centos-latest
-                         # rebuild as well
-        "repo_branch",   # branch of the repository to checkout
-        "repo_build_path",  # path on the repo where Dockerfile can be found
-        "repo_url",      # url of the remote git repository to build
-        "retry",
-        "retry_delay",
-        "scan_status",   # status of scan process
-        "target_file",   # Name of the Dockerfile to use to build container
-                         # image
-        "test_tag",      # temporary tag to be applied to image
-        "msg",           # to capture message in case of exception in
-                         # triggering linter
-        "delivery_log_file",     # log file for delivery worker,
-        "build_context",  # The build context of the build
-        "lint_retry"    # to check number of retries in dockerfile lint
-    ])
-
-    return job
+    return Job()
+
+
+def coalesce_build(project, jenkins_build_number):
+    """
+    Merge a trigger of project into a build of it whose lint has not
+    started yet, if any, and return that build. It clones the repository
+    after the trigger came, so it covers the trigger, and a separate lint,
+    build, test, scan and delivery cycle would be redundant.
+    """
+    if not settings.BUILD_COALESCE_WINDOW:
+        return None
+    since = timezone.now() - datetime.timedelta(
+        seconds=settings.BUILD_COALESCE_WINDOW)
+    with transaction.atomic():
+        build = Build.objects.select_for_update().filter(
+            project=project, status__in=('queued', 'processing'),
+            weekly_scan=False, created__gte=since,
+            buildphase__phase='dockerlint', buildphase__status='queued',
+        ).order_by('-created').first()
+        if build is None:
+            return None
+        # the linter starts the build under the lock of the build, so
+        # whether it did is only known for sure now that we hold it
+        if set(build.buildphase_set.values_list('phase', 'status')) != \
+                {('dockerlint', 'queued')}:
+            return None
+        build.coalesced_triggers = '\n'.join(filter(None, [
+            build.coalesced_triggers, str(jenkins_build_number)]))
+        build.save()
+    return build
 
 
 def main(args):
@@ -109,7 +98,6 @@ def main(args):
         job['appid'], job['jobid'], job['desired_tag'])
     job['output_image'] = \
         "registry.centos.org/{}/{}:{}".format(appid, jobid, desired_tag)
-    job['beanstalk_server'] = settings.BEANSTALKD_HOST
     job['image_under_test'] = "{}/{}/{}:{}".format(
         settings.REGISTRY_ENDPOINT[0], appid, jobid, test_tag)
     job['build_context'] = build_context
@@ -118,14 +106,33 @@ def main(args):
     project, created = Project.objects.get_or_create(
         name=project_name
     )
-    project.target_file_link = form_targetfile_link(
+    target_file_link = form_targetfile_link(
         repo_url,
         repo_build_path,
         repo_branch,
         target_file
     )
+    # a queued build of the project only covers this trigger if it builds
+    # the same Dockerfile
+    if project.target_file_link == target_file_link:
+        build = coalesce_build(project, jenkins_build_number)
+        if build is not None:
+            logging.getLogger('jenkins').info(
+                'Merged trigger of {} into queued build {}'.format(
+                    project_name, build.uuid))
+            return
+    project.target_file_link = target_file_link
     project.save()
 
+    # the priority class is decided here, so that rebuilds wait behind the
+    # builds of users from the first tube on, see lib.queue
+    job["cause_of_build"] = get_cause_of_build(
+        os.environ.get('JENKINS_MASTER') or urlparse.urlsplit(
+            os.environ.get('JENKINS_URL', '')).hostname,
+        job["job_name"], jenkins_build_number)
+    job["priority"] = "rebuild" if is_rebuild(job["cause_of_build"]) \
+        else "interactive"
+
     Build.objects.create(uuid=job['uuid'], project=project,
                          status='queued',
                          start_time=timezone.now())
@@ -44,6 +44,7 @@ class BuildSerializer(serializers.HyperlinkedModelSerializer):
             'start_time',
             'end_time',
             'trigger',
+            'coalesced_triggers',
             'created',
             'last_updated',
             'service_debug_logs'
@@ -10,7 +10,7 @@ import json
 import logging
 import os
 
-from container_pipeline.lib import settings
+from container_pipeline.lib import metrics, profiling, settings
 from container_pipeline.lib.log import load_logger
 from container_pipeline.scanners.container_capabilities import \
     ContainerCapabilities
@@ -88,7 +88,8 @@ class ScannerRunner(Scanner):
         """
         try:
             fin = open(status_file_path, "w")
-            json.dump(status, fin, indent=4, sort_keys=True)
+            # status is the job, make it a plain dictionary for json
+            json.dump(dict(status), fin, indent=4, sort_keys=True)
         except IOError as e:
             self.logger.critical(
                 "Failed to write scanners status on NFS share.")
@@ -119,7 +120,9 @@ class ScannerRunner(Scanner):
         Run the given scanner on image.
         """
         # should receive the JSON data loaded
-        data = scanner_obj.run(image)
+        with metrics.timer('pipeline_scanner_duration_seconds',
+                           scanner=scanner_obj.scanner):
+            data = scanner_obj.run(image)
 
         self.logger.info("Finished running {} scanner.".format(
             scanner_obj.scanner))
@@ -133,6 +136,13 @@ class ScannerRunner(Scanner):
         # FIXME: at the moment this menthod is returning the results of
         multiple scanners in one json and sends over the bus
         """
+        with profiling.profile('scanners', self.job, self.logger):
+            return self.run_scanners()
+
+    def run_scanners(self):
+        """
+        Run the scanners on image under test, see scan().
+        """
         self.logger.info("Received scanning job : {}".format(self.job))
 
         image = self.job.get("image_under_test")
@@ -1,18 +1,13 @@
 #!/usr/bin/python
 
-import json
 import os
 from django.utils import timezone
-from container_pipeline.lib import settings
-from container_pipeline.lib.queue import JobQueue
+from container_pipeline.lib.queue import get_queue
 from container_pipeline.models import Build, BuildPhase
 
 
 def trigger_dockerfile_linter(job):
-    queue = JobQueue(
-        host=settings.BEANSTALKD_HOST,
-        port=settings.BEANSTALKD_PORT,
-        sub="master_tube")
+    queue = get_queue()
 
     try:
         dockerfile_location = os.path.join(
@@ -43,8 +38,8 @@ def trigger_dockerfile_linter(job):
         job["build_status"] = False
         job["msg"] = "Couldn't find the Dockerfile at specified git_path"
 
-        queue.put(json.dumps(job), tube="master_tube")
-        print "==>Put job on 'master_tube' tube"
+        queue.put_job(job)
+        print "==>Put job on '%s' tube" % queue.route(job["action"])
         return False
     except BaseException as e:
         print e
@@ -68,8 +63,8 @@ def trigger_dockerfile_linter(job):
         job["build_status"] = False
         job["msg"] = "Unexpected error while trigger Dockerfile linter"
 
-        queue.put(json.dumps(job), tube="master_tube")
-        print "==>Put job on 'master_tube' tube"
+        queue.put_job(job)
+        print "==>Put job on '%s' tube" % queue.route(job["action"])
         return False
     else:
         build = Build.objects.get(uuid=job["uuid"])
@@ -77,5 +72,5 @@ def trigger_dockerfile_linter(job):
         build.save()
         BuildPhase.objects.create(
             build=build, phase='dockerlint', status='queued')
-        queue.put(json.dumps(job), tube="master_tube")
+        queue.put_job(job)
         return True
@@ -1,13 +1,17 @@
+import datetime
 import hashlib
 import json
 import logging
 import os
 import subprocess
+import time
 import urllib2
 from shutil import rmtree
 
 import yaml
 
+from container_pipeline.lib import settings
+
 FNULL = open(os.devnull, "w")
 
 
@@ -199,46 +203,249 @@ def get_cause_of_build(jenkins_url, job_name, job_number):
         return parse_json_response(json.loads(response.read()))
 
 
+def is_rebuild(cause):
+    """
+    Check whether a cause of build, see parse_json_response(), rebuilds an
+    image for a change which is not in its repository
+    """
+    return cause == 'RPM update in enabled repos' or \
+        cause.startswith('Change in upstream project')
+
+
+class FileLeases(object):
+    """
+    Build leases kept as files in a directory shared by the workers. A
+    lease is held while its file is younger than its ttl.
+    """
+
+    def __init__(self, datadir):
+        self.datadir = datadir
+
+    def _path(self, name):
+        return os.path.join(self.datadir, name)
+
+    def acquire(self, name, ttl):
+        with open(self._path(name), 'a'):
+            os.utime(self._path(name), None)
+
+    def renew(self, name, ttl):
+        if not self.is_held(name, ttl):
+            return False
+        os.utime(self._path(name), None)
+        return True
+
+    def is_held(self, name, ttl):
+        try:
+            return time.time() - os.path.getmtime(self._path(name)) < ttl
+        except OSError:
+            return False
+
+    def held(self, names, ttl):
+        return set(name for name in names if self.is_held(name, ttl))
+
+    def set_job(self, name, jid):
+        # only for a build running, the lease is not taken
+        if not os.path.exists(self._path(name)):
+            return False
+        with open(self._path(name), 'w') as f:
+            f.write('{}\n'.format(jid))
+        return True
+
+    def jobs(self, names):
+        jids = {}
+        for name in names:
+            try:
+                with open(self._path(name)) as f:
+                    jid = f.read().strip()
+            except IOError:
+                continue
+            if jid.isdigit():
+                jids[name] = int(jid)
+        return jids
+
+    def release(self, name):
+        try:
+            os.remove(self._path(name))
+        except OSError:
+            pass
+        # waiters are read after the lease is released, a waiter added
+        # meanwhile sees it released
+        try:
+            with open(self._path(name) + '.waiters') as f:
+                jids = [int(line) for line in f if line.strip()]
+            os.remove(self._path(name) + '.waiters')
+        except (IOError, OSError):
+            return []
+        return jids
+
+    def add_waiter(self, name, jid):
+        with open(self._path(name) + '.waiters', 'a') as f:
+            f.write('{}\n'.format(jid))
+
+
+class DatabaseLeases(object):
+    """
+    Build leases kept as rows of the BuildLock model, so that the workers
+    do not depend on lock files over NFS, and many leases can be checked
+    in a single query.
+    """
+
+    def __init__(self):
+        # for callers which did not set Django up, e.g. the garbage collector
+        from container_pipeline.lib import dj  # noqa
+
+    def acquire(self, name, ttl):
+        from container_pipeline.models import BuildLock
+        BuildLock.objects.update_or_create(
+            name=name, defaults={'expires': self._expires(ttl)})
+
+    def renew(self, name, ttl):
+        from container_pipeline.models import BuildLock
+        return bool(BuildLock.objects.filter(
+            name=name, expires__gt=self._now()).update(
+            expires=self._expires(ttl)))
+
+    def is_held(self, name, ttl):
+        return bool(self.held([name], ttl))
+
+    def held(self, names, ttl):
+        from container_pipeline.models import BuildLock
+        return set(BuildLock.objects.filter(
+            name__in=list(names), expires__gt=self._now()).values_list(
+            'name', flat=True))
+
+    def set_job(self, name, jid):
+        from container_pipeline.models import BuildLock
+        return bool(BuildLock.objects.filter(name=name).update(
+            jid=jid, expires=self._expires(settings.BUILD_LOCK_TTL)))
+
+    def jobs(self, names):
+        from container_pipeline.models import BuildLock
+        return dict(BuildLock.objects.filter(
+            name__in=list(names), jid__isnull=False).values_list(
+            'name', 'jid'))
+
+    def release(self, name):
+        from container_pipeline.models import BuildLock
+        from django.db import transaction
+        with transaction.atomic():
+            lock = BuildLock.objects.select_for_update().filter(
+                name=name).first()
+            if lock is None:
+                return []
+            lock.delete()
+        return [int(jid) for jid in lock.waiters.split()]
+
+    def add_waiter(self, name, jid):
+        from container_pipeline.models import BuildLock
+        from django.db import transaction
+        with transaction.atomic():
+            lock = BuildLock.objects.select_for_update().filter(
+                name=name).first()
+            # else the build completed already, which the caller finds out
+            if lock is not None:
+                lock.waiters += '{}\n'.format(jid)
+                lock.save()
+
+    def _now(self):
+        from django.utils import timezone
+        return timezone.now()
+
+    def _expires(self, ttl):
+        return self._now() + datetime.timedelta(seconds=ttl)
+
+
+def get_build_leases(datadir='/srv/pipeline-logs'):
+    """Get the build lease backend configured by BUILD_TRACKER_BACKEND"""
+    if settings.BUILD_TRACKER_BACKEND == 'db':
+        return DatabaseLeases()
+    return FileLeases(datadir)
+
+
 # In future, we can collate a lot of duplicate code from workers
 # to manage and track build, thereby providing a clean interface
 # to manage builds and prevent duplication of code.
 class BuildTracker:
-    """Track image build status in the pipeline"""
+    """
+    Track image build status in the pipeline. A build is marked running
+    with a lease, which expires BUILD_LOCK_TTL seconds after it was last
+    started or renewed, so that a build which crashed does not block the
+    builds of its children forever. Between phases, the lease is held for
+    as long as the job carrying the build to its next phase is in the
+    queue, however long it waits there, see queued().
+    """
 
-    def __init__(self, name, datadir='/srv/pipeline-logs', logger=None):
+    def __init__(self, name, datadir='/srv/pipeline-logs', logger=None,
+                 leases=None, queue=None):
         self.name = name
-        self._path = os.path.join(datadir, name)
+        self.leases = leases or get_build_leases(datadir)
         self.logger = logger or logging.getLogger('console')
+        self.queue = queue
+
+    @staticmethod
+    def running_set(names, datadir='/srv/pipeline-logs', leases=None,
+                    queue=None):
+        """Get the names of the builds running among names"""
+        # looked through twice, a generator would be empty the second time
+        names = list(names)
+        leases = leases or get_build_leases(datadir)
+        running = leases.held(names, settings.BUILD_LOCK_TTL)
+        expired = leases.jobs(set(names) - running)
+        if expired:
+            if queue is None:
+                from container_pipeline.lib.queue import get_queue
+                queue = get_queue()
+            for name, jid in expired.items():
+                # a buried job is not going anywhere, nor is its build
+                stats = queue.stats_job(jid)
+                if stats and stats.get('state') != 'buried':
+                    # renewed, so that the job is looked up once per ttl
+                    leases.set_job(name, jid)
+                    running.add(name)
+        return running
 
     def is_running(self):
         """Check if pipeline build is running"""
-        # We touch a file at self._path when start() is called. This file
-        # gets deleted when complete() is called to mark the pipeline
-        # build as complete. So, as long as the file self._path exists
-        # we identify the build to be running, else, we consider it as
-        # not running.
-        if os.path.exists(self._path):
-            return True
-        else:
-            return False
+        return self.name in self.running_set(
+            [self.name], leases=self.leases, queue=self.queue)
 
     def start(self):
-        """Mark build as running"""
-        # This touches a file at self._path to say that the current build is
-        # running
-        with open(self._path, 'a'):
-            os.utime(self._path, None)
-        self.logger.info('Created lock file for {} at {}'.format(
-            self.name, self._path))
+        """Mark build as running, or renew it if it is already"""
+        self.leases.acquire(self.name, settings.BUILD_LOCK_TTL)
+        self.logger.info('Took build lease of {}'.format(self.name))
+
+    def renew(self):
+        """
+        Renew the lease of the build, if it is running. Return whether it
+        was renewed.
+        """
+        return self.leases.renew(self.name, settings.BUILD_LOCK_TTL)
+
+    def queued(self, jid):
+        """
+        Record the queue job carrying the build to its next phase, and renew
+        the lease, if the build is running. The build is then running for as
+        long as the job is in the queue and not buried, see running_set().
+        Return whether it was recorded.
+        """
+        return self.leases.set_job(self.name, jid)
 
     def complete(self):
-        """Mark build as complete"""
-        # This removes the file at self._path and marks the pipeline build
-        # as not running
-        if self.is_running():
-            os.remove(self._path)
-            self.logger.info('Removing lock file for {} at {}'.format(
-                self.name, self._path))
+        """
+        Mark build as complete, and return the ids of the jobs which waited
+        for it, see add_waiter()
+        """
+        jids = self.leases.release(self.name)
+        self.logger.info('Released build lease of {}'.format(self.name))
+        return jids
+
+    def add_waiter(self, jid):
+        """
+        Record a job parked until the build completes. The caller must check
+        is_running() again afterwards, and release the job itself if the
+        build completed meanwhile.
+        """
+        self.leases.add_waiter(self.name, jid)
 
 
 def form_targetfile_link(git_URL, git_path, git_branch, target_file):
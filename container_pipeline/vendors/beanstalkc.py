@@ -145,6 +145,32 @@ class Connection(object):
                                    ['JOB_TOO_BIG', 'BURIED', 'DRAINING'])
         return int(jid)
 
+    def put_many(self, bodies, priority=DEFAULT_PRIORITY, delay=0,
+                 ttr=DEFAULT_TTR):
+        """Put jobs into the current tube, sending all the put commands
+        before reading their replies. Returns the job ids, None for the jobs
+        which were refused. All the replies are read, so that the connection
+        can be used again whatever they are."""
+        for body in bodies:
+            assert isinstance(body, str), 'Job body must be a str instance'
+        SocketError.wrap(self._socket.sendall, ''.join(
+            'put %d %d %d %d\r\n%s\r\n' % (
+                priority, delay, ttr, len(body), body) for body in bodies))
+        jids = []
+        unexpected = None
+        for _ in bodies:
+            status, results = self._read_response()
+            if status == 'INSERTED':
+                jids.append(int(results[0]))
+            else:
+                if status not in ('JOB_TOO_BIG', 'BURIED', 'DRAINING'):
+                    unexpected = unexpected or UnexpectedResponse(
+                        'put', status, results)
+                jids.append(None)
+        if unexpected:
+            raise unexpected
+        return jids
+
     def reserve(self, timeout=None):
         """Reserve a job from one of the watched tubes, with optional timeout
         in seconds. Returns a Job object, or None if the request times out."""
@@ -1,13 +1,22 @@
+import argparse
+import contextlib
+import datetime
 import json
 import logging
 import os
+import signal
+import threading
 import time
 
 from container_pipeline.lib import dj  # noqa
-from container_pipeline.lib import settings
-from container_pipeline.lib.queue import JobQueue
+from container_pipeline.lib import metrics, profiling, settings
+from container_pipeline.lib.job import decode
+from container_pipeline.lib.queue import JobHeartbeat, JobQueue
 from container_pipeline.lib.log import DynamicFileHandler
-from container_pipeline.models import Build, BuildPhase
+from container_pipeline.models import Build, BuildPhase, PhaseTiming
+from container_pipeline.utils import BuildTracker
+from django.db import DatabaseError, connection
+from django.utils import timezone
 
 
 class BaseWorker(object):
@@ -19,7 +28,13 @@ class BaseWorker(object):
         self.build = None
         self.build_phase_name = None
         self.build_phase = None
+        # timings of the steps of the job being handled, see span()
+        self.spans = []
         self.logger = logger or logging.getLogger('console')
+        self.sub = sub
+        self.pub = pub
+        # set once the worker is asked to stop, see drain()
+        self.stopping = threading.Event()
         self.queue = JobQueue(host=settings.BEANSTALKD_HOST,
                               port=settings.BEANSTALKD_PORT,
                               sub=sub, pub=pub, logger=self.logger)
@@ -80,7 +95,7 @@ class BaseWorker(object):
         This method queues user notifications to be processed by the
         mail service worker. Customize as needed.
         """
-        self.queue.put(json.dumps(data), 'master_tube')
+        self.queue.put_job(data)
 
     def export_logs(self, logs, destination):
         """"Write logs in given destination"""
@@ -96,24 +111,62 @@ class BaseWorker(object):
             self.logger.error("Failed writing logs to {}: {}"
                               .format(destination, e))
 
-    def run(self):
-        """Run worker"""
+    def handle_signals(self):
+        """Drain the worker on SIGTERM, see drain()"""
+        signal.signal(signal.SIGTERM, self.drain)
+        # let system calls in progress, e.g. a reserve, go on instead of
+        # failing with EINTR
+        signal.siginterrupt(signal.SIGTERM, False)
+
+    def drain(self, signum=None, frame=None):
+        """
+        Stop the worker once the jobs being handled are done. Jobs reserved
+        but not started yet are released to the tube right away, so that
+        other workers pick them up.
+        """
+        self.logger.info('{} draining, stopping once the jobs being handled '
+                         'are done'.format(self.NAME))
+        self.stopping.set()
+
+    def run(self, concurrency=1):
+        """
+        Run worker until it is drained. With a concurrency above 1, the jobs
+        are handled by as many worker threads instead, see
+        run_concurrently().
+        """
+        self.handle_signals()
+        if concurrency > 1:
+            return self.run_concurrently(concurrency)
+        self.work()
+
+    def work(self):
+        """Handle jobs from the queue, one at a time, until drained"""
         self.logger.info('{} running...'.format(self.NAME))
 
-        while True:
+        while not self.stopping.is_set():
             job_obj = None
             try:
-                job_obj = self.queue.get()
-                job = json.loads(job_obj.body)
-
-                # Skip retrying a job if it's too early and push it back to
-                # queue. This will allow us to introduce some delays between
-                # job retries
-                if job.get('retry') is True and (
-                        time.time() - job.get('last_run_timestamp', 0) <
-                        job.get('retry_delay', 0)):
-                    time.sleep(10)
-                    self.queue.put(json.dumps(job), 'master_tube')
+                # wake up now and then to see if we are drained
+                job_obj = self.queue.get(
+                    timeout=settings.WORKER_DRAIN_CHECK_INTERVAL)
+                if job_obj is None:
+                    continue
+                if self.stopping.is_set():
+                    self.queue.release(job_obj)
+                    job_obj = None
+                    break
+                job = decode(job_obj.body)
+
+                # Skip retrying a job if it's too early and release it back
+                # to the tube, delayed for the rest of its retry delay.
+                # beanstalkd makes it ready again once the delay has passed.
+                retry_after = (job.get('retry_delay') or 0) - (
+                    time.time() - (job.get('last_run_timestamp') or 0))
+                if job.get('retry') is True and retry_after > 0:
+                    self.queue.release(job_obj, delay=retry_after)
+                    job_obj = None
+                elif self.skip_checkpointed(job, job_obj):
+                    pass
                 else:
                     debug_logs_file = os.path.join(
                         job['logs_dir'], settings.SERVICE_LOGFILE)
@@ -121,18 +174,274 @@ class BaseWorker(object):
                     # encountered in post delivering build report mails to user
                     dfh = DynamicFileHandler(self.logger, debug_logs_file)
                     self.logger.info('Got job: {}'.format(job))
+                    # keep the job reserved, and the build lease of its
+                    # image held, while it is being handled
+                    heartbeat = JobHeartbeat(
+                        self.queue, job_obj,
+                        on_beat=lambda: self.renew_build_lease(job))
+                    heartbeat.start()
+                    failed = False
+                    # left from the previous job otherwise
+                    self.build_phase = None
+                    self.spans = []
+                    self.time_queue_wait(job, job_obj)
+                    start = time.time()
                     try:
-                        self.handle_job(job)
+                        with self.span('handle_job'), profiling.profile(
+                                self.build_phase_name or self.sub, job,
+                                self.logger):
+                            self.handle_job(job)
                     except Exception as e:
                         self.logger.error(
                             'Error in handling job: {}\nJob details: {}'
                             .format(e, job), extra={'locals': locals()},
                             exc_info=True)
+                        failed = True
+                    finally:
+                        heartbeat.stop()
+                        self.save_spans()
+                        metrics.observe('pipeline_job_duration_seconds',
+                                        time.time() - start, worker=self.NAME)
+                        metrics.inc('pipeline_jobs_total', worker=self.NAME,
+                                    outcome='failed' if failed else 'ok')
+                    if failed:
+                        self.retry_job(job_obj)
+                        job_obj = None
                     dfh.remove()
             except Exception as e:
                 self.logger.critical(
                     'Unexpected error when processing job: {}'.format(e),
                     exc_info=True)
+                # the job can't even be read, keep it around for a look
+                if job_obj:
+                    self.queue.bury(job_obj)
+                    job_obj = None
             finally:
                 if job_obj:
                     self.queue.delete(job_obj)
+        self.logger.info('{} stopped'.format(self.NAME))
+
+    @contextlib.contextmanager
+    def span(self, name):
+        """
+        Time a step of the job being handled, e.g.
+
+            with self.span('start_build'):
+                build_id = self.openshift.build(project, 'build')
+
+        Timings are logged, and saved as PhaseTiming rows of the BuildPhase
+        of the job once it is handled, see save_spans().
+        """
+        start_time = timezone.now()
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_span(name, start_time, time.time() - start)
+
+    def add_span(self, name, start_time, duration):
+        """Record the timing of a step of the job being handled"""
+        self.spans.append((name, start_time, duration))
+        self.logger.debug('Step {} took {:.3f}s'.format(name, duration))
+
+    def time_queue_wait(self, job, job_obj):
+        """
+        Record the time the job waited in the queue for a worker, not
+        counting the delay it was put with, since the time put_job()
+        stamped it with. beanstalkd's age of the job is only used for jobs
+        put before they were stamped: it does not restart when a job is
+        released, nor tell the delay of a job put again by the dispatcher.
+        """
+        if job.get('enqueued_at') is not None:
+            wait = max(0, time.time() - job['enqueued_at'])
+        else:
+            stats = self.queue.stats_job(job_obj)
+            if not stats:
+                return
+            wait = max(0, stats.get('age', 0) - stats.get('delay', 0))
+        self.add_span('queue_wait',
+                      timezone.now() - datetime.timedelta(seconds=wait), wait)
+
+    def save_spans(self):
+        """
+        Save the timings of the job handled to the BuildPhase of its build,
+        if it has one, and log them.
+        """
+        spans, self.spans = self.spans, []
+        if not spans:
+            return
+        self.logger.info('Timings of phase {}: {}'.format(
+            self.build_phase_name, ', '.join(
+                '{}={:.3f}s'.format(name, duration)
+                for name, _, duration in spans)))
+        if not self.build_phase:
+            return
+        try:
+            PhaseTiming.objects.bulk_create([
+                PhaseTiming(build_phase=self.build_phase, name=name,
+                            start_time=start_time, duration=duration)
+                for name, start_time, duration in spans])
+        except DatabaseError as e:
+            self.logger.error('Failed to save timings of phase {}: {}'.format(
+                self.build_phase_name, e))
+
+    def checkpoint(self, **artifacts):
+        """
+        Record the phase of this worker as completed for the job, with its
+        artifacts, in the job and in its BuildPhase. Call it before putting
+        the job on for the next phase, so that the job is not handled in
+        this phase again if it is retried or replayed, see
+        skip_checkpointed().
+        """
+        self.job.checkpoint(self.build_phase_name, **artifacts)
+        if self.build_phase:
+            self.build_phase.artifacts = json.dumps(artifacts)
+            self.build_phase.save()
+        self.logger.debug('Checkpointed phase {}: {}'.format(
+            self.build_phase_name, artifacts))
+
+    def skip_checkpointed(self, job, job_obj=None):
+        """
+        If the phase of this worker was completed for the job already, pass
+        the job on to the first phase not completed and return True. Phases
+        are looked up in the job, and in the BuildPhase rows of its build
+        for jobs which may have been handled in this phase before: retried
+        or replayed ones, and ones reserved before, which got back to the
+        tube after their worker crashed or was stopped.
+        """
+        if not self.build_phase_name or job.get('weekly') or \
+                not job.get('uuid'):
+            return False
+        checkpoints = dict(job.get('checkpoints') or {})
+        if self.build_phase_name not in checkpoints:
+            if not self.handled_before(job, job_obj):
+                return False
+            for phase, artifacts in BuildPhase.objects.filter(
+                    build__uuid=job['uuid'], status='complete').exclude(
+                    artifacts=None).values_list('phase', 'artifacts'):
+                checkpoints.setdefault(phase, json.loads(artifacts))
+            if self.build_phase_name not in checkpoints:
+                return False
+            job['checkpoints'] = checkpoints
+        action = job.resume_action()
+        self.logger.info('Phase {} of job {} completed already, resuming '
+                         'at {}'.format(self.build_phase_name,
+                                        job.get('uuid'), action))
+        if action:
+            job['action'] = action
+            self.hand_off(job)
+        return True
+
+    def handled_before(self, job, job_obj=None):
+        """
+        Whether the job may have been handled in this phase before: it was
+        retried or replayed, which set its attempts, or beanstalkd handed it
+        out before
+        """
+        if job.get('attempts') is not None:
+            return True
+        if job_obj is None:
+            return False
+        stats = self.queue.stats_job(job_obj)
+        return bool(stats) and stats.get('reserves', 0) > 1
+
+    def hand_off(self, job):
+        """
+        Put the job on for its next phase, and return its id. The lease of
+        the build of its image is then held for as long as the job waits in
+        the queue, see BuildTracker.queued().
+        """
+        jid = self.queue.put_job(job)
+        self.track_queued(job, jid)
+        return jid
+
+    def track_queued(self, job, jid):
+        """Record job jid as carrying the build of its image, if running"""
+        if job.get('namespace') and not job.get('weekly'):
+            BuildTracker(job['namespace'], logger=self.logger).queued(jid)
+
+    def complete_build(self):
+        """
+        Mark the build of the job's image as done, delivered or failed, and
+        release the builds of child images parked until it is, see
+        BuildTracker.
+        """
+        waiters = BuildTracker(
+            self.job['namespace'], logger=self.logger).complete()
+        self.logger.debug('Marked project build: {} as complete.'.format(
+            self.job['namespace']))
+        for jid in waiters:
+            if self.queue.kick_job(jid):
+                self.logger.info('Released job {} waiting for {}'.format(
+                    jid, self.job['namespace']))
+
+    def renew_build_lease(self, job):
+        """
+        Renew the lease of the build of the job's image, if it is running,
+        see BuildTracker. This is called from the heartbeat thread.
+        """
+        if not job.get('namespace'):
+            return
+        try:
+            BuildTracker(job['namespace'], logger=self.logger).renew()
+        finally:
+            # else the thread leaves its database connection open
+            connection.close()
+
+    def retry_job(self, job_obj):
+        """
+        Retry a job whose handling failed in the same phase, after a delay
+        growing with the number of attempts. Once the job has failed
+        JOB_MAX_ATTEMPTS times, it is buried in its tube instead, so that it
+        can be replayed from this phase with the replayjobs command. The job
+        is put again as it was reserved, not as handle_job() left it.
+        """
+        job = decode(job_obj.body)
+        attempts = (job.get('attempts') or 0) + 1
+        if attempts >= settings.JOB_MAX_ATTEMPTS:
+            self.logger.error('Job failed {} times, burying it: {}'.format(
+                attempts, job))
+            self.queue.bury(job_obj)
+            return
+        job['attempts'] = attempts
+        delay = settings.JOB_RETRY_DELAY * attempts
+        self.logger.warning('Retrying job in {}s, attempt {}/{}'.format(
+            delay, attempts + 1, settings.JOB_MAX_ATTEMPTS))
+        jid = self.queue.put_job(job, delay=delay, tube=self.queue.sub)
+        self.track_queued(job, jid)
+        self.queue.delete(job_obj)
+
+    def run_concurrently(self, concurrency):
+        """
+        Handle up to `concurrency` jobs at once. Workers keep per job state
+        on the instance, so every thread runs its own worker instance, with
+        its own queue connection and its own child logger. The latter keeps
+        the per build debug log files from getting other jobs' logs.
+        """
+        self.logger.info('{} running {} jobs concurrently...'.format(
+            self.NAME, concurrency))
+        threads = []
+        for index in range(concurrency):
+            worker = self.__class__(
+                logger=self.logger.getChild(str(index)),
+                sub=self.sub, pub=self.pub)
+            # drained along with this worker
+            worker.stopping = self.stopping
+            thread = threading.Thread(
+                target=worker.work, name='{}-{}'.format(self.NAME, index))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            # join with a timeout, else the main thread does not get signals
+            while thread.is_alive():
+                thread.join(60)
+
+
+def parse_args():
+    """Parse command line arguments common to all workers"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--concurrency', type=int, default=settings.WORKER_CONCURRENCY,
+        help='Number of jobs to handle at once (default: %(default)s)')
+    return parser.parse_args()
@@ -1,17 +1,18 @@
 #!/usr/bin/env python
-import json
 import logging
 import os
-import time
 
 from container_pipeline.lib import dj  # noqa
+from django.db import transaction
 from django.utils import timezone
 
 from container_pipeline.lib import settings
 from container_pipeline.lib.log import load_logger
-from container_pipeline.lib.openshift import Openshift, OpenshiftError
-from container_pipeline.utils import BuildTracker, get_cause_of_build
-from container_pipeline.workers.base import BaseWorker
+from container_pipeline.lib.openshift import OpenshiftError, \
+    get_openshift
+from container_pipeline.utils import BuildTracker, get_cause_of_build, \
+    is_rebuild
+from container_pipeline.workers.base import BaseWorker, parse_args
 from container_pipeline.models import Build, BuildPhase
 
 
@@ -22,66 +23,91 @@ class BuildWorker(BaseWorker):
     def __init__(self, logger=None, sub=None, pub=None):
         super(BuildWorker, self).__init__(logger, sub, pub)
         self.build_phase_name = "build"
-        self.openshift = Openshift(logger=self.logger)
+        self.openshift = get_openshift(logger=self.logger)
+        self.image_digest = None
 
     def handle_job(self, job):
         """
         This checks if parents for the current project are being built.
-        If any parent build is in progress, it pushes the job back to the
-        queue to be processed later. Else, it goes ahead with running
+        If any parent build is in progress, it parks the job until the
+        parents complete, see park_job(). Else, it goes ahead with running
         build for the job.
         """
         self.job = job
         self.setup_data()
-        self.set_buildphase_data(
-            build_phase_status='processing',
-            build_phase_start_time=timezone.now()
-        )
-        cause_of_build = get_cause_of_build(
-            os.environ.get('JENKINS_MASTER'),
-            self.job["job_name"],
-            self.job["jenkins_build_number"]
-        )
-        self.job["cause_of_build"] = cause_of_build
-        self.set_build_data(build_trigger=cause_of_build)
-
-        parent_build_running = False
-        parents = self.job.get('depends_on', '').split(',')
-        parents_in_build = []
 
         # Reset retry params
         self.job['retry'] = None
         self.job['retry_delay'] = None
         self.job['last_run_timestamp'] = None
 
-        for parent in parents:
-            is_build_running = BuildTracker(
-                parent, logger=self.logger).is_running()
-            if is_build_running:
-                parents_in_build.append(parent)
-            parent_build_running = parent_build_running or \
-                is_build_running
-
-        if parent_build_running:
-            self.logger.info('Parents in build: {}, pushing job: {} back '
-                             'to queue'.format(parents_in_build, self.job))
+        parents = [parent for parent in
+                   self.job.get('depends_on', '').split(',') if parent]
+        # all the parents are checked at once
+        running = BuildTracker.running_set(parents)
+        parents_in_build = [
+            parent for parent in parents if parent in running]
+        if parents_in_build:
+            self.park_job(parents_in_build)
+            return
+
+        # triggers merged into this build, read under its lock along with
+        # moving it on, so that none is merged after they were read
+        with transaction.atomic():
+            self.build.coalesced_triggers = Build.objects.select_for_update(
+            ).values_list('coalesced_triggers', flat=True).get(
+                id=self.build.id)
             self.set_buildphase_data(
-                build_phase_status='requeuedparent'
+                build_phase_status='processing',
+                build_phase_start_time=timezone.now()
             )
-            # Retry delay in seconds
-            self.job['retry'] = True
-            self.job['retry_delay'] = settings.BUILD_RETRY_DELAY
-            self.job['last_run_timestamp'] = time.time()
-            self.queue.put(json.dumps(self.job), 'master_tube')
+        jenkins_build_numbers = [self.job["jenkins_build_number"]] + (
+            self.build.coalesced_triggers or '').split()
+        causes = [
+            get_cause_of_build(
+                os.environ.get('JENKINS_MASTER'),
+                self.job["job_name"],
+                jenkins_build_number
+            ) for jenkins_build_number in jenkins_build_numbers]
+        cause_of_build = '; '.join(causes)
+        self.job["cause_of_build"] = cause_of_build
+        # a user's trigger merged into a rebuild makes it interactive
+        self.job["priority"] = "rebuild" if all(
+            is_rebuild(cause) for cause in causes) else "interactive"
+        self.set_build_data(build_trigger=cause_of_build)
+
+        self.logger.info('Starting build for job: {}'.format(self.job))
+        success = self.build_container()
+        if success:
+            self.job["build_status"] = True
+            self.handle_build_success()
         else:
-            self.logger.info('Starting build for job: {}'.format(self.job))
-            success = self.build_container()
-            if success:
-                self.job["build_status"] = True
-                self.handle_build_success()
-            else:
-                self.job["build_status"] = False
-                self.handle_build_failure()
+            self.job["build_status"] = False
+            self.handle_build_failure()
+
+    def park_job(self, parents):
+        """
+        Put the job back to the queue, held back until the delivery worker
+        releases it when one of the parents completes, or for
+        BUILD_PARENT_WAIT_TIMEOUT at most. It is then handled again, and
+        parked again if other parents are still in build.
+        """
+        self.logger.info('Parents in build: {}, parking job: {}'.format(
+            parents, self.job))
+        self.set_buildphase_data(
+            build_phase_status='requeuedparent'
+        )
+        jid = self.queue.put_job(
+            self.job, delay=settings.BUILD_PARENT_WAIT_TIMEOUT)
+        for parent in parents:
+            tracker = BuildTracker(parent, logger=self.logger)
+            tracker.add_waiter(jid)
+            # the parent may have completed before the waiter was added
+            if not tracker.is_running():
+                self.logger.info('Parent {} completed meanwhile, releasing '
+                                 'job {}'.format(parent, jid))
+                self.queue.kick_job(jid)
+                break
 
     def build_container(self):
         """Run Openshift build for job"""
@@ -90,8 +116,10 @@ class BuildWorker(BaseWorker):
         project_hash_key = self.job["project_hash_key"]
 
         try:
-            self.openshift.login()
-            build_id = self.openshift.build(project_hash_key, 'build')
+            with self.span('oc_login'):
+                self.openshift.login()
+            with self.span('start_build'):
+                build_id = self.openshift.build(project_hash_key, 'build')
             if not build_id:
                 return False
         except OpenshiftError as e:
@@ -99,12 +127,19 @@ class BuildWorker(BaseWorker):
             return False
 
         BuildTracker(namespace).start()
-        build_status = self.openshift.wait_for_build_status(
-            project_hash_key, build_id, 'Complete')
-        logs = self.openshift.get_build_logs(project_hash_key, build_id)
+        with self.span('wait_build'):
+            build_status = self.openshift.wait_for_build_status(
+                project_hash_key, build_id, 'Complete')
+        if build_status:
+            with self.span('get_image_digest'):
+                self.image_digest = self.openshift.get_build_image_digest(
+                    project_hash_key, build_id)
+        with self.span('fetch_logs'):
+            logs = self.openshift.get_build_logs(project_hash_key, build_id)
         build_logs_file = os.path.join(self.job['logs_dir'], 'build_logs.txt')
         self.set_buildphase_data(build_phase_log_file=build_logs_file)
-        self.export_logs(logs, build_logs_file)
+        with self.span('export_logs'):
+            self.export_logs(logs, build_logs_file)
         return build_status
 
     def handle_build_success(self):
@@ -114,7 +149,9 @@ class BuildWorker(BaseWorker):
             build_phase_status='complete',
             build_phase_end_time=timezone.now()
         )
-        self.queue.put(json.dumps(self.job), 'master_tube')
+        self.checkpoint(image=self.job['image_under_test'],
+                        image_digest=self.image_digest)
+        self.hand_off(self.job)
         self.init_next_phase_data('test')
         self.logger.debug("Build is successful going for next job")
 
@@ -125,7 +162,9 @@ class BuildWorker(BaseWorker):
             build_phase_status='failed',
             build_phase_end_time=timezone.now()
         )
-        self.queue.put(json.dumps(self.job), 'master_tube')
+        # children parked until the build completes need not wait for it
+        self.complete_build()
+        self.queue.put_job(self.job)
         self.logger.warning(
             "Build is not successful. Notifying the user.")
         # data = {
@@ -144,5 +183,7 @@ class BuildWorker(BaseWorker):
 if __name__ == '__main__':
     load_logger()
     logger = logging.getLogger('build-worker')
-    worker = BuildWorker(logger, sub='start_build', pub='failed_build')
-    worker.run()
+    sub = settings.BUILD_FAIR_SHARE_TUBE if settings.BUILD_FAIR_SHARE \
+        else 'start_build'
+    worker = BuildWorker(logger, sub=sub, pub='failed_build')
+    worker.run(concurrency=parse_args().concurrency)
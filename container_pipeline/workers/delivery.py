@@ -1,6 +1,5 @@
 #!/usr/bin/env python
 
-import json
 import logging
 import os
 import time
@@ -9,9 +8,9 @@ from container_pipeline.lib import dj  # noqa
 from django.utils import timezone
 
 from container_pipeline.lib.log import load_logger
-from container_pipeline.lib.openshift import Openshift, OpenshiftError
-from container_pipeline.utils import BuildTracker
-from container_pipeline.workers.base import BaseWorker
+from container_pipeline.lib.openshift import OpenshiftError, \
+    get_openshift
+from container_pipeline.workers.base import BaseWorker, parse_args
 from container_pipeline.models import Build, BuildPhase
 
 
@@ -25,7 +24,7 @@ class DeliveryWorker(BaseWorker):
     def __init__(self, logger=None, sub=None, pub=None):
         super(DeliveryWorker, self).__init__(logger, sub, pub)
         self.build_phase_name = 'delivery'
-        self.openshift = Openshift(logger=self.logger)
+        self.openshift = get_openshift(logger=self.logger)
 
     def handle_job(self, job):
         """Handles a job meant for delivery worker"""
@@ -55,9 +54,12 @@ class DeliveryWorker(BaseWorker):
         project_hash_key = self.job["project_hash_key"]
 
         try:
-            self.openshift.login()
+            with self.span('oc_login'):
+                self.openshift.login()
             # start the 'delivery' build
-            delivery_id = self.openshift.build(project_hash_key, 'delivery')
+            with self.span('start_build'):
+                delivery_id = self.openshift.build(
+                    project_hash_key, 'delivery')
         except OpenshiftError as e:
             self.logger.error(e)
             return False
@@ -65,14 +67,17 @@ class DeliveryWorker(BaseWorker):
             if not delivery_id:
                 return False
 
-        delivery_status = self.openshift.wait_for_build_status(
-            project_hash_key, delivery_id, 'Complete', status_index=2)
-        logs = self.openshift.get_build_logs(
-            project_hash_key, delivery_id, "delivery")
+        with self.span('wait_build'):
+            delivery_status = self.openshift.wait_for_build_status(
+                project_hash_key, delivery_id, 'Complete', status_index=2)
+        with self.span('fetch_logs'):
+            logs = self.openshift.get_build_logs(
+                project_hash_key, delivery_id, "delivery")
         delivery_logs_file = os.path.join(
             self.job['logs_dir'], 'delivery_logs.txt')
         self.set_buildphase_data(build_phase_log_file=delivery_logs_file)
-        self.export_logs(logs, delivery_logs_file)
+        with self.span('export_logs'):
+            self.export_logs(logs, delivery_logs_file)
         return delivery_status
 
     def handle_delivery_success(self):
@@ -81,10 +86,9 @@ class DeliveryWorker(BaseWorker):
         - Sends job details to RPM tracking piece and deletes the job from the
         tube
         """
-        # Mark project build as complete
-        BuildTracker(self.job['namespace'], logger=self.logger).complete()
-        self.logger.debug('Marked project build: {} as complete.'.format(
-            self.job['namespace']))
+        # Mark project build as complete, and release the builds of child
+        # images parked until it completes
+        self.complete_build()
         self.logger.debug('Putting job details to master_tube for tracker\'s'
                           ' consumption')
 
@@ -99,13 +103,16 @@ class DeliveryWorker(BaseWorker):
         # sending notification as delivery complete and also addingn this into
         # tracker.
         self.job['action'] = 'notify_user'
-        self.queue.put(json.dumps(self.job), 'master_tube')
+        self.queue.put_job(self.job)
 
         # Put some delay to avoid mismatch in uploading jod details to
         # master_tube
         time.sleep(10)
         self.job['action'] = 'tracking'
-        self.queue.put(json.dumps(self.job), 'master_tube')
+        self.queue.put_job(self.job)
+        # only once the user is notified, a job resumed after the last phase
+        # has nothing left to do
+        self.checkpoint(image=self.job['output_image'])
 
     def handle_delivery_failure(self):
         """
@@ -113,8 +120,10 @@ class DeliveryWorker(BaseWorker):
         and requests to notify the user about failure to deliver
         """
         self.job["build_status"] = False
+        # children parked until the build completes need not wait for it
+        self.complete_build()
         self.job['action'] = "notify_user"
-        self.queue.put(json.dumps(self.job), 'master_tube')
+        self.queue.put_job(self.job)
         self.logger.warning(
             "Delivery is not successful. Notifying the user.")
         # data = {
@@ -136,4 +145,4 @@ if __name__ == "__main__":
     logger = logging.getLogger('delivery-worker')
     worker = DeliveryWorker(logger, sub='start_delivery',
                             pub='delivery_failed')
-    worker.run()
+    worker.run(concurrency=parse_args().concurrency)
@@ -1,42 +1,61 @@
 #!/usr/bin/env python
-import json
 import logging
 
+from container_pipeline.lib import metrics, settings
+from container_pipeline.lib.job import decode
 from container_pipeline.lib.log import load_logger
+from container_pipeline.lib.queue import ACTIONS, get_priority
 from container_pipeline.workers.base import BaseWorker
 
 
 class DispatcherWorker(BaseWorker):
-    ACTIONS = ('start_build', 'start_test', 'start_scan', 'start_delivery',
-               'notify_user', 'report_scan_results', 'start_linter',
-               'tracking')
+    """
+    Moves jobs from master_tube to the tube for their action. Workers put
+    jobs straight to those tubes with BEANSTALKD_DIRECT_ROUTING, so this is
+    only needed for producers still using master_tube.
+    """
+    ACTIONS = ACTIONS
     NAME = 'Dispatcher worker'
 
-    def handle_job(self, job):
+    def handle_job(self, job, body):
         """
-        Handler job pushed to master tube
+        Handler job pushed to master tube. The job is moved as it is, body
+        is the encoded job as read from the queue.
         """
         action = job.get('action')
         if action not in self.ACTIONS:
             self.logger.debug('Unknown action: {}'.format(action))
             return
         # The name of tube and action are same
-        self.queue.put(json.dumps(job), action)
+        jid = self.queue.put(body, action, priority=get_priority(job))
+        self.track_queued(job, jid)
         self.logger.info('Moved job to tube: {}'.format(action))
 
     def run(self):
-        """Run worker"""
-        while True:
-            job_obj = self.queue.get()
-            job = json.loads(job_obj.body)
-            self.logger.info('Got job: {}'.format(job))
+        """Run worker until it is drained"""
+        self.handle_signals()
+        while not self.stopping.is_set():
+            job_obj = self.queue.get(
+                timeout=settings.WORKER_DRAIN_CHECK_INTERVAL)
+            if job_obj is None:
+                continue
             try:
-                self.handle_job(job)
+                job = decode(job_obj.body)
+                self.logger.info('Got job: {}'.format(job))
+                self.handle_job(job, job_obj.body)
             except Exception as e:
                 self.logger.error(
-                    'Error in handling job: {}\nJob details: {}'.format(
-                        e, job), extra={'locals': locals()}, exc_info=True)
-            self.queue.delete(job_obj)
+                    'Error in handling job: {}\nJob body: {}'.format(
+                        e, job_obj.body), extra={'locals': locals()},
+                    exc_info=True)
+                # keep the job in master_tube to be replayed later
+                self.queue.bury(job_obj)
+                metrics.inc('pipeline_jobs_total', worker=self.NAME,
+                            outcome='failed')
+            else:
+                self.queue.delete(job_obj)
+                metrics.inc('pipeline_jobs_total', worker=self.NAME,
+                            outcome='ok')
 
 
 if __name__ == '__main__':
@@ -4,16 +4,17 @@ import json
 import logging
 import os
 import sys
-import time
 
 import container_pipeline.utils as utils
 from container_pipeline.lib import dj  # noqa
 from container_pipeline.lib import settings
 from container_pipeline.lib.command import run_cmd_out_err
 from container_pipeline.lib.log import load_logger
-from container_pipeline.lib.openshift import Openshift, OpenshiftError
+from container_pipeline.lib.openshift import OpenshiftError, \
+    get_openshift
 from container_pipeline.models import Build, BuildPhase
 from container_pipeline.workers.base import BaseWorker
+from django.db import transaction
 from django.utils import timezone
 
 reload(sys)
@@ -34,24 +35,19 @@ def create_project(queue, job, logger):
     """
     job_name = job.get("job_name")
     project_name_hash = utils.get_job_hash(job_name)
-    openshift = Openshift(logger=logger)
+    openshift = get_openshift(logger=logger)
 
     try:
         openshift.login("test-admin", "test")
-        max_retry = 10
-        retry = 0
         # waiting for delivery get completed before next job for the same
         # project overrides the job parameters
-        while openshift.get_project(project_name_hash) and (retry < max_retry):
-            time.sleep(50)
-            retry += 1
-
-        if openshift.get_project(project_name_hash):
+        if not openshift.wait_for_project_deletion(
+                project_name_hash,
+                settings.OPENSHIFT_PROJECT_DELETION_TIMEOUT):
             logger.error("OpenShift is not able to delete project: {}"
                          .format(job_name))
             return False
-        else:
-            openshift.create(project_name_hash)
+        openshift.create(project_name_hash)
     except OpenshiftError:
         try:
             openshift.delete(project_name_hash)
@@ -109,10 +105,14 @@ class DockerfileLintWorker(BaseWorker):
         )
         self.job = job
         self.setup_data()
-        self.set_buildphase_data(
-            build_phase_status='processing',
-            build_phase_start_time=timezone.now()
-        )
+        # triggers are merged into a build until its lint starts, under the
+        # lock of the build, see pipeline.coalesce_build()
+        with transaction.atomic():
+            Build.objects.select_for_update().get(id=self.build.id)
+            self.set_buildphase_data(
+                build_phase_status='processing',
+                build_phase_start_time=timezone.now()
+            )
 
         self.logger.info("Received job for Dockerfile lint: %s" % job)
         self.logger.debug("Writing Dockerfile to /tmp/scan/Dockerfile")
@@ -151,7 +151,8 @@ class DockerfileLintWorker(BaseWorker):
                    "registry.centos.org/pipeline-images/dockerfile-lint")
 
         try:
-            out, err = run_cmd_out_err(command)
+            with self.span('lint'):
+                out, err = run_cmd_out_err(command)
             if err == "":
                 self.logger.info(
                     "Dockerfile linting successful going "
@@ -173,6 +174,8 @@ class DockerfileLintWorker(BaseWorker):
                     self.job["dockerfile"] = None
                     self.job["lint_retry"] = None
                     self.job["action"] = "start_build"
+                    self.checkpoint(
+                        openshift_project=self.job.get("project_hash_key"))
                     build = Build.objects.get(uuid=self.job['uuid'])
                     build_phase, created = BuildPhase.objects.get_or_create(
                         build=build, phase='build')
@@ -189,8 +192,11 @@ class DockerfileLintWorker(BaseWorker):
                 self.job["msg"] = ("Openshift project {} "
                                    "is not getting deleted").format(
                     self.job.get("project_name"))
+                # the build won't go on, new triggers must not be merged
+                # into it
+                self.set_buildphase_data(build_phase_status='error')
 
-            self.queue.put(json.dumps(self.job), 'master_tube')
+            self.queue.put_job(self.job)
         except Exception as e:
             self.logger.warning(
                 "Dockerfile Lint check command failed", extra={'locals':
@@ -199,7 +205,7 @@ class DockerfileLintWorker(BaseWorker):
 
             self.job["dockerfile"] = None
             self.job["action"] = "notify_user"
-            self.queue.put(json.dumps(self.job), 'master_tube')
+            self.queue.put_job(self.job)
             self.set_buildphase_data(
                 build_phase_status='error',
                 build_phase_end_time=timezone.now()
@@ -250,8 +256,9 @@ class DockerfileLintWorker(BaseWorker):
             build_phase_end_time=timezone.now()
         )
 
-        response["job_created"] = create_project(
-            self.queue, self.job, self.logger)
+        with self.span('create_project'):
+            response["job_created"] = create_project(
+                self.queue, self.job, self.logger)
         return response
 
     def handle_lint_failure(self, error):
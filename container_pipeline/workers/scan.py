@@ -14,7 +14,6 @@ import container_pipeline.lib.log as log
 from container_pipeline.workers.base import BaseWorker
 from container_pipeline.scanners.runner import ScannerRunner
 from django.utils import timezone
-import json
 import logging
 import os
 
@@ -46,7 +45,8 @@ class ScanWorker(BaseWorker):
         dfh = log.DynamicFileHandler(self.logger, debug_logs_file)
 
         scan_runner_obj = ScannerRunner(self.job)
-        status, scanners_data = scan_runner_obj.scan()
+        with self.span('scan'):
+            status, scanners_data = scan_runner_obj.scan()
         if not status:
             self.logger.warning(
                 "Failed to run scanners on image under test, moving on!")
@@ -74,7 +74,7 @@ class ScanWorker(BaseWorker):
             # send email of weekly scan only if scanners execution status=true
             if status:
                 scanners_data["action"] = "notify_user"
-                self.queue.put(json.dumps(scanners_data), 'master_tube')
+                self.queue.put_job(scanners_data)
                 self.init_next_phase_data('delivery')
                 self.logger.debug(
                     str.format(
@@ -87,13 +87,15 @@ class ScanWorker(BaseWorker):
             # all other details about job stays same
             # change the action
             scanners_data["action"] = "start_delivery"
+            self.checkpoint(scan_status=status)
             # Put the job details on central tube
-            self.queue.put(json.dumps(scanners_data), 'master_tube')
+            self.hand_off(scanners_data)
             self.init_next_phase_data('delivery')
             self.logger.debug("Put job for delivery on master tube")
 
         # run the image and volume cleanup
-        self.clean_up()
+        with self.span('clean_up'):
+            self.clean_up()
 
         # remove per file build log handler from logger
         if 'dfh' in locals():
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+import logging
+import time
+
+from container_pipeline.lib import metrics, settings
+from container_pipeline.lib.job import decode
+from container_pipeline.lib.log import load_logger
+from container_pipeline.lib.queue import get_priority
+from container_pipeline.lib.scheduler import FairShareScheduler
+from container_pipeline.workers.base import BaseWorker
+
+
+class BuildSchedulerWorker(BaseWorker):
+    """
+    Moves jobs from start_build to the tube build workers consume with
+    BUILD_FAIR_SHARE, in fair share order across namespaces, so that a wave
+    of rebuilds of one namespace does not hold up the builds of the others.
+    Jobs stay reserved in start_build until they are moved, and are put
+    back there by beanstalkd if the scheduler dies.
+    """
+    NAME = 'Build scheduler worker'
+
+    # seconds to wait for a job to come, while jobs wait to be moved
+    POLL_INTERVAL = 1
+
+    def __init__(self, logger=None, sub=None, pub=None):
+        super(BuildSchedulerWorker, self).__init__(logger, sub, pub)
+        self.scheduler = FairShareScheduler(
+            weights=settings.BUILD_FAIR_SHARE_WEIGHTS)
+        # ids of the jobs held in the scheduler
+        self.held = set()
+        self.last_touch = time.time()
+
+    def run(self):
+        """Run worker until it is drained"""
+        self.handle_signals()
+        while not self.stopping.is_set():
+            job_obj = self.queue.get(
+                timeout=self.POLL_INTERVAL if self.held
+                else settings.WORKER_DRAIN_CHECK_INTERVAL)
+            if job_obj:
+                self.hold(job_obj)
+            self.feed()
+            self.touch_held()
+        # hand the jobs waiting for their turn back to start_build
+        for job_obj, _ in self.scheduler.items():
+            self.queue.release(job_obj)
+        self.logger.info('{} stopped, released {} jobs'.format(
+            self.NAME, len(self.held)))
+
+    def hold(self, job_obj):
+        """Keep a reserved job in the scheduler, until its turn comes"""
+        if job_obj.jid in self.held:
+            # reserved again after its reservation was lost
+            return
+        try:
+            job = decode(job_obj.body)
+        except ValueError:
+            self.logger.error('Burying job {} with invalid body: {}'.format(
+                job_obj.jid, job_obj.body))
+            self.queue.bury(job_obj)
+            return
+        priority = get_priority(job)
+        self.scheduler.push(job.get('appid'), (job_obj, priority), priority)
+        self.held.add(job_obj.jid)
+        self.logger.debug('Holding job {} of namespace {}, {} held'.format(
+            job_obj.jid, job.get('appid'), len(self.held)))
+
+    def feed(self):
+        """Move jobs in turn until build workers have enough ready ones"""
+        if not self.held:
+            return
+        stats = self.queue.stats_tube(settings.BUILD_FAIR_SHARE_TUBE) or {}
+        ready = stats.get('current-jobs-ready', 0)
+        while self.held and ready < settings.BUILD_FAIR_SHARE_BACKLOG:
+            appid, (job_obj, priority) = self.scheduler.pop()
+            self.queue.put(job_obj.body, settings.BUILD_FAIR_SHARE_TUBE,
+                           priority=priority)
+            self.queue.delete(job_obj)
+            self.held.discard(job_obj.jid)
+            ready += 1
+            metrics.inc('pipeline_jobs_total', worker=self.NAME, outcome='ok')
+            self.logger.info('Moved job {} of namespace {}'.format(
+                job_obj.jid, appid))
+
+    def touch_held(self):
+        """Keep the reservations of held jobs"""
+        if time.time() - self.last_touch < settings.JOB_HEARTBEAT_INTERVAL:
+            return
+        for job_obj, _ in self.scheduler.items():
+            self.queue.touch(job_obj)
+        self.last_touch = time.time()
+
+
+if __name__ == '__main__':
+    load_logger()
+    logger = logging.getLogger('build-scheduler')
+    worker = BuildSchedulerWorker(logger, sub='start_build')
+    worker.run()
@@ -1,14 +1,14 @@
 #!/usr/bin/env python
-import json
 import logging
 import os
 from container_pipeline.lib import dj  # noqa
 from django.utils import timezone
 
 from container_pipeline.lib.log import load_logger
-from container_pipeline.lib.openshift import Openshift, OpenshiftError
+from container_pipeline.lib.openshift import OpenshiftError, \
+    get_openshift
 from container_pipeline.utils import BuildTracker
-from container_pipeline.workers.base import BaseWorker
+from container_pipeline.workers.base import BaseWorker, parse_args
 from container_pipeline.models import Build, BuildPhase
 
 
@@ -24,7 +24,7 @@ class TestWorker(BaseWorker):
     def __init__(self, logger=None, sub=None, pub=None):
         super(TestWorker, self).__init__(logger, sub, pub)
         self.build_phase_name = 'test'
-        self.openshift = Openshift(logger=self.logger)
+        self.openshift = get_openshift(logger=self.logger)
 
     def run_test(self):
         """Run Openshift test build for job, which runs the user
@@ -38,10 +38,12 @@ class TestWorker(BaseWorker):
         )
 
         try:
-            self.openshift.login()
+            with self.span('oc_login'):
+                self.openshift.login()
 
             # TODO: This needs to be addressed after addressing Issue #276
-            build_id = self.openshift.build(project, 'test')
+            with self.span('start_build'):
+                build_id = self.openshift.build(project, 'test')
             if not build_id:
                 return False
         except OpenshiftError as e:
@@ -49,12 +51,15 @@ class TestWorker(BaseWorker):
             return False
 
         BuildTracker(namespace).start()
-        test_status = self.openshift.wait_for_build_status(
-            project, build_id, 'Complete', status_index=2)
-        logs = self.openshift.get_build_logs(project, build_id, "test")
+        with self.span('wait_build'):
+            test_status = self.openshift.wait_for_build_status(
+                project, build_id, 'Complete', status_index=2)
+        with self.span('fetch_logs'):
+            logs = self.openshift.get_build_logs(project, build_id, "test")
         test_logs_file = os.path.join(self.job['logs_dir'], 'test_logs.txt')
         self.set_buildphase_data(build_phase_log_file=test_logs_file)
-        self.export_logs(logs, test_logs_file)
+        with self.span('export_logs'):
+            self.export_logs(logs, test_logs_file)
         return test_status
 
     def handle_test_success(self):
@@ -65,7 +70,8 @@ class TestWorker(BaseWorker):
         )
         self.init_next_phase_data('scan')
         self.job['action'] = "start_scan"
-        self.queue.put(json.dumps(self.job), 'master_tube')
+        self.checkpoint(test_status=True)
+        self.hand_off(self.job)
         self.logger.debug("Test is successful going for next job")
 
     def handle_test_failure(self):
@@ -75,8 +81,10 @@ class TestWorker(BaseWorker):
             build_phase_status='failed',
             build_phase_end_time=timezone.now()
         )
+        # children parked until the build completes need not wait for it
+        self.complete_build()
         self.job['action'] = "notify_user"
-        self.queue.put(json.dumps(self.job), 'master_tube')
+        self.queue.put_job(self.job)
         self.logger.warning(
             "Test is not successful. Notifying the user.")
         # data = {
@@ -107,4 +115,4 @@ if __name__ == '__main__':
     load_logger()
     logger = logging.getLogger('test-worker')
     worker = TestWorker(logger, sub='start_test', pub='test_failed')
-    worker.run()
+    worker.run(concurrency=parse_args().concurrency)
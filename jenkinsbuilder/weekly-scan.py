@@ -7,12 +7,12 @@ This module iniializes the weekly scan by finding out the list of images
 on the registry and initializing the scan tasks for the workers.
 """
 
-import beanstalkc
 import container_pipeline.lib.dj
+from container_pipeline.lib.job import encode
+from container_pipeline.lib.queue import PRIORITIES, get_queue
 from container_pipeline.models.pipeline import Project, Build, BuildPhase
 from django.utils import timezone
 import glob
-import json
 import os
 import subprocess
 import sys
@@ -23,9 +23,8 @@ import yaml
 # Logs base URL
 LOGS_DIR_BASE = "/srv/pipeline-logs/"
 
-# connect to beanstalkd tube
-bs = beanstalkc.Connection("BEANSTALK_SERVER")
-bs.use("master_tube")
+# connect to beanstalkd
+queue = get_queue(host="BEANSTALK_SERVER")
 
 # registry server value to be replaced by ansible
 registry = "JENKINS_SLAVE"
@@ -50,6 +49,9 @@ files = glob.glob("%s/*.y*ml" % index_dir)
 #        continue
 #    files.remove(f)
 
+# scan jobs, put on the queue all at once after parsing the index
+scan_jobs = []
+
 # parse the yml file
 for f in files:
     with open(os.path.join(os.environ.get("CWD"), "index.d", f)) as stream:
@@ -105,10 +107,11 @@ for f in files:
             "logs_dir": LOGS_DIR,
             "test_tag": test_tag,
             "job_name": job_id,
-            "uuid": job_uuid
+            "uuid": job_uuid,
+            "priority": "weekly"
         }
 
-        job = bs.put(json.dumps(data))
+        scan_jobs.append(encode(data))
 
         build = Build.objects.create(
             uuid=job_uuid,
@@ -128,3 +131,7 @@ for f in files:
 
         print "Image %s sent for weekly scan with data %s" % \
               (entry_short_name, data)
+
+queue.put_many(scan_jobs, queue.route("start_scan"),
+               priority=PRIORITIES["weekly"])
+print "Put %d jobs for weekly scan" % len(scan_jobs)
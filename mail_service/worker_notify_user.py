@@ -12,7 +12,10 @@ import time
 from urlparse import urljoin
 
 import beanstalkc
-from container_pipeline.lib.openshift import Openshift, OpenshiftError
+from container_pipeline.lib import metrics
+from container_pipeline.lib.job import decode
+from container_pipeline.lib.openshift import OpenshiftError, \
+    get_openshift
 
 config.load_logger()
 logger = logging.getLogger('mail-service')
@@ -123,7 +126,7 @@ class NotifyUser(object):
             BUILD_LOGS_FILENAME
         )
 
-        self.openshift = Openshift(logger=logger)
+        self.openshift = get_openshift(logger=logger)
 
     def _escape_text_(self, text):
         "Escapes \n,\t with \\n,\\tt for rendering in email body"
@@ -157,11 +160,12 @@ class NotifyUser(object):
         # process subject of email based on if it is production or not
         subject = self.update_subject_of_email(subject)
 
-        subprocess.call([
-            self.send_mail_command,
-            subject,
-            self.job_info["notify_email"],
-            self._escape_text_(contents)])
+        with metrics.timer('pipeline_mail_duration_seconds'):
+            subprocess.call([
+                self.send_mail_command,
+                subject,
+                self.job_info["notify_email"],
+                self._escape_text_(contents)])
 
     def _read_status(self, filepath):
         "Method to read status JSON files"
@@ -368,7 +372,7 @@ while True:
     logger.debug("Listening to notify_user tube")
     job = bs.reserve()
     job_id = job.jid
-    job_info = json.loads(job.body)
+    job_info = decode(job.body)
     dfh = config.DynamicFileHandler(
         logger,
         os.path.join(job_info['logs_dir'], config.SERVICE_LOGFILE))